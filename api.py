@@ -1,37 +1,87 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request, stream_with_context
 from flask_cors import CORS
-import requests
 from dotenv import load_dotenv
 import os
-import pandas as pd
 import time
 from flask_sqlalchemy import SQLAlchemy
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.support.ui import Select
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-import gspread
-from google.oauth2.service_account import Credentials
 from sqlalchemy import Column, Integer, String
 from sqlalchemy.orm import declarative_base
 import threading
+import uuid
+from werkzeug.utils import secure_filename
+from moz import MozClient, MozError, BatchStats, SharedTokenBucket, iter_batches, MOZ_URL_METRICS
+from coalesce import Coalescer
+from jobs import JobQueue, BATCH_DONE, BATCH_FAILED
+import itertools
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from cache import MetricsCache
+from storage import BulkWriter, table_version, table_versions_table
+from ingest import iter_targets
+from normalize import TargetFilter, normalize_target, target_index
+from http_scraper import HttpListingScraper
+from incremental import PIPELINE, SHEET, DomainTracker, seen_domains_table
+from pipeline import Pipeline
+import query
+import history
+import scoring
+import hashlib
+import sheets
+import export
+import telemetry
+import logging
 
 # Initialize the Flask app
 app = Flask(__name__)
 
-# Configure the MySQL database connection
-app.config['SQLALCHEMY_DATABASE_URI'] = 'mysql+mysqlconnector://root:@localhost/domain'
+# Load environment variables from .env file
+load_dotenv()
+
+# Levelled logging; LOG_FORMAT=json writes one JSON object per line
+app.config['LOG_LEVEL'] = os.getenv("LOG_LEVEL", "INFO")
+app.config['LOG_FORMAT'] = os.getenv("LOG_FORMAT", "text")
+telemetry.configure_logging(app.config['LOG_LEVEL'], app.config['LOG_FORMAT'])
+log = logging.getLogger('api')
+
+# With several worker processes (gunicorn.conf.py sets this), /metrics adds up the totals every
+# worker writes to METRICS_DIR instead of reporting only the worker that served the request
+app.config['METRICS_DIR'] = os.getenv("METRICS_DIR")
+if app.config['METRICS_DIR']:
+    telemetry.share(app.config['METRICS_DIR'], float(os.getenv("METRICS_SNAPSHOT_SECONDS", 5)))
+
+HTTP_REQUEST_SECONDS = telemetry.histogram('http_request_seconds', 'API request latency', ['endpoint', 'method', 'status'])
+SCRAPE_PAGE_SECONDS = telemetry.histogram('scrape_page_seconds', 'Time to load one auction listing page', ['backend'])
+
+# Configure the MySQL database connection (set DATABASE_URL, e.g. sqlite:///domain.db, to run locally)
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL", 'mysql+mysqlconnector://root:@localhost/domain')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Connection pool per worker process, sized so that all GUNICORN_WORKERS together open at most
+# DB_MAX_CONNECTIONS (MySQL allows 151 by default); pre_ping and recycle drop connections MySQL
+# has closed while idle
+if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    gunicorn_workers = max(int(os.getenv("GUNICORN_WORKERS", 2)), 1)
+    worker_connections = max(int(os.getenv("DB_MAX_CONNECTIONS", 100)) // gunicorn_workers, 2)
+    pool_size = int(os.getenv("DB_POOL_SIZE", worker_connections // 2))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': pool_size,
+        'max_overflow': int(os.getenv("DB_MAX_OVERFLOW", max(worker_connections - pool_size, 0))),
+        'pool_timeout': float(os.getenv("DB_POOL_TIMEOUT", 30)),
+        'pool_recycle': int(os.getenv("DB_POOL_RECYCLE", 1800)),
+        'pool_pre_ping': True,
+    }
 
 db = SQLAlchemy(app)
-# Load environment variables from .env file
-load_dotenv()
 
 class PageData(db.Model):
+    # Composite indexes back the filters and keyset-paginated sorts of GET /page_data
+    __table_args__ = (
+        db.Index('ix_page_data_root_domain_id', 'root_domain', 'id'),
+        db.Index('ix_page_data_domain_authority_id', 'domain_authority', 'id'),
+        db.Index('ix_page_data_page_authority_id', 'page_authority', 'id'),
+        db.Index('ix_page_data_spam_score_id', 'spam_score', 'id'),
+        db.Index('ix_page_data_domain_authority_spam_score', 'domain_authority', 'spam_score'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     page = db.Column(db.String(255), nullable=False)
     subdomain = db.Column(db.String(255), nullable=False)
@@ -46,15 +96,282 @@ class PageData(db.Model):
     page_authority = db.Column(db.Integer, nullable=True)
     domain_authority = db.Column(db.Integer, nullable=True)
     link_propensity = db.Column(db.Float, nullable=True)
+    target = db.Column(db.String(255), nullable=True, unique=True)  # Normalized target sent to Moz
+    fetched_at = db.Column(db.Integer, nullable=True, index=True)  # Unix time the row was fetched from Moz
 
     def __repr__(self):
         return f"<PageData {self.page}>"
 
+    def to_dict(self):
+        # Same shape as a record in the Moz url_metrics response
+        return {
+            "page": self.page,
+            "subdomain": self.subdomain,
+            "root_domain": self.root_domain,
+            "last_crawled": self.last_crawled,
+            "http_code": self.http_code,
+            "pages_to_page": self.pages_to_page,
+            "nofollow_pages_to_page": self.nofollow_pages_to_page,
+            "redirect_pages_to_page": self.redirect_pages_to_page,
+            "external_pages_to_page": self.external_pages_to_page,
+            "spam_score": self.spam_score,
+            "page_authority": self.page_authority,
+            "domain_authority": self.domain_authority,
+            "link_propensity": self.link_propensity,
+        }
+
+class DomainScore(db.Model):
+    # Precomputed ranking of root domains, refreshed whenever their PageData rows change
+    __tablename__ = 'domain_scores'
+    id = db.Column(db.Integer, primary_key=True)
+    root_domain = db.Column(db.String(255), nullable=False, unique=True)
+    score = db.Column(db.Float, nullable=False, index=True)
+    domain_authority = db.Column(db.Integer, nullable=True)
+    page_authority = db.Column(db.Integer, nullable=True)
+    spam_score = db.Column(db.Integer, nullable=True)
+    link_propensity = db.Column(db.Float, nullable=True)
+    external_pages_to_page = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.Integer, nullable=False)
+
+    def to_dict(self):
+        return {
+            "root_domain": self.root_domain,
+            "score": self.score,
+            "domain_authority": self.domain_authority,
+            "page_authority": self.page_authority,
+            "spam_score": self.spam_score,
+            "link_propensity": self.link_propensity,
+            "external_pages_to_page": self.external_pages_to_page,
+            "updated_at": self.updated_at,
+        }
+
 # Enable CORS for all routes
 CORS(app)
+
+@app.before_request
+def start_request_timer():
+    request.environ['api.started'] = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started = request.environ.get('api.started')
+    if started is not None:
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or 'unknown',
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
 # Load API Key from environment
 api_key = os.getenv("API_KEY")
 
+# Moz batch engine settings, tune these to the Moz plan's quota. MOZ_API_URL can point at a mock server.
+app.config['MOZ_API_URL'] = os.getenv("MOZ_API_URL", MOZ_URL_METRICS)
+app.config['MOZ_BATCH_SIZE'] = int(os.getenv("MOZ_BATCH_SIZE", 50))
+app.config['MOZ_CONCURRENCY'] = int(os.getenv("MOZ_CONCURRENCY", 4))
+app.config['MOZ_RATE_LIMIT'] = float(os.getenv("MOZ_RATE_LIMIT", 0.1))  # requests per second
+app.config['MOZ_BURST'] = int(os.getenv("MOZ_BURST", 1))
+app.config['MOZ_MAX_RETRIES'] = int(os.getenv("MOZ_MAX_RETRIES", 5))
+app.config['MOZ_TIMEOUT'] = float(os.getenv("MOZ_TIMEOUT", 30))  # seconds per Moz request
+# Longest /fetch_url_metrics waits for Moz (queueing, rate limit and retries included)
+app.config['FETCH_URL_METRICS_TIMEOUT'] = float(os.getenv("FETCH_URL_METRICS_TIMEOUT", 20))
+
+# The rate limit is kept in MOZ_LIMITER_DB (the job database by default), so every gunicorn
+# worker on the host shares one MOZ_RATE_LIMIT rather than each getting the full rate
+app.config['MOZ_LIMITER_DB'] = os.getenv("MOZ_LIMITER_DB", os.getenv("JOB_DB_PATH", "jobs.db"))
+
+# Shared Moz client with a pooled session and a token-bucket limiter
+moz_client = MozClient(
+    api_key,
+    url=app.config['MOZ_API_URL'],
+    batch_size=app.config['MOZ_BATCH_SIZE'],
+    concurrency=app.config['MOZ_CONCURRENCY'],
+    rate=app.config['MOZ_RATE_LIMIT'],
+    burst=app.config['MOZ_BURST'],
+    max_retries=app.config['MOZ_MAX_RETRIES'],
+    timeout=app.config['MOZ_TIMEOUT'],
+    limiter=SharedTokenBucket(app.config['MOZ_LIMITER_DB'], app.config['MOZ_RATE_LIMIT'], app.config['MOZ_BURST']),
+)
+
+# Every Moz lookup goes through the coalescer: identical in-flight targets are fetched once and
+# targets from concurrent requests share full batches. A partly filled batch waits
+# MOZ_COALESCE_WINDOW_MS for more targets before it is sent.
+app.config['MOZ_COALESCE_WINDOW_MS'] = float(os.getenv("MOZ_COALESCE_WINDOW_MS", 5))
+moz_coalescer = Coalescer(moz_client, window=app.config['MOZ_COALESCE_WINDOW_MS'] / 1000.0)
+
+# Background job queue so uploads and scrapes don't hold a web worker
+app.config['JOB_DB_PATH'] = os.getenv("JOB_DB_PATH", "jobs.db")
+app.config['JOB_WORKERS'] = int(os.getenv("JOB_WORKERS", 2))
+app.config['UPLOAD_FOLDER'] = os.getenv("UPLOAD_FOLDER", "uploads")
+os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+# TRACE_JOBS=true records per-job span timings, shown under "trace" in GET /jobs/<job_id>
+app.config['TRACE_JOBS'] = os.getenv("TRACE_JOBS", "false").lower() == "true"
+job_queue = JobQueue(app.config['JOB_DB_PATH'], workers=app.config['JOB_WORKERS'], trace=app.config['TRACE_JOBS'])
+
+# Uploads are checkpointed every UPLOAD_CHECKPOINT_TARGETS targets. Moz batches that still fail
+# after MOZ_MAX_RETRIES go to a dead-letter queue, retried up to MOZ_DLQ_RETRIES more rounds
+# MOZ_DLQ_BACKOFF seconds apart (doubling each round) before the job fails and can be resumed.
+app.config['UPLOAD_CHECKPOINT_TARGETS'] = int(os.getenv("UPLOAD_CHECKPOINT_TARGETS", 2000))
+app.config['MOZ_DLQ_RETRIES'] = int(os.getenv("MOZ_DLQ_RETRIES", 3))
+app.config['MOZ_DLQ_BACKOFF'] = float(os.getenv("MOZ_DLQ_BACKOFF", 30))
+
+# Auction scraper settings. AUCTION_PAGE_URL is a page URL template such as
+# ".../auctions/?page={page}&per-page={per_page}"; when set, SCRAPER_WORKERS pages load in parallel
+app.config['AUCTION_URL'] = os.getenv("AUCTION_URL", "https://whc.ca/domain-names/auctions/")
+app.config['AUCTION_PAGE_URL'] = os.getenv("AUCTION_PAGE_URL")
+app.config['SCRAPER_POOL_SIZE'] = int(os.getenv("SCRAPER_POOL_SIZE", 2))
+app.config['SCRAPER_WORKERS'] = int(os.getenv("SCRAPER_WORKERS", 1))
+app.config['SCRAPER_TIMEOUT'] = float(os.getenv("SCRAPER_TIMEOUT", 15))
+app.config['SCRAPER_MAX_PAGES'] = int(os.getenv("SCRAPER_MAX_PAGES", 1000))
+
+app.config['SCRAPER_BACKEND'] = os.getenv("SCRAPER_BACKEND", "selenium")  # "selenium" or "http"
+# "incremental" only writes domains not seen by an earlier scrape, "full" writes every domain
+app.config['SCRAPE_MODE'] = os.getenv("SCRAPE_MODE", "incremental")
+# Set when the listing shows the newest auctions first, so a page of known domains ends the scrape
+app.config['AUCTION_NEWEST_FIRST'] = os.getenv("AUCTION_NEWEST_FIRST", "false").lower() == "true"
+
+# Items buffered between two pipeline stages
+app.config['PIPELINE_QUEUE_SIZE'] = int(os.getenv("PIPELINE_QUEUE_SIZE", 1000))
+
+# Selenium is only imported (and its driver pool created) the first time a scrape needs it
+_driver_pool = None
+_driver_pool_lock = threading.Lock()
+
+def driver_pool():
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None:
+            import scraper
+            _driver_pool = scraper.DriverPool(size=app.config['SCRAPER_POOL_SIZE'])
+        return _driver_pool
+
+http_scraper = HttpListingScraper(timeout=app.config['SCRAPER_TIMEOUT'], workers=app.config['SCRAPER_WORKERS'],
+                                  max_pages=app.config['SCRAPER_MAX_PAGES'])
+
+# Moz results are reused for METRICS_CACHE_TTL seconds after they were fetched
+app.config['METRICS_CACHE_TTL'] = int(os.getenv("METRICS_CACHE_TTL", 7 * 24 * 3600))
+app.config['METRICS_CACHE_SIZE'] = int(os.getenv("METRICS_CACHE_SIZE", 100000))
+
+def load_cached_metrics(keys, fresh_after):
+    # Newest fresh page_data row for each normalized target. Read on a connection of its own, not
+    # db.session: upload jobs and pipeline stages hold one app context for hours, and a session
+    # transaction kept open that long would pin a pool connection and (under REPEATABLE READ) a
+    # snapshot that never sees rows written since
+    pages = PageData.__table__
+    with db.engine.connect() as conn:
+        rows = conn.execute(
+            db.select(pages)
+            .where(pages.c.target.in_(keys), pages.c.fetched_at >= fresh_after)
+            .order_by(pages.c.fetched_at)
+        ).all()
+    # to_dict only reads column attributes, which result rows have too
+    return {row.target: (PageData.to_dict(row), row.fetched_at) for row in rows}
+
+metrics_cache = MetricsCache(
+    load_cached_metrics,
+    maxsize=app.config['METRICS_CACHE_SIZE'],
+    ttl=app.config['METRICS_CACHE_TTL'],
+)
+
+# Targets are cleaned, validated and deduped before any Moz or database work: reduced to their
+# registrable domain (unless NORMALIZE_ROOT_DOMAINS=false) and, with DEDUPE_BLOOM_CAPACITY set,
+# deduped through a Bloom filter of that many entries instead of an exact set
+app.config['NORMALIZE_ROOT_DOMAINS'] = os.getenv("NORMALIZE_ROOT_DOMAINS", "true").lower() == "true"
+app.config['DEDUPE_BLOOM_CAPACITY'] = int(os.getenv("DEDUPE_BLOOM_CAPACITY", 0))
+
+def target_filter(bloom=False):
+    index = target_index(app.config['DEDUPE_BLOOM_CAPACITY']) if bloom else None
+    return TargetFilter(root_domains=app.config['NORMALIZE_ROOT_DOMAINS'], index=index)
+
+# Moz results are upserted in bulk, flushed by row count or elapsed time
+app.config['DB_FLUSH_ROWS'] = int(os.getenv("DB_FLUSH_ROWS", 500))
+app.config['DB_FLUSH_SECONDS'] = float(os.getenv("DB_FLUSH_SECONDS", 5))
+
+def page_data_row(target, record, fetched_at):
+    # Column values for one Moz url_metrics record, keyed on the normalized target
+    return {
+        "target": normalize_target(target),
+        "page": record.get('page', ''),
+        "subdomain": record.get('subdomain', ''),
+        "root_domain": record.get('root_domain', ''),
+        "last_crawled": record.get('last_crawled', ''),
+        "http_code": record.get('http_code', None),
+        "pages_to_page": record.get('pages_to_page', None),
+        "nofollow_pages_to_page": record.get('nofollow_pages_to_page', None),
+        "redirect_pages_to_page": record.get('redirect_pages_to_page', None),
+        "external_pages_to_page": record.get('external_pages_to_page', None),
+        "spam_score": record.get('spam_score', None),
+        "page_authority": record.get('page_authority', None),
+        "domain_authority": record.get('domain_authority', None),
+        "link_propensity": record.get('link_propensity', None),
+        "fetched_at": fetched_at,
+    }
+
+# Weights for the domain ranking, as JSON or "domain_authority=0.5,spam_score=-0.3"
+app.config['SCORE_WEIGHTS'] = scoring.parse_weights(os.getenv("SCORE_WEIGHTS"))
+
+def refresh_domain_scores(rows):
+    # Re-rank just the root domains whose PageData rows were written
+    scoring.refresh_scores(
+        db.engine,
+        PageData.__table__,
+        DomainScore.__table__,
+        {row['root_domain'] for row in rows},
+        app.config['SCORE_WEIGHTS'],
+    )
+
+# Domain metrics crossing one of these values between two refreshes are recorded as alerts
+app.config['HISTORY_THRESHOLDS'] = {
+    'domain_authority': history.parse_thresholds(os.getenv("HISTORY_DA_THRESHOLDS", "20,30,40,50")),
+    'spam_score': history.parse_thresholds(os.getenv("HISTORY_SPAM_THRESHOLDS", "31,61")),
+}
+
+def record_domain_history(rows):
+    # Snapshot the refreshed domain_scores values of each root domain, stamped with its fetch time
+    fetched = {}
+    for row in rows:
+        if row['root_domain']:
+            fetched[row['root_domain']] = max(fetched.get(row['root_domain'], 0), row['fetched_at'] or 0)
+    if not fetched:
+        return
+    scores = DomainScore.__table__
+    snapshots = []
+    with telemetry.span('history_write'):
+        for chunk in iter_batches(list(fetched), 500):
+            with db.engine.connect() as conn:
+                rows = conn.execute(db.select(scores).where(scores.c.root_domain.in_(chunk))).mappings().all()
+            snapshots.extend(dict(row, ts=fetched[row['root_domain']]) for row in rows)
+        history.record_snapshots(db.engine, domain_history, domain_alerts, snapshots,
+                                 app.config['HISTORY_THRESHOLDS'])
+
+def page_data_flushed(rows):
+    refresh_domain_scores(rows)
+    record_domain_history(rows)
+
+def page_data_writer():
+    # Must be called inside an app context
+    return BulkWriter(
+        db.engine,
+        PageData.__table__,
+        ['target'],
+        flush_rows=app.config['DB_FLUSH_ROWS'],
+        flush_seconds=app.config['DB_FLUSH_SECONDS'],
+        on_flush=page_data_flushed,
+        versions=table_versions,
+    )
+
+# Single background writer for rows fetched by interactive requests, so they never wait on the database
+page_data_writes = ThreadPoolExecutor(max_workers=1, thread_name_prefix='page-data')
+
+def save_page_data(rows):
+    try:
+        with app.app_context(), page_data_writer() as writer:
+            writer.extend(rows)
+    except Exception as e:
+        log.exception("Failed to save %d page_data rows: %s", len(rows), e)
+
 
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets.readonly']
 
@@ -62,6 +379,19 @@ SERVICE_ACCOUNT_FILE = 'cred.json'
 
 SPREADSHEET_ID = "1yG8r9CAhC3Ms3q624sQvJynuHfTJ1DBgRiJdJq1yx-4"
 
+# Google Sheets writes: "async" buffers and flushes in the background, "sync" flushes inline,
+# "off" skips the sheet. SHEETS_BACKEND=fake keeps rows in memory for local runs.
+app.config['SPREADSHEET_URL'] = os.getenv(
+    "SPREADSHEET_URL",
+    "https://docs.google.com/spreadsheets/d/1yG8r9CAhC3Ms3q624sQvJynuHfTJ1DBgRiJdJq1yx-4/edit?gid=0#gid=0"
+)
+app.config['SHEETS_MODE'] = os.getenv("SHEETS_MODE", "async")
+app.config['SHEETS_BACKEND'] = os.getenv("SHEETS_BACKEND", "google")
+app.config['SHEETS_FLUSH_ROWS'] = int(os.getenv("SHEETS_FLUSH_ROWS", 1000))
+app.config['SHEETS_FLUSH_SECONDS'] = float(os.getenv("SHEETS_FLUSH_SECONDS", 10))
+
+fake_sheet = sheets.FakeSheet()
+
 Base = declarative_base()
 
 class DomainName(Base):
@@ -69,147 +399,444 @@ class DomainName(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     domain = Column(String(255), nullable=False)
 
+# Domains seen by the scraper with first/last seen run times, for incremental scrapes
+seen_domains = seen_domains_table(db.metadata)
+
+# Change counters behind the GET /page_data ETag
+table_versions = table_versions_table(db.metadata)
+
+# Per root domain metric snapshots and the threshold crossings between them
+domain_history = history.domain_history_table(db.metadata)
+domain_alerts = history.domain_alerts_table(db.metadata)
+
 # Set up Google Sheets API
 def setup_google_sheets():
-    # Define the scope
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    # Load credentials from the JSON file
-    creds = Credentials.from_service_account_file(r"cred.json", scopes=scope)
-    client = gspread.authorize(creds)
-    # Open the spreadsheet by URL
-    spreadsheet_url = "https://docs.google.com/spreadsheets/d/1yG8r9CAhC3Ms3q624sQvJynuHfTJ1DBgRiJdJq1yx-4/edit?gid=0#gid=0"
-    sheet = client.open_by_url(spreadsheet_url).sheet1
-    return sheet
-
-def start_scraping():
-    print("Scraping started!")
-    
-    options = Options()
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--disable-direct-composition")
-    options.add_argument("--ignore-certificate-errors")
-    options.add_argument("--headless")  # Run headless for server environment
-    
-    # Initialize Chrome WebDriver
-    driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
-    
-    # Set up Google Sheets
-    sheet = setup_google_sheets()
-    
-    # Go to the URL to scrape
-    url = "https://whc.ca/domain-names/auctions/"
-    driver.get(url)
-    wait = WebDriverWait(driver, 10)
+    # The authorized client and worksheet are cached, so this only authenticates once per process
+    if app.config['SHEETS_BACKEND'] == 'fake':
+        return fake_sheet
+    return sheets.get_worksheet(app.config['SPREADSHEET_URL'], SERVICE_ACCOUNT_FILE)
+
+def sheet_sink(on_written=None):
+    # Buffered writer for scraped domains; the sheet is opened on the first flush
+    return sheets.SheetSink(
+        setup_google_sheets,
+        mode=app.config['SHEETS_MODE'],
+        flush_rows=app.config['SHEETS_FLUSH_ROWS'],
+        flush_seconds=app.config['SHEETS_FLUSH_SECONDS'],
+        on_written=on_written,
+    )
+
+def scrape_listing(on_page, backend):
+    # Run the auction scraper, calling on_page(page, domains); returns the backend that produced the pages
+    delivered = 0
+    current = backend
+    waiting_since = time.perf_counter()
+
+    def counted(page, domainnames):
+        nonlocal delivered, waiting_since
+        delivered += 1
+        # Page time is the wait for this page, not the caller's handling of the previous one
+        SCRAPE_PAGE_SECONDS.observe(time.perf_counter() - waiting_since, backend=current)
+        try:
+            with telemetry.span('scrape_save_page'):
+                return on_page(page, domainnames)
+        finally:
+            waiting_since = time.perf_counter()
+
+    if backend == 'http':
+        try:
+            # Plain HTTP requests parsed with lxml, no browser needed
+            http_scraper.scrape(
+                counted,
+                app.config['AUCTION_URL'],
+                page_url=app.config['AUCTION_PAGE_URL'],
+                per_page=100,
+            )
+        except Exception as e:
+            log.exception("HTTP scraping failed: %s", e)
+        if delivered:
+            return 'http'
+        # Nothing usable in the raw HTML (e.g. the listing is rendered by JavaScript)
+        log.warning("HTTP backend found no domains, falling back to Selenium.")
+        current = 'selenium'
+        waiting_since = time.perf_counter()
+
+    # Warm drivers come from the pool and pages are awaited with explicit waits
+    import scraper
+    scraper.scrape(
+        driver_pool(),
+        counted,
+        app.config['AUCTION_URL'],
+        page_url=app.config['AUCTION_PAGE_URL'],
+        per_page=100,
+        workers=app.config['SCRAPER_WORKERS'],
+        timeout=app.config['SCRAPER_TIMEOUT'],
+    )
+    return 'selenium'
+
+def start_scraping(job=None, backend=None, mode=None):
+    backend = backend or app.config['SCRAPER_BACKEND']
+    mode = mode or app.config['SCRAPE_MODE']
+    log.info("Scraping started (%s backend, %s mode)", backend, mode)
     
-    # Wait for the page to load
-    time.sleep(5)
+    # In incremental mode only domains the Sheet has not been sent before go downstream
+    tracker = DomainTracker(db.engine, seen_domains, SHEET) if mode == 'incremental' else None
+    queued = set()  # New domains handed to the sink this run, not marked until their rows are written
+
+    # Set up Google Sheets; domains are marked seen only once their batch reached the sheet
+    sink = sheet_sink((lambda rows: tracker.mark([row[0] for row in rows])) if tracker is not None else None)
     
     total_domains = 0
     page_count = 0
+    stopped_early = False
     all_domains = []  # List to store all domain names
-    
-    try:
-        # Accept cookies if needed
-        try:
-            accept_all_button = wait.until(EC.element_to_be_clickable((By.CSS_SELECTOR, 'button[data-cky-tag="accept-button"]')))
-            accept_all_button.click()
-        except Exception as e:
-            print(f"Cookie accept button not found or not clickable: {e}")
+
+    def save_page(page, domainnames):
+        nonlocal total_domains, page_count, stopped_early
+        page_count = page
+        total_domains += len(domainnames)
+
+        if tracker is not None:
+            page = tracker.clean(domainnames)
+            new = set(tracker.unseen(page))
+            # Known domains are only restamped with this run; that is safe before any write
+            tracker.mark([domain for domain in page if domain not in new])
+            domainnames = [domain for domain in page if domain in new and domain not in queued]
+            queued.update(domainnames)
+
+        # Add domain names to the list
+        all_domains.extend(domainnames)
         
-        # Set pagination to 100 items per page
-        dropdown = Select(driver.find_element(By.ID, "per-page"))
-        dropdown.select_by_value("100")
-        time.sleep(5)
+        # Queue domain names for the Google Sheet
+        sink.add([[domain] for domain in domainnames])
         
-        while True:
-            page_count += 1
-            print(f"Processing page {page_count}")
-            
-            # Extract domain names
-            domainname_elements = driver.find_elements(By.XPATH, "//div[@domainname]")
-            domainnames = [element.get_attribute('domainname') for element in domainname_elements]
-            
-            if not domainnames:
-                print("No domains found on this page. Ending scraping.")
-                break
-                
-            # Add domain names to the list
-            all_domains.extend(domainnames)
-            
-            # Save domain names to Google Sheet
-            rows_to_add = [[domain] for domain in domainnames]
-            sheet.append_rows(rows_to_add)
-            
-            total_domains += len(domainnames)
-            print(f"Added {len(domainnames)} domains. Total domains scraped: {total_domains}")
-            
-            # Check if there's a next page
-            try:
-                next_button = wait.until(EC.element_to_be_clickable((By.XPATH, "//a[@class='page-link' and @aria-label='Next']")))
-                if "disabled" in next_button.get_attribute("class"):
-                    print("Next button is disabled. Scraping completed.")
-                    break
-                next_button.click()
-                print("Navigated to the next page.")
-                time.sleep(10)  # Wait for the next page to load
-            except Exception as e:
-                print(f"No more pages to scrape. Scraping completed.")
-                break  # Exit the loop gracefully when no next button is found
+        log.info("Page %d: added %d domains, %d scraped in total", page, len(domainnames), total_domains)
+
+        # Report partial results when running as a background job
+        if job is not None:
+            job.add_results([{"domain": domain} for domain in domainnames])
+            job.progress(total_domains)
+
+        # With newest-first ordering, a page of only known domains means the rest are known too
+        if tracker is not None and not domainnames and app.config['AUCTION_NEWEST_FIRST']:
+            log.info("Page has no new domains. Stopping early.")
+            stopped_early = True
+            return False
     
+    try:
+        backend = scrape_listing(save_page, backend)
     except Exception as e:
-        print(f"An error occurred during scraping: {e}")
+        log.exception("An error occurred during scraping: %s", e)
     
-    finally:
-        driver.quit()
-        print("Scraping finished. Browser closed.")
-        return {
-            "status": "completed",
-            "message": f"Scraped {total_domains} domains from {page_count} pages",
-            "domains": all_domains  # Include the list of all domains
-        }
+    sheet_status = sink.close()
+    log.info("Scraping finished: %d domains from %d pages", total_domains, page_count)
+    result = {
+        "status": "completed",
+        "message": f"Scraped {total_domains} domains from {page_count} pages",
+        "backend": backend,
+        "mode": mode,
+        "sheet": sheet_status,
+        "domains": all_domains  # Include the list of all domains (only new ones in incremental mode)
+    }
+    if tracker is not None:
+        result["added"] = tracker.added
+        result["stopped_early"] = stopped_early
+        # Removed domains are only known after walking the whole listing
+        result["removed"] = None if stopped_early or not page_count else tracker.removed()
+    return result
     
+def store_lookups(results):
+    # Cache interactive lookups; the database write happens off the request path
+    fetched_at = int(time.time())
+    for target, record in results:
+        metrics_cache.store(target, record)
+    page_data_writes.submit(save_page_data, [page_data_row(target, record, fetched_at) for target, record in results])
+
+
 @app.route('/fetch_url_metrics', methods=['POST'])
 def fetch_url_metrics():
-    try:
-        # Get the user input (URL) from the request payload
-        data = request.get_json()
-
-        # Ensure 'targets' is part of the incoming request
-        if not data or 'targets' not in data:
-            return jsonify({"error": "'targets' key is missing in the request"}), 400
-
-        # Extract targets from the user input
-        targets = data['targets']
-        print(targets)
-        # Prepare the request payload in the required format
-        request_data = {
-            "targets": targets
-        }
-        # Set the URL for the Moz API
-        url = 'https://lsapi.seomoz.com/v2/url_metrics'
+    # Interactive lookup: cached metrics are answered straight away and only the rest
+    # go to Moz, through the shared session, limiter and coalescer
+    data = request.get_json(silent=True)
 
-        # Set headers
-        headers = {
-            'x-moz-token': f'{api_key}',
-            'Content-Type': 'application/json'  # Ensure the correct content type
-        }
-
-        # Send the POST request to the Moz API using the json parameter
-        response = requests.post(url, headers=headers, json=request_data)
-        time.sleep(10)  
-        # Check if the request was successful
-        if response.status_code == 200:
-            return jsonify(response.json()), 200
-        else:
-            return jsonify({
-                "error": f"Failed to fetch data. Status code: {response.status_code}",
-                "message": response.text
-            }), 500
+    # Ensure 'targets' is part of the incoming request
+    if not data or 'targets' not in data:
+        return jsonify({"error": "'targets' key is missing in the request"}), 400
+    targets = data['targets']
+    if not isinstance(targets, list) or not all(isinstance(target, str) for target in targets):
+        return jsonify({"error": "'targets' must be a list of strings"}), 400
 
+    try:
+        # Each distinct host is looked up once; blanks and invalid names are never sent. The
+        # caller's host granularity is kept, so blog.example.com is not answered as example.com.
+        normalizer = TargetFilter(root_domains=False)
+        keys, unique = normalizer.resolve(targets)
+        hits, misses = metrics_cache.split(unique)
+        records = dict(hits)
+        if misses:
+            # Lookups that outlast the timeout are still cached and saved once Moz answers
+            api_response = moz_coalescer.fetch(misses, timeout=app.config['FETCH_URL_METRICS_TIMEOUT'],
+                                               on_late=store_lookups)
+            results = list(zip(misses, api_response['results']))
+            records.update(results)
+            store_lookups(results)
+    except MozError as e:
+        return jsonify({"error": str(e), "message": e.message}), 500
+    except concurrent.futures.TimeoutError:
+        return jsonify({"error": "Timed out waiting for Moz"}), 504
     except Exception as e:
         return jsonify({"error": "An error occurred", "message": str(e)}), 500
-       
+
+    # Results keep the order of the request, like a direct Moz call (null for dropped targets)
+    response = jsonify({
+        "results": [records[key] if key is not None else None for key in keys],
+        "dropped": normalizer.dropped,
+    })
+    response.headers['X-Cache-Hits'] = str(len(hits))
+    return response
+
+def run_url_metrics_csv(job, payload):
+    # Background job: fetch Moz metrics for every target in an uploaded file.
+    # The file is worked through in checkpointed segments, so a restarted or resumed
+    # job skips everything up to the last checkpoint.
+    path = payload['path']
+    state = job.checkpoint() or {"position": 0, "processed": 0, "batches": 0, "cache_hits": 0, "cache_misses": 0}
+    # Moz counters (rows, batches, retries, elapsed) continue from the checkpoint too
+    stats = BatchStats()
+    stats.restore(state.get('moz', {}))
+    # Only new, valid targets go on to the cache and Moz; drop counts carry over from the checkpoint
+    normalizer = target_filter(bloom=True)
+    normalizer.dropped = dict(state.get('dropped', {}))
+    if state['position']:
+        log.info("Resuming job %s at target %d", job.id, state['position'])
+    cache_counts = {"hits": 0, "misses": 0}
+    # Rows fetched (stats.rows) at the last checkpoint, and failures recorded by this run
+    run = {"rows": stats.rows, "failures": 0}
+
+    def processed():
+        return state['processed'] + cache_counts['hits'] + stats.rows - run['rows']
+
+    def save_hits(hits):
+        job.add_results([record for _, record in hits])
+        job.progress(processed())
+
+    def save_batch(writer, chunk, api_response):
+        fetched_at = int(time.time())
+        # Moz returns one result per target, in request order
+        for target, record in zip(chunk, api_response['results']):
+            writer.add(page_data_row(target, record, fetched_at))
+            metrics_cache.store(target, record)
+        job.add_results(api_response['results'])
+        job.progress(processed())
+
+    def failure(error):
+        run['failures'] += 1
+        log.warning("Moz batch failed: %s - %s", error, error.message)
+        return {"status": BATCH_FAILED, "error": f"{error} - {error.message}", "retryable": error.transient}
+
+    def checkpoint(writer, batches):
+        # Flush first so the checkpoint never covers rows that are not in the database
+        writer.flush()
+        state.update(
+            processed=processed(),
+            cache_hits=state['cache_hits'] + cache_counts['hits'],
+            cache_misses=state['cache_misses'] + cache_counts['misses'],
+            dropped=dict(normalizer.dropped),
+            moz=stats.as_dict(),
+        )
+        state.update(job.save_checkpoint(state, batches))
+        cache_counts.update(hits=0, misses=0)
+        run['rows'] = stats.rows
+
+    with app.app_context(), page_data_writer() as writer:
+        targets = iter_targets(path)
+        # Targets before the checkpoint were handled already, but repeats of them must still be dropped
+        for segment in iter_batches(itertools.islice(targets, state['position']), app.config['UPLOAD_CHECKPOINT_TARGETS']):
+            normalizer.prime(segment)
+        for segment in iter_batches(targets, app.config['UPLOAD_CHECKPOINT_TARGETS']):
+            batches = []
+
+            def record_failure(chunk, error):
+                batches.append(dict(failure(error), batch_no=state['batches'] + len(batches),
+                                    size=len(chunk), targets=chunk))
+
+            # Only cache misses go to Moz; chunks run concurrently and are saved as they arrive
+            misses = metrics_cache.iter_misses(normalizer.filter(segment), save_hits, cache_counts)
+            for chunk, api_response in moz_coalescer.fetch_batches(misses, stats, on_error=record_failure):
+                batches.append({"batch_no": state['batches'] + len(batches), "status": BATCH_DONE, "size": len(chunk)})
+                save_batch(writer, chunk, api_response)
+
+            state['position'] += len(segment)
+            state['batches'] += len(batches)
+            checkpoint(writer, batches)
+            log.info("Checkpoint at target %d (%.2f rows/sec)", state['position'], stats.rows_per_sec)
+
+        job.progress(processed(), state['position'])
+
+        # Dead-letter queue: retry failed batches whose error may be temporary. Batches
+        # re-enabled by a resume are retried straight away (even with MOZ_DLQ_RETRIES=0),
+        # fresh failures after a pause.
+        rounds = app.config['MOZ_DLQ_RETRIES'] + (0 if run['failures'] else 1)
+        for attempt in range(rounds):
+            failed = job.failed_batches(retryable_only=True)
+            if not failed:
+                break
+            if attempt or run['failures']:
+                time.sleep(app.config['MOZ_DLQ_BACKOFF'] * (2 ** attempt))
+            for batch in failed:
+                try:
+                    api_response = moz_coalescer.fetch(batch['targets'], stats, priority=False)
+                except MozError as e:
+                    outcome = dict(failure(e), targets=batch['targets'])
+                else:
+                    save_batch(writer, batch['targets'], api_response)
+                    outcome = {"status": BATCH_DONE}
+                checkpoint(writer, [dict(outcome, batch_no=batch['batch_no'], size=batch['size'])])
+
+    result = stats.as_dict()
+    result.update(
+        targets=state['position'],
+        cache_hits=state['cache_hits'],
+        cache_misses=state['cache_misses'],
+        dropped=dict(normalizer.dropped),
+    )
+    failed = job.failed_batches()
+    if failed:
+        # Keep the upload so POST /jobs/<job_id>/resume can retry just the failed batches
+        job.update_result(result)
+        raise RuntimeError(f"{len(failed)} Moz batches failed ({sum(b['size'] for b in failed)} targets); "
+                           f"POST /jobs/{job.id}/resume to retry them")
+
+    log.info("Fetched %d targets in %d batches (%.2f rows/sec), %d served from cache",
+             stats.rows, stats.batches, stats.rows_per_sec, state['cache_hits'])
+    os.remove(path)
+    return result
+
+def run_scrape(job, payload):
+    # Background job: scrape the auction site
+    with app.app_context():
+        result = start_scraping(job, payload.get('backend'), payload.get('mode'))
+    result.pop('domains', None)  # Domains are already stored as partial results
+    return result
+
+def run_domain_pipeline(job=None, backend=None, mode=None, domains=None, on_progress=None):
+    # Scrape (or take `domains`), dedupe, fetch Moz metrics and persist as one streaming flow.
+    # Must be called inside an app context.
+    backend = backend or app.config['SCRAPER_BACKEND']
+    mode = mode or app.config['SCRAPE_MODE']
+    # Incremental runs skip domains an earlier pipeline run already stored metrics for. The pipeline
+    # has its own seen marker: domains only sent to the Sheet by /start-scrape still need metrics.
+    tracker = DomainTracker(db.engine, seen_domains, PIPELINE) if mode == 'incremental' else None
+    normalizer = target_filter(bloom=True)
+    pipe = Pipeline(maxsize=app.config['PIPELINE_QUEUE_SIZE'])
+    moz_stats = BatchStats()
+    cache_counts = {"hits": 0, "misses": 0}
+    persisted = 0
+
+    def in_app_context(func):
+        # Stages run on their own threads, each needs an app context for the database
+        def wrapper(inbox, emit):
+            with app.app_context():
+                func(inbox, emit)
+        return wrapper
+
+    def scrape_stage(_, emit):
+        if domains is not None:
+            for i in range(0, len(domains), 100):
+                emit((domains[i:i + 100], time.monotonic()))
+            return
+        scrape_listing(lambda page, domainnames: emit((domainnames, time.monotonic())), backend)
+
+    def dedupe_stage(pages, emit):
+        for domainnames, scraped_at in pages:
+            targets = normalizer.filter(domainnames)
+            if tracker is not None:
+                targets = tracker.unseen(targets)
+            for domain in targets:
+                emit((domain, scraped_at))
+
+    def moz_stage(items, emit):
+        scraped = {}
+
+        def targets():
+            for domain, scraped_at in items:
+                scraped[domain] = scraped_at
+                yield domain
+
+        def send_hits(hits):
+            for target, record in hits:
+                emit((target, record, scraped.pop(target, None), True))
+
+        # Small cache blocks keep the first Moz batch close behind the scraper
+        misses = metrics_cache.iter_misses(targets(), send_hits, cache_counts, block_size=moz_client.batch_size)
+        for chunk, api_response in moz_coalescer.fetch_batches(misses, moz_stats):
+            for target, record in zip(chunk, api_response['results']):
+                metrics_cache.store(target, record)
+                emit((target, record, scraped.pop(target, None), False))
+
+    def persist_stage(items, emit):
+        nonlocal persisted
+        results = []
+        stored = []
+        with page_data_writer() as writer:
+            for target, record, scraped_at, cached in items:
+                if not cached:
+                    writer.add(page_data_row(target, record, int(time.time())))
+                if scraped_at is not None:
+                    pipe.latency.observe(time.monotonic() - scraped_at)
+                persisted += 1
+                stored.append(target)
+                results.append(record)
+                if job is not None and len(results) >= 100:
+                    job.add_results(results)
+                    job.progress(persisted)
+                    results = []
+                emit(target)
+        # Marked only after the writer's last flush, so a failed run leaves its domains unseen
+        if tracker is not None:
+            tracker.mark(stored)
+        if job is not None:
+            job.add_results(results)
+            job.progress(persisted)
+
+    pipe.stage('scrape', in_app_context(scrape_stage))
+    pipe.stage('dedupe', in_app_context(dedupe_stage))
+    pipe.stage('moz', in_app_context(moz_stage))
+    pipe.stage('persist', in_app_context(persist_stage))
+
+    def progress(report):
+        if job is not None:
+            job.update_result(report)
+        if on_progress is not None:
+            on_progress(report)
+
+    report = pipe.run(on_progress=progress)
+    report["moz"] = moz_stats.as_dict()
+    report["cache_hits"] = cache_counts['hits']
+    report["cache_misses"] = cache_counts['misses']
+    report["dropped"] = normalizer.dropped
+    if tracker is not None:
+        report["added"] = tracker.added
+    return report
+
+def run_pipeline(job, payload):
+    # Background job: the whole scrape -> Moz -> database flow
+    with app.app_context():
+        return run_domain_pipeline(job, payload.get('backend'), payload.get('mode'))
+
+job_queue.register('url_metrics_csv', run_url_metrics_csv)
+job_queue.register('scrape', run_scrape)
+job_queue.register('pipeline', run_pipeline)
+
+def run_rebuild_scores(job, payload):
+    # Background job: recompute every domain score, e.g. after changing SCORE_WEIGHTS
+    with app.app_context():
+        written = scoring.rebuild_scores(db.engine, PageData.__table__, DomainScore.__table__, app.config['SCORE_WEIGHTS'])
+    job.progress(written, written)
+    return {"domains_scored": written}
+
+job_queue.register('rebuild_scores', run_rebuild_scores)
+
 @app.route('/fetch_url_metrics_csv', methods=['POST'])
 def fetch_url_metrics_csv():
     try:
@@ -220,86 +847,178 @@ def fetch_url_metrics_csv():
         file = request.files['file']
 
         # Check if the file has a valid extension
-        if file.filename.endswith('.csv'):
-            # Read CSV file
-            df = pd.read_csv(file)
-            
-        elif file.filename.endswith('.xlsx'):
-            # Read Excel file
-            df = pd.read_excel(file)
-           
-        else:
+        if not file.filename.endswith(('.csv', '.xlsx')):
             return jsonify({"error": "Invalid file type. Only CSV and XLSX files are allowed"}), 400
-        
-        data_string = df.values.tolist()
-     
-        flat_list = [item[0] for item in data_string]
-        all_responses = []
-        chunk_size = 10
-        chunks = [flat_list[i:i + chunk_size] for i in range(0, len(flat_list), chunk_size)]
-        
-        # Prepare the request payload in the required format
-        for chunk in chunks:
-            print(chunk)
-            request_data = {
-                "targets": chunk
-            }
-            # Set the URL for the Moz API
-            url = 'https://lsapi.seomoz.com/v2/url_metrics'
-
-            # Set headers
-            headers = {
-                'x-moz-token': f'{api_key}',
-                'Content-Type': 'application/json'  # Ensure the correct content type
-            }
-
-            # Send the POST request to the Moz API using the json parameter
-            response = requests.post(url, headers=headers, json=request_data)
-            
-            # Check if the request was successful
-            if response.status_code == 200:
-                api_response = response.json()
-                all_responses.append(response.json())  # Append the response to the list
-                # print(f"Response Content: {response.text}")
-                
-                for record in api_response['results']:
-                    page_data = PageData(
-                        page=record.get('page', ''),
-                        subdomain=record.get('subdomain', ''),
-                        root_domain=record.get('root_domain', ''),
-                        last_crawled=record.get('last_crawled', ''),
-                        http_code=record.get('http_code', None),
-                        pages_to_page=record.get('pages_to_page', None),
-                        nofollow_pages_to_page=record.get('nofollow_pages_to_page', None),
-                        redirect_pages_to_page=record.get('redirect_pages_to_page', None),
-                        external_pages_to_page=record.get('external_pages_to_page', None),
-                        spam_score=record.get('spam_score', None),
-                        page_authority=record.get('page_authority', None),
-                        domain_authority=record.get('domain_authority', None),
-                        link_propensity=record.get('link_propensity', None)
-                 
-                    )
-                    db.session.add(page_data)
-                
-                db.session.commit()
-                print(f"Response Content: {response.text}")
-                time.sleep(10)
-            else:
-                # If any chunk fails, return the error immediately
-                return jsonify({
-                    "error": f"Failed to fetch data. Status code: {response.status_code}",
-                    "message": response.text
-                }), 500
+
+        # Keep the upload on disk so the job survives a restart
+        filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+        path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        file.save(path)
+
+        job_id = job_queue.submit('url_metrics_csv', {"path": path, "filename": file.filename})
 
     except Exception as e:
         return jsonify({"error": "An error occurred", "message": str(e)}), 500
-    return jsonify(all_responses), 200
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
     
 @app.route('/start-scrape', methods=['GET'])
 def api_start_scrape():
-    # Run the scraping process synchronously and return the result when completed
-    result = start_scraping()
-    return jsonify(result)
+    # Queue the scraping process and return straight away; poll /jobs/<job_id> for progress
+    backend = request.args.get('backend', app.config['SCRAPER_BACKEND'])
+    if backend not in ('selenium', 'http'):
+        return jsonify({"error": "Invalid backend. Use 'selenium' or 'http'"}), 400
+    mode = request.args.get('mode', app.config['SCRAPE_MODE'])
+    if mode not in ('incremental', 'full'):
+        return jsonify({"error": "Invalid mode. Use 'incremental' or 'full'"}), 400
+    job_id = job_queue.submit('scrape', {"backend": backend, "mode": mode})
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route('/start-pipeline', methods=['GET'])
+def api_start_pipeline():
+    # Queue a streaming scrape -> dedupe -> Moz -> database run; poll /jobs/<job_id> for stage stats
+    backend = request.args.get('backend', app.config['SCRAPER_BACKEND'])
+    if backend not in ('selenium', 'http'):
+        return jsonify({"error": "Invalid backend. Use 'selenium' or 'http'"}), 400
+    mode = request.args.get('mode', app.config['SCRAPE_MODE'])
+    if mode not in ('incremental', 'full'):
+        return jsonify({"error": "Invalid mode. Use 'incremental' or 'full'"}), 400
+    job_id = job_queue.submit('pipeline', {"backend": backend, "mode": mode})
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    # Progress, throughput and partial results (paged with offset/limit) for a job
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 1000, type=int), 0), 10000)
+    status = job_queue.get(job_id, offset, limit)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status)
+
+# Rows fetched per query / written per chunk by the export endpoints
+app.config['EXPORT_CHUNK_ROWS'] = int(os.getenv("EXPORT_CHUNK_ROWS", 1000))
+
+def export_response(fmt, chunks, columns, name, table=None):
+    # Stream an export as an attachment; rows are encoded as they are read
+    stream, mimetype, extension = export.export_stream(fmt, chunks, columns, table)
+    return Response(
+        stream_with_context(stream),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{export.export_filename(name, extension)}"',
+            'Cache-Control': 'no-store',
+        },
+    )
+
+@app.route('/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    # Re-run a failed job from its last checkpoint, retrying its dead-lettered Moz batches
+    if job_queue.get(job_id, limit=0) is None:
+        return jsonify({"error": "Job not found"}), 404
+    if not job_queue.resume(job_id):
+        return jsonify({"error": "Only failed jobs can be resumed"}), 409
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route('/jobs/<job_id>/export', methods=['GET'])
+def export_job_results(job_id):
+    # Download a job's results as csv (default), ndjson, xlsx or parquet
+    fmt = request.args.get('format', 'csv')
+    if job_queue.get(job_id, limit=0) is None:
+        return jsonify({"error": "Job not found"}), 404
+    try:
+        columns, chunks = export.peek_columns(job_queue.iter_results(job_id, app.config['EXPORT_CHUNK_ROWS']))
+        return export_response(fmt, chunks, columns, f"job-{job_id}")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+def page_data_version():
+    # Cheap validator for the whole table: bumped with every committed page_data write,
+    # including upserts that change values without changing ids or fetch times
+    return table_version(db.session.connection(), table_versions, PageData.__tablename__)
+
+@app.route('/page_data', methods=['GET'])
+def list_page_data():
+    # Filtered, sorted, keyset-paginated listing of PageData with column projection
+    columns = [column.name for column in PageData.__table__.columns]
+    try:
+        spec = query.parse_params(request.args, columns)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # The ETag changes whenever a row is added or refreshed, so unchanged pages answer 304
+    etag = hashlib.sha1(f"{page_data_version()}|{request.query_string.decode()}".encode()).hexdigest()
+    if etag in request.if_none_match:
+        return '', 304, {'ETag': f'"{etag}"'}
+
+    rows = db.session.execute(query.build_query(PageData, spec)).all()
+    response = jsonify(query.page_of(rows, spec))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/export/page_data', methods=['GET'])
+def export_page_data():
+    # Full PageData export in id order; accepts the filters and `fields` of GET /page_data
+    columns = [column.name for column in PageData.__table__.columns]
+    try:
+        spec = query.parse_params(request.args, columns)
+        chunks = query.iter_chunks(db.engine, PageData, spec, app.config['EXPORT_CHUNK_ROWS'])
+        return export_response(request.args.get('format', 'csv'), chunks, spec["fields"], 'page_data',
+                               PageData.__table__)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/top_domains', methods=['GET'])
+def top_domains():
+    # Highest scoring root domains, answered from the precomputed domain_scores table
+    n = min(max(request.args.get('n', 50, type=int), 1), 1000)
+    rows = DomainScore.query.order_by(DomainScore.score.desc(), DomainScore.id).limit(n).all()
+    return jsonify({
+        "weights": app.config['SCORE_WEIGHTS'],
+        "domains": [dict(row.to_dict(), rank=rank) for rank, row in enumerate(rows, 1)],
+    })
+
+@app.route('/top_domains/rebuild', methods=['POST'])
+def rebuild_top_domains():
+    # Queue a full re-score; normal refreshes happen automatically as Moz results land
+    job_id = job_queue.submit('rebuild_scores', {})
+    return jsonify({"job_id": job_id, "status_url": f"/jobs/{job_id}"}), 202
+
+@app.route('/history/<root_domain>', methods=['GET'])
+def domain_metric_history(root_domain):
+    # Snapshots of one root domain in a time range, each with its change since the one before
+    try:
+        start = history.parse_timestamp(request.args.get('start', '0'), 'start')
+        end = history.parse_timestamp(request.args['end'], 'end') if 'end' in request.args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 1000)
+    return jsonify(history.domain_history(db.engine, domain_history, normalize_target(root_domain), start, end, limit))
+
+@app.route('/history/alerts', methods=['GET'])
+def history_alerts():
+    # Domains whose domain_authority or spam_score crossed a threshold between refreshes, newest first
+    metric = request.args.get('metric')
+    if metric and metric not in history.ALERT_METRICS:
+        return jsonify({"error": f"'metric' must be one of: {', '.join(history.ALERT_METRICS)}"}), 400
+    direction = request.args.get('direction')
+    if direction and direction not in ('up', 'down'):
+        return jsonify({"error": "'direction' must be 'up' or 'down'"}), 400
+    try:
+        since = history.parse_timestamp(request.args.get('since', str(int(time.time()) - 7 * 24 * 3600)), 'since')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 1000)
+    return jsonify({
+        "since": since,
+        "thresholds": app.config['HISTORY_THRESHOLDS'],
+        "alerts": history.recent_alerts(db.engine, domain_alerts, since, metric, direction, limit),
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Prometheus text exposition of every counter and histogram, summed over all workers with METRICS_DIR
+    return Response(telemetry.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -311,4 +1030,7 @@ def health_check():
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()  # Create the database tables
+    # Pick up jobs interrupted by the last shutdown (only in the reloader's serving process)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_queue.resume_pending()
     app.run(debug=True)
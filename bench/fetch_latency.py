@@ -0,0 +1,123 @@
+"""Latency of POST /fetch_url_metrics against a local mock Moz server.
+
+    python -m bench.fetch_latency [--requests 400] [--concurrency 8] [--moz-latency 0.1]
+
+Runs the Flask app on a local port with a throwaway SQLite database, sends a
+mix of cold (never seen) and warm (cached) lookups from several clients and
+reports p50/p95/p99 per kind. Exits non-zero if p99 is over --max-p99 seconds.
+"""
+import argparse
+import random
+import sys
+import threading
+import time
+
+import requests
+
+from bench.harness import configure_app
+from bench.servers import serve_mock_moz
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(int(p * len(samples)), len(samples) - 1)]
+
+
+def summary(samples):
+    if not samples:
+        return "no samples"
+    return (f"n={len(samples):<5} p50={percentile(samples, 0.5) * 1000:7.1f}ms  "
+            f"p95={percentile(samples, 0.95) * 1000:7.1f}ms  p99={percentile(samples, 0.99) * 1000:7.1f}ms  "
+            f"max={max(samples) * 1000:7.1f}ms")
+
+
+def start_app(moz_url, moz_rate):
+    configure_app(MOZ_API_URL=moz_url, MOZ_RATE_LIMIT=moz_rate, MOZ_BURST=max(int(moz_rate), 1))
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    import api
+
+    class QuietRequestHandler(WSGIRequestHandler):
+        def log_request(self, *args):
+            pass
+
+    with api.app.app_context():
+        api.db.create_all()
+    server = make_server('127.0.0.1', 0, api.app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--targets', type=int, default=5, help="targets per request")
+    parser.add_argument('--warm-ratio', type=float, default=0.5, help="share of requests for cached targets")
+    parser.add_argument('--moz-latency', type=float, default=0.1, help="mock Moz response time in seconds")
+    parser.add_argument('--moz-rate', type=float, default=50, help="Moz requests per second allowed")
+    parser.add_argument('--max-p99', type=float, default=1.0)
+    args = parser.parse_args()
+
+    moz, moz_url = serve_mock_moz(latency=args.moz_latency)
+    app_server, base_url = start_app(moz_url, args.moz_rate)
+    url = f"{base_url}/fetch_url_metrics"
+
+    # Warm the cache with a pool of targets the warm requests draw from. Every target is its
+    # own registrable domain, so none of them are merged by the normalization step.
+    warm_pool = [f"warm-{i}.example" for i in range(200)]
+    for i in range(0, len(warm_pool), 50):
+        requests.post(url, json={"targets": warm_pool[i:i + 50]}).raise_for_status()
+
+    latencies = {"cold": [], "warm": []}
+    errors = []
+    counter = iter(range(args.requests))
+    lock = threading.Lock()
+
+    def client(worker):
+        session = requests.Session()
+        rng = random.Random(worker)
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            if rng.random() < args.warm_ratio:
+                kind, targets = "warm", rng.sample(warm_pool, args.targets)
+            else:
+                kind, targets = "cold", [f"cold-{n}-{j}.example" for j in range(args.targets)]
+            started = time.perf_counter()
+            response = session.post(url, json={"targets": targets})
+            elapsed = time.perf_counter() - started
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+            with lock:
+                latencies[kind].append(elapsed)
+
+    moz_before = moz.RequestHandlerClass.requests
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    everything = latencies["cold"] + latencies["warm"]
+    print(f"{args.requests} requests, {args.concurrency} clients, {args.targets} targets each, "
+          f"mock Moz latency {args.moz_latency * 1000:.0f}ms")
+    print(f"cold  {summary(latencies['cold'])}")
+    print(f"warm  {summary(latencies['warm'])}")
+    print(f"all   {summary(everything)}")
+    print(f"{len(everything) / elapsed:.1f} req/s, {moz.RequestHandlerClass.requests - moz_before} Moz calls, "
+          f"{len(errors)} errors")
+
+    app_server.shutdown()
+    moz.shutdown()
+    if errors or not everything or percentile(everything, 0.99) > args.max_p99:
+        print(f"FAIL: p99 over {args.max_p99}s or errors")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
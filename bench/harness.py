@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+
+def configure_app(**env):
+    # Point the app at throwaway storage (plus any overrides) before `api` is imported;
+    # returns the scratch directory
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "JOB_DB_PATH": os.path.join(workdir, 'jobs.db'),
+        "UPLOAD_FOLDER": os.path.join(workdir, 'uploads'),
+        "SHEETS_BACKEND": "fake",
+        "API_KEY": "bench",
+    })
+    os.environ.update({name: str(value) for name, value in env.items()})
+    return workdir
@@ -0,0 +1,124 @@
+"""Compare the HTTP and Selenium scraper backends on the saved auction fixtures.
+
+    python -m bench.scrapers [--rounds 20] [--backends http,selenium]
+
+Each backend runs in its own subprocess so peak RSS (including any Chrome
+child processes when psutil is installed) is measured in isolation.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+from bench.servers import FIXTURES, serve_directory
+
+
+class PeakRSS:
+    # Samples RSS of this process and its children; falls back to ru_maxrss without psutil
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        try:
+            import psutil
+            self.process = psutil.Process()
+        except ImportError:
+            self.process = None
+
+    def sample(self):
+        processes = [self.process] + self.process.children(recursive=True)
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except Exception:
+                pass
+        self.peak = max(self.peak, total)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        if self.process is not None:
+            threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        if self.process is None:
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_backend(backend, base_url, rounds):
+    pages = 0
+    domains = 0
+
+    def on_page(page, domainnames):
+        nonlocal domains
+        domains += len(domainnames)
+
+    with PeakRSS() as rss:
+        if backend == 'http':
+            from http_scraper import HttpListingScraper
+            scraper = HttpListingScraper()
+            start = time.perf_counter()
+            for _ in range(rounds):
+                pages += scraper.scrape(on_page, f"{base_url}/page-1.html")
+        else:
+            import scraper as selenium_scraper
+            pool = selenium_scraper.DriverPool(size=1)
+            start = time.perf_counter()
+            try:
+                for _ in range(rounds):
+                    pages += selenium_scraper.scrape(pool, on_page, f"{base_url}/page-1.html", timeout=5)
+            finally:
+                pool.close()
+        elapsed = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "rounds": rounds,
+        "pages": pages,
+        "domains": domains,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 2) if elapsed > 0 else 0.0,
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--backends', default='http,selenium')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_backend(args.child, args.base_url, args.rounds)))
+        return
+
+    server, base_url = serve_directory(FIXTURES)
+    try:
+        for backend in args.backends.split(','):
+            proc = subprocess.run(
+                [sys.executable, '-m', 'bench.scrapers', '--child', backend, '--base-url', base_url,
+                 '--rounds', str(args.rounds)],
+                capture_output=True, text=True
+            )
+            if proc.returncode != 0:
+                print(f"{backend:<9} failed: {proc.stderr.strip().splitlines()[-1] if proc.stderr else proc.returncode}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{backend:<9} {result['pages']:>5} pages in {result['seconds']:>7.2f}s  "
+                  f"{result['pages_per_sec']:>8.2f} pages/sec  peak RSS {result['peak_rss_mb']:>7.1f} MB")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
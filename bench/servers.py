@@ -0,0 +1,144 @@
+import argparse
+import functools
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+# Saved copy of the auction listing
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fixtures', 'auctions')
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_directory(path, host='127.0.0.1', port=0):
+    # Serve a directory of static files on a background thread; returns (server, base_url)
+    handler = functools.partial(QuietHandler, directory=path)
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+class MockMozHandler(BaseHTTPRequestHandler):
+    # Answers Moz v2 url_metrics requests with made-up metrics. Faults are injected per
+    # request: `error_rate` of them get a 500, every `throttle_every`-th gets a 429.
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    throttle_every = 0
+    retry_after = 1.0
+    random = None
+    lock = None
+    requests = 0
+    errors = 0
+    throttled = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        cls = type(self)
+        with cls.lock:
+            cls.requests += 1
+            throttle = cls.throttle_every and cls.requests % cls.throttle_every == 0
+            fail = not throttle and cls.random.random() < cls.error_rate
+            delay = cls.latency + cls.random.uniform(0, cls.jitter)
+            cls.throttled += bool(throttle)
+            cls.errors += bool(fail)
+        time.sleep(delay)
+
+        if throttle:
+            self.send_response(429)
+            self.send_header('Retry-After', str(cls.retry_after))
+            self.end_headers()
+            return
+        if fail:
+            self.send_response(500)
+            self.end_headers()
+            self.wfile.write(b'Injected error')
+            return
+
+        results = [mock_metrics(target) for target in body.get('targets', [])]
+        payload = json.dumps({"results": results}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def mock_metrics(target):
+    # Stable fake metrics derived from the target name
+    seed = zlib.crc32(target.encode())
+    domain = target.split('://')[-1].split('/')[0]
+    return {
+        "page": f"{domain}/",
+        "subdomain": domain,
+        "root_domain": domain,
+        "last_crawled": "2024-01-01",
+        "http_code": 200,
+        "pages_to_page": seed % 5000,
+        "nofollow_pages_to_page": seed % 300,
+        "redirect_pages_to_page": seed % 20,
+        "external_pages_to_page": seed % 4000,
+        "spam_score": seed % 30,
+        "page_authority": seed % 60,
+        "domain_authority": seed % 90,
+        "link_propensity": (seed % 1000) / 1000.0,
+    }
+
+
+def serve_mock_moz(latency=0.0, jitter=0.0, error_rate=0.0, throttle_every=0, retry_after=1.0, seed=0,
+                   host='127.0.0.1', port=0):
+    # Mock Moz url_metrics endpoint on a background thread; returns (server, url).
+    # server.RequestHandlerClass has the requests/errors/throttled counters.
+    handler = type('MockMoz', (MockMozHandler,), {
+        "latency": latency,
+        "jitter": jitter,
+        "error_rate": error_rate,
+        "throttle_every": throttle_every,
+        "retry_after": retry_after,
+        "random": random.Random(seed),
+        "lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}/v2/url_metrics"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a mock Moz API and the auction fixtures for local runs")
+    parser.add_argument('--moz-port', type=int, default=8001)
+    parser.add_argument('--auction-port', type=int, default=8002)
+    parser.add_argument('--latency', type=float, default=0.1, help="seconds per Moz request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of Moz requests answered with a 500")
+    parser.add_argument('--throttle-every', type=int, default=0, help="answer every Nth Moz request with a 429")
+    parser.add_argument('--retry-after', type=float, default=1.0)
+    args = parser.parse_args()
+
+    moz, moz_url = serve_mock_moz(args.latency, args.jitter, args.error_rate, args.throttle_every,
+                                  args.retry_after, port=args.moz_port)
+    auctions, auctions_url = serve_directory(FIXTURES, port=args.auction_port)
+    print("Point the app at the local servers with:")
+    print(f"  MOZ_API_URL={moz_url}")
+    print(f"  AUCTION_URL={auctions_url}/page-1.html")
+    print(f"  AUCTION_PAGE_URL={auctions_url}/page-{{page}}.html")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        moz.shutdown()
+        auctions.shutdown()
+
+
+if __name__ == '__main__':
+    main()
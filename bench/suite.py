@@ -0,0 +1,230 @@
+"""Throughput benchmarks for ingestion, Moz batching, database writes and scraping.
+
+    python -m bench.suite [--only csv_ingest,moz_batching] [--scale 0.5]
+                          [--output bench/results/<version>.json] [--compare OLD.json]
+
+Everything runs locally: Moz is the mock server from bench.servers (with
+latency and 429 injection), the database is a throwaway SQLite file and the
+scraper reads the saved auction fixtures. Results are written as JSON so runs
+from different versions can be compared; --compare exits non-zero when a
+benchmark is more than --tolerance slower than the baseline.
+"""
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+from bench.harness import configure_app
+from bench.servers import FIXTURES, mock_metrics, serve_directory, serve_mock_moz
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def timed(func):
+    started = time.perf_counter()
+    value = func()
+    return value, time.perf_counter() - started
+
+
+def throughput(count, seconds, unit, **extra):
+    return dict(value=round(count / seconds, 2) if seconds > 0 else 0.0, unit=unit,
+                count=count, seconds=round(seconds, 3), **extra)
+
+
+def bench_csv_ingest(workdir, scale):
+    # Reading plus normalizing and deduping, in the segments an upload job works through;
+    # every 10th row repeats an earlier site in another form and every 50th is blank
+    from ingest import iter_targets
+    from moz import iter_batches
+    from normalize import TargetFilter
+
+    count = int(200000 * scale)
+    path = os.path.join(workdir, 'targets.csv')
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['url'])
+        for i in range(count):
+            if i % 50 == 49:
+                writer.writerow([''])
+            elif i % 10 == 9:
+                writer.writerow([f"site-{i - 5}.com"])
+            else:
+                writer.writerow([f"https://www.site-{i}.com/"])
+    normalizer = TargetFilter()
+
+    def ingest():
+        read = kept = 0
+        for segment in iter_batches(iter_targets(path), 1000):
+            read += len(segment)
+            kept += len(normalizer.filter(segment))
+        return read, kept
+
+    (read, kept), seconds = timed(ingest)
+    return throughput(read, seconds, 'targets/sec', kept=kept, dropped=normalizer.dropped)
+
+
+def bench_xlsx_ingest(workdir, scale):
+    from openpyxl import Workbook
+    from ingest import iter_targets
+
+    count = int(20000 * scale)
+    path = os.path.join(workdir, 'targets.xlsx')
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(['url'])
+    for i in range(count):
+        sheet.append([f"site-{i}.example.com"])
+    workbook.save(path)
+    read, seconds = timed(lambda: sum(1 for _ in iter_targets(path)))
+    return throughput(read, seconds, 'targets/sec')
+
+
+def bench_moz_batching(workdir, scale):
+    # The path uploads take: the coalescer in front of a client limited by the shared (SQLite) token
+    # bucket. 20 ms per request with jitter, and every 25th request throttled with a short Retry-After
+    from coalesce import Coalescer
+    from moz import BatchStats, MozClient, SharedTokenBucket
+
+    server, url = serve_mock_moz(latency=0.02, jitter=0.01, throttle_every=25, retry_after=0.05)
+    try:
+        limiter = SharedTokenBucket(os.path.join(workdir, 'bench-limiter.db'), 200, 20)
+        client = MozClient('bench', url=url, concurrency=4, rate=200, burst=20, backoff=0.05, limiter=limiter)
+        coalescer = Coalescer(client)
+        stats = BatchStats()
+        targets = (f"site-{i}.example.com" for i in range(int(5000 * scale)))
+        rows, seconds = timed(lambda: sum(len(batch) for batch, _ in coalescer.fetch_batches(targets, stats)))
+        return throughput(rows, seconds, 'rows/sec', retries=stats.retries,
+                          requests=server.RequestHandlerClass.requests)
+    finally:
+        server.shutdown()
+
+
+def bench_db_persist(workdir, scale):
+    # The real page_data write path: multi-row upserts plus the domain score refresh
+    import api
+
+    count = int(20000 * scale)
+    fetched_at = int(time.time())
+    rows = [api.page_data_row(f"site-{i}.example.com", mock_metrics(f"site-{i % (count // 4 or 1)}.example.com"),
+                              fetched_at) for i in range(count)]
+
+    def write():
+        with api.app.app_context(), api.page_data_writer() as writer:
+            for row in rows:
+                writer.add(row)
+        return len(rows)
+
+    with api.app.app_context():
+        api.db.create_all()
+    written, seconds = timed(write)
+    return throughput(written, seconds, 'rows/sec', flush_rows=api.app.config['DB_FLUSH_ROWS'])
+
+
+def bench_scrape_http(workdir, scale):
+    from http_scraper import HttpListingScraper
+
+    server, base_url = serve_directory(FIXTURES)
+    try:
+        scraper = HttpListingScraper(timeout=5)
+        rounds = max(int(50 * scale), 1)
+        pages = 0
+        domains = 0
+
+        def crawl():
+            nonlocal pages, domains
+            for _ in range(rounds):
+                def on_page(page, found):
+                    nonlocal pages, domains
+                    pages += 1
+                    domains += len(found)
+                scraper.scrape(on_page, f"{base_url}/page-1.html")
+            return pages
+
+        _, seconds = timed(crawl)
+        return throughput(pages, seconds, 'pages/sec', domains=domains)
+    finally:
+        server.shutdown()
+
+
+BENCHMARKS = {
+    'csv_ingest': bench_csv_ingest,
+    'xlsx_ingest': bench_xlsx_ingest,
+    'moz_batching': bench_moz_batching,
+    'db_persist': bench_db_persist,
+    'scrape_http': bench_scrape_http,
+}
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare(results, baseline, tolerance):
+    # Print current vs baseline; every metric is a throughput, so lower is worse
+    regressions = []
+    print(f"\nCompared with {baseline['version']} ({baseline['created_at']}):")
+    for name, result in results['benchmarks'].items():
+        old = baseline['benchmarks'].get(name)
+        if not old or not old['value']:
+            print(f"  {name:<14} no baseline")
+            continue
+        change = (result['value'] - old['value']) / old['value']
+        flag = ''
+        if change < -tolerance:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"  {name:<14} {old['value']:>12.2f} -> {result['value']:>12.2f} {result['unit']:<12} {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', help="comma-separated benchmark names")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplier for every workload size")
+    parser.add_argument('--output', help="results file (default bench/results/<git version>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="allowed slowdown before flagging")
+    args = parser.parse_args()
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)} (choose from {', '.join(BENCHMARKS)})")
+
+    workdir = configure_app()
+    results = {
+        "version": git_version(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "scale": args.scale,
+        "benchmarks": {},
+    }
+    for name in names:
+        result = BENCHMARKS[name](workdir, args.scale)
+        results['benchmarks'][name] = result
+        print(f"{name:<14} {result['value']:>12.2f} {result['unit']:<12} ({result['count']} in {result['seconds']}s)")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['version']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import threading
+import time
+from collections import OrderedDict
+
+import telemetry
+from moz import iter_batches
+from normalize import normalize_target
+
+CACHE_LOOKUPS = telemetry.counter('metrics_cache_lookups_total', 'Metrics cache lookups by where they were answered',
+                                  ['result'])
+
+
+class LRUCache:
+    """Bounded in-process cache whose entries expire `ttl` seconds after they were fetched."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, fetched_at = entry
+            if fetched_at < time.time() - self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, fetched_at=None):
+        with self.lock:
+            self.entries[key] = (value, fetched_at or time.time())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+class MetricsCache:
+    """Read-through cache for Moz url metrics: LRU first, then the database via `loader`.
+
+    `loader(keys, fresh_after)` returns {key: (record, fetched_at)} for stored rows
+    fetched after the `fresh_after` timestamp.
+    """
+
+    def __init__(self, loader, maxsize=100000, ttl=7 * 24 * 3600):
+        self.loader = loader
+        self.ttl = ttl
+        self.lru = LRUCache(maxsize, ttl)
+
+    def split(self, targets):
+        # Return ([(target, record), ...] hits, [target, ...] misses)
+        with telemetry.span('cache_lookup'):
+            return self._split(targets)
+
+    def _split(self, targets):
+        hits = []
+        missing = {}
+        for target in targets:
+            key = normalize_target(target)
+            record = self.lru.get(key)
+            if record is not None:
+                hits.append((target, record))
+            else:
+                missing.setdefault(key, []).append(target)
+
+        memory_hits = len(hits)
+        if missing:
+            stored = self.loader(list(missing), time.time() - self.ttl)
+            for key, (record, fetched_at) in stored.items():
+                self.lru.set(key, record, fetched_at)
+                hits.extend((target, record) for target in missing.pop(key))
+
+        misses = [target for targets_for_key in missing.values() for target in targets_for_key]
+        CACHE_LOOKUPS.inc(memory_hits, result='memory')
+        CACHE_LOOKUPS.inc(len(hits) - memory_hits, result='database')
+        CACHE_LOOKUPS.inc(len(misses), result='miss')
+        return hits, misses
+
+    def store(self, target, record):
+        self.lru.set(normalize_target(target), record)
+
+    def iter_misses(self, targets, on_hits, counts, block_size=500):
+        # Yield only the targets that need a Moz call; hits go to `on_hits` in blocks
+        for block in iter_batches(targets, block_size):
+            hits, misses = self.split(block)
+            counts['hits'] = counts.get('hits', 0) + len(hits)
+            counts['misses'] = counts.get('misses', 0) + len(misses)
+            if hits:
+                on_hits(hits)
+            yield from misses
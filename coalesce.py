@@ -0,0 +1,223 @@
+import collections
+import itertools
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError, wait
+
+import telemetry
+from moz import BatchStats, MozError, iter_batches
+
+COALESCED_TARGETS = telemetry.counter('moz_coalesced_targets_total', 'Targets served by a lookup already in flight')
+COALESCER_BATCH_SIZE = telemetry.histogram('moz_coalesced_batch_size', 'Targets per shared Moz batch',
+                                           buckets=(1, 5, 10, 20, 30, 40, 50))
+
+
+class Lane:
+    # Targets waiting for a shared batch (insertion ordered), and when the oldest was queued
+    def __init__(self, priority):
+        self.priority = priority
+        self.targets = {}
+        self.since = None
+
+    def add(self, target):
+        self.targets[target] = None
+        if self.since is None:
+            self.since = time.monotonic()
+
+    def take(self, size):
+        batch = list(itertools.islice(self.targets, size))
+        for target in batch:
+            del self.targets[target]
+        self.since = time.monotonic() if self.targets else None
+        return batch
+
+
+class Coalescer:
+    """Singleflight and micro-batching in front of a MozClient.
+
+    A target already queued or in flight for one caller is not requested again
+    for another; both get the same result. Targets from all callers are packed
+    into shared batches of the client's batch size. A partly filled batch waits
+    up to `window` seconds for more targets before it is sent.
+
+    Interactive lookups (`fetch`) queue in a priority lane that is always sent
+    first, take the next rate-limiter token, and have one of the client's
+    `concurrency` send slots kept free for them, so they are not stuck behind
+    the batches of a running upload (`fetch_batches`).
+    """
+
+    def __init__(self, client, window=0.005):
+        self.client = client
+        self.window = window
+        self.stats = BatchStats()  # counters for the shared batches actually sent
+        self.coalesced = 0
+        self.in_flight = {}  # target -> Future, from the moment it is queued until its batch returns
+        self.urgent = Lane(priority=True)
+        self.bulk = Lane(priority=False)
+        self.sending = 0
+        self.lock = threading.Lock()
+        self.ready = threading.Condition(self.lock)
+        self.executor = ThreadPoolExecutor(max_workers=client.concurrency, thread_name_prefix='moz')
+        self.thread = threading.Thread(target=self.run, name='moz-coalescer', daemon=True)
+        self.thread.start()
+
+    def submit(self, targets, priority=False):
+        # One future per target (in order), resolving to that target's Moz record
+        lane = self.urgent if priority else self.bulk
+        futures = []
+        with self.lock:
+            for target in targets:
+                future = self.in_flight.get(target)
+                if future is not None:
+                    self.coalesced += 1
+                    COALESCED_TARGETS.inc()
+                    # Still queued behind bulk work: move it to the front
+                    if priority and target in self.bulk.targets:
+                        del self.bulk.targets[target]
+                        self.urgent.add(target)
+                else:
+                    future = Future()
+                    self.in_flight[target] = future
+                    lane.add(target)
+                futures.append(future)
+            if lane.targets:
+                self.ready.notify()
+        return futures
+
+    def next_batch(self, size):
+        # (lane, batch) to send now, or (None, seconds until a partly filled batch is due)
+        now = time.monotonic()
+        wake = None
+        # Bulk batches leave one send slot free for the priority lane
+        slots = {True: self.client.concurrency, False: max(self.client.concurrency - 1, 1)}
+        for lane in (self.urgent, self.bulk):
+            if not lane.targets:
+                continue
+            due = lane.since + self.window
+            if len(lane.targets) >= size or due <= now:
+                if self.sending < slots[lane.priority]:
+                    return lane, lane.take(size)
+                continue  # Woken when a send finishes
+            wake = due - now if wake is None else min(wake, due - now)
+        return None, wake
+
+    def run(self):
+        # Dispatcher: send a batch as soon as it is full or its window has passed and a send
+        # slot is free. Queued batches stay here rather than in the executor, so a lookup
+        # that arrives later can still go first.
+        size = self.client.batch_size
+        while True:
+            with self.lock:
+                lane, batch = self.next_batch(size)
+                while lane is None:
+                    self.ready.wait(batch)
+                    lane, batch = self.next_batch(size)
+                self.sending += 1
+            self.executor.submit(self.send, batch, lane.priority)
+
+    def send(self, batch, priority=False):
+        COALESCER_BATCH_SIZE.observe(len(batch))
+        # This shared batch's own counters; every caller waiting on it gets its retries
+        sent = BatchStats()
+        try:
+            results = self.client.fetch(batch, sent, priority=priority)['results']
+            error = None
+            self.stats.record(len(batch))
+        except Exception as e:
+            results = None
+            error = e
+        self.stats.record_retry(sent.retries)
+        with self.lock:
+            futures = [self.in_flight.pop(target) for target in batch]
+            self.sending -= 1
+            self.ready.notify()
+        for i, future in enumerate(futures):
+            future.sent = sent
+            if error is not None:
+                future.set_exception(error)
+            else:
+                # Moz returns one result per target, in request order
+                future.set_result(results[i] if i < len(results) else None)
+
+    def fetch(self, targets, stats=None, timeout=None, priority=True, on_late=None):
+        # Drop-in for MozClient.fetch: {"results": [...]} in the order of `targets`, sent ahead
+        # of queued fetch_batches work unless priority=False. Raises
+        # concurrent.futures.TimeoutError if the results take longer than `timeout`; the
+        # lookups still finish, and on_late([(target, record), ...]) then gets the ones that succeeded.
+        futures = self.submit(targets, priority)
+        with telemetry.span('moz_wait'):
+            _, not_done = wait(futures, timeout)
+        if not_done:
+            if on_late is not None:
+                self.when_done(targets, futures, on_late)
+            raise TimeoutError()
+        if stats is not None:
+            stats.record_retry(self.retries(futures))
+        results = [future.result() for future in futures]
+        if stats is not None:
+            stats.record(len(targets))
+        return {"results": results}
+
+    @staticmethod
+    def retries(futures, counted=None):
+        # Retries of the distinct shared batches that answered these (finished) futures,
+        # skipping batches already in `counted` (and adding the new ones to it)
+        counted = counted if counted is not None else weakref.WeakSet()
+        retries = 0
+        for future in futures:
+            if future.sent not in counted:
+                counted.add(future.sent)
+                retries += future.sent.retries
+        return retries
+
+    @staticmethod
+    def when_done(targets, futures, callback):
+        # callback([(target, record), ...]) once every future has finished, successful ones only
+        left = [len(futures)]
+        lock = threading.Lock()
+
+        def done(_):
+            with lock:
+                left[0] -= 1
+                if left[0]:
+                    return
+            results = [(target, future.result()) for target, future in zip(targets, futures)
+                       if future.exception() is None]
+            if results:
+                callback(results)
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    def fetch_batches(self, targets, stats=None, on_error=None):
+        # Drop-in for MozClient.fetch_batches; the caller's batches are queued together with
+        # everyone else's, and yielded in order once all of their targets have come back
+        stats = stats if stats is not None else BatchStats()
+        max_in_flight = self.client.concurrency * 2
+        pending = collections.deque()
+        counted = weakref.WeakSet()  # shared batches whose retries are already in `stats`
+        for batch in itertools.chain(iter_batches(targets, self.client.batch_size), [None]):
+            if batch is not None:
+                pending.append((batch, self.submit(batch)))
+                if len(pending) < max_in_flight:
+                    continue
+            while pending and (batch is None or len(pending) >= max_in_flight):
+                batch_done, futures = pending.popleft()
+                with telemetry.span('moz_wait'):
+                    wait(futures)
+                stats.record_retry(self.retries(futures, counted))
+                error = next((future.exception() for future in futures if future.exception()), None)
+                if error is not None:
+                    if on_error is None or not isinstance(error, MozError):
+                        raise error
+                    on_error(batch_done, error)
+                    continue
+                stats.record(len(batch_done))
+                yield batch_done, {"results": [future.result() for future in futures]}
+
+    def as_dict(self):
+        with self.lock:
+            queued = len(self.urgent.targets) + len(self.bulk.targets)
+            in_flight = len(self.in_flight)
+        return dict(self.stats.as_dict(), coalesced=self.coalesced, queued=queued, in_flight=in_flight)
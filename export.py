@@ -0,0 +1,256 @@
+"""Streaming exports of row chunks as CSV, NDJSON, XLSX or Parquet.
+
+Every writer consumes an iterable of row chunks (lists of dicts) and yields
+bytes as it goes, so only one chunk is ever held in memory.
+"""
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+READ_BLOCK = 64 * 1024
+
+
+def cell(value):
+    # Nested Moz values (lists/dicts) are written as JSON text in flat formats
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def iter_csv(chunks, columns):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    for rows in chunks:
+        for row in rows:
+            writer.writerow({name: cell(row.get(name)) for name in columns})
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    # A header-only export still sends the header
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def iter_ndjson(chunks, columns=None):
+    for rows in chunks:
+        lines = []
+        for row in rows:
+            if columns is not None:
+                row = {name: row.get(name) for name in columns}
+            lines.append(json.dumps(row, default=str))
+        if lines:
+            yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def iter_file(path):
+    # Stream a finished temp file back in blocks, removing it afterwards
+    try:
+        with open(path, 'rb') as f:
+            while True:
+                block = f.read(READ_BLOCK)
+                if not block:
+                    return
+                yield block
+    finally:
+        os.remove(path)
+
+
+def iter_xlsx(chunks, columns):
+    # openpyxl's write-only workbook spools rows to disk, so memory stays flat;
+    # the zip container is only complete once every row is written
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('export')
+    sheet.append(columns)
+    for rows in chunks:
+        for row in rows:
+            sheet.append([cell(row.get(name)) for name in columns])
+
+    fd, path = tempfile.mkstemp(suffix='.xlsx')
+    os.close(fd)
+    workbook.save(path)
+    yield from iter_file(path)
+
+
+class ChunkSink(io.RawIOBase):
+    # Write-only file object that hands written bytes back to a generator
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def arrow_type(column_type):
+    # Arrow type for a SQLAlchemy column type; anything unusual is written as text
+    import pyarrow as pa
+    from sqlalchemy import BigInteger, Boolean, Float, Integer, SmallInteger
+
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, SmallInteger):
+        return pa.int16()
+    if isinstance(column_type, (Integer, BigInteger)):
+        return pa.int64()
+    if isinstance(column_type, Float):
+        return pa.float64()
+    return pa.string()
+
+
+def table_schema(table, columns):
+    # Parquet schema of a database table's columns, so NULL-only chunks still get the right types
+    import pyarrow as pa
+
+    return pa.schema([(name, arrow_type(table.c[name].type)) for name in columns])
+
+
+def merge_type(current, new):
+    # Widest of two inferred Arrow types: NULL takes the other, ints widen to floats,
+    # and anything else that disagrees becomes text
+    import pyarrow as pa
+
+    if current is None or pa.types.is_null(current):
+        return new
+    if pa.types.is_null(new) or current == new:
+        return current
+    if pa.types.is_integer(current) and pa.types.is_integer(new):
+        return pa.int64()
+    numeric = (pa.types.is_integer, pa.types.is_floating)
+    if any(check(current) for check in numeric) and any(check(new) for check in numeric):
+        return pa.float64()
+    return pa.string()
+
+
+def spool_rows(chunks, columns):
+    # Rows without a table (job results) are written to a temp file while their column
+    # types are merged over every chunk; returns (path, schema)
+    import pyarrow as pa
+
+    types = dict.fromkeys(columns)
+    fd, path = tempfile.mkstemp(suffix='.ndjson')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for rows in chunks:
+            if not rows:
+                continue
+            rows = [{name: cell(row.get(name)) for name in columns} for row in rows]
+            inferred = pa.Table.from_pylist(rows).schema
+            for name in columns:
+                types[name] = merge_type(types[name], inferred.field(name).type)
+            f.write(json.dumps(rows, default=str) + '\n')
+    schema = pa.schema([(name, pa.string() if types[name] is None or pa.types.is_null(types[name])
+                         else types[name]) for name in columns])
+    return path, schema
+
+
+def iter_spooled(path, schema):
+    # Chunks back from spool_rows, with values of columns merged to text turned into text
+    import pyarrow as pa
+
+    text = [field.name for field in schema if pa.types.is_string(field.type)]
+    try:
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                rows = json.loads(line)
+                for row in rows:
+                    for name in text:
+                        if row[name] is not None and not isinstance(row[name], str):
+                            row[name] = json.dumps(row[name])
+                yield rows
+    finally:
+        os.remove(path)
+
+
+def iter_parquet(chunks, columns, table=None):
+    # One Parquet row group per chunk. With `table` the schema comes from its column types
+    # and chunks are sent as soon as they are encoded; schemaless rows are spooled first so
+    # a column that is NULL (or an int) early on can still hold other values later.
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    if table is not None:
+        schema = table_schema(table, columns)
+    else:
+        path, schema = spool_rows(chunks, columns)
+        chunks = iter_spooled(path, schema)
+
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in chunks:
+        if not rows:
+            continue
+        rows = [{name: cell(row.get(name)) for name in columns} for row in rows]
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+WRITERS = {
+    'csv': iter_csv,
+    'ndjson': iter_ndjson,
+    'xlsx': iter_xlsx,
+    'parquet': iter_parquet,
+}
+
+
+def export_stream(fmt, chunks, columns, table=None):
+    # (bytes generator, mimetype, file extension) for one of FORMATS; `table` (the rows'
+    # SQLAlchemy table, if any) gives Parquet its column types
+    if fmt not in FORMATS:
+        raise ValueError(f"'format' must be one of: {', '.join(FORMATS)}")
+    if fmt == 'parquet':
+        # Fail before the response starts rather than halfway through it
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError:
+            raise ValueError("Parquet export needs pyarrow installed on the server")
+    mimetype, extension = FORMATS[fmt]
+    if fmt == 'parquet':
+        return iter_parquet(chunks, columns, table), mimetype, extension
+    return WRITERS[fmt](chunks, columns), mimetype, extension
+
+
+def peek_columns(chunks):
+    # Columns for schemaless rows (job results): the keys of the first chunk, in order
+    chunks = iter(chunks)
+    first = next(chunks, [])
+    columns = list(dict.fromkeys(name for row in first for name in row))
+
+    def rest():
+        yield first
+        yield from chunks
+
+    return columns, rest()
+
+
+def export_filename(name, extension):
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y%m%d-%H%M%S')
+    return f"{name}-{stamp}.{extension}"
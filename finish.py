@@ -5,13 +5,22 @@ from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import Select
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+import logging
 import time
+import os
+from dotenv import load_dotenv
 from sqlalchemy import create_engine, Column, Integer, String
 from sqlalchemy.orm import declarative_base, sessionmaker
 import gspread
 from google.oauth2.service_account import Credentials
+from incremental import DOMAIN_NAMES, DomainTracker, seen_domains_table
+import telemetry
+load_dotenv()
+# Same LOG_LEVEL / LOG_FORMAT handling as the API
+telemetry.configure_logging(os.getenv("LOG_LEVEL", "INFO"), os.getenv("LOG_FORMAT", "text"))
+log = logging.getLogger('finish')
 # Set up MySQL and SQLAlchemy
-DATABASE_URI = 'mysql+mysqlconnector://root:@localhost/domain'  # Change with your database credentials
+DATABASE_URI = os.getenv("DATABASE_URL", 'mysql+mysqlconnector://root:@localhost/domain')  # Change with your database credentials
 Base = declarative_base()
 # Define the DomainName class (ORM)
 class DomainName(Base):
@@ -21,11 +30,15 @@ class DomainName(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)  # Automatically increment the primary key
     domain = Column(String(255), unique=True, nullable=False)
 
+# Domains this script has written before (its own marker, separate from /start-scrape's), so only new ones are written
+seen_domains = seen_domains_table(Base.metadata)
+
 # Create a new database session
 engine = create_engine(DATABASE_URI)
 Base.metadata.create_all(engine)  # Create the table in MySQL (if it doesn't exist)
 Session = sessionmaker(bind=engine)
 session = Session()
+tracker = DomainTracker(engine, seen_domains, DOMAIN_NAMES)
 # Set up Google Sheets API
 def setup_google_sheets():
     # Define the scope
@@ -36,7 +49,7 @@ def setup_google_sheets():
     creds = Credentials.from_service_account_file(r"cred.json", scopes=scope)
     client = gspread.authorize(creds)
     # Open the spreadsheet by URL
-    spreadsheet_url = "https://docs.google.com/spreadsheets/d/1zgohni2jlZNw7ybXeSTvJ2kb4mBGRGl6OLqpP-VyRQM/edit?usp=sharing"  # Replace with your spreadsheet URL
+    spreadsheet_url = os.getenv("SPREADSHEET_URL", "https://docs.google.com/spreadsheets/d/1zgohni2jlZNw7ybXeSTvJ2kb4mBGRGl6OLqpP-VyRQM/edit?usp=sharing")
     sheet = client.open_by_url(spreadsheet_url).sheet1  # Use the first sheet
     return sheet
 
@@ -49,7 +62,7 @@ options.add_argument("--disable-dev-shm-usage")
 driver = webdriver.Chrome(service=Service(ChromeDriverManager().install()), options=options)
 
 # Go to the URL you want to scrape
-url = "https://whc.ca/domain-names/auctions/"  # Replace with the URL of the website you want to scrape
+url = os.getenv("AUCTION_URL", "https://whc.ca/domain-names/auctions/")
 driver.get(url)
 wait = WebDriverWait(driver, 10)
 
@@ -73,30 +86,36 @@ try:
         # Extract domain names
         domainname_elements = driver.find_elements(By.XPATH, "//div[@domainname]")
         domainnames = [element.get_attribute('domainname') for element in domainname_elements]
-        
-        # Save domain names to Google Sheet
-        rows_to_add = [[domain] for domain in domainnames]
-        print(rows_to_add)
-        # # Append multiple rows at once
-        sheet.append_rows(rows_to_add)  # Append the list of ro
-        print("Domain names saved to Google Sheet.")
-        rows_to_add = [DomainName(domain=domain) for domain in domainnames]
-        session.add_all(rows_to_add)
-        session.commit()  # Commit the session to MySQL
-        print(f"Domain names saved to MySQL: {domainnames}")
+
+        # Only domains not seen by an earlier run are written, and marked seen once both writes succeeded
+        page = tracker.clean(domainnames)
+        domainnames = tracker.unseen(page)
+        if domainnames:
+            # Save domain names to Google Sheet
+            rows_to_add = [[domain] for domain in domainnames]
+            log.debug("New domains: %s", domainnames)
+            # # Append multiple rows at once
+            sheet.append_rows(rows_to_add)  # Append the list of ro
+            log.info("Saved %d domain names to Google Sheet", len(domainnames))
+            rows_to_add = [DomainName(domain=domain) for domain in domainnames]
+            session.add_all(rows_to_add)
+            session.commit()  # Commit the session to MySQL
+            log.info("Saved %d domain names to MySQL", len(domainnames))
+        tracker.mark(page)
         # Check if the "Next" button is available
         try:
             next_button = wait.until(EC.element_to_be_clickable((By.XPATH, "//a[@class='page-link' and @aria-label='Next']")))
             next_button.click()
-            print("Navigated to the next page.")
+            log.info("Navigated to the next page")
             time.sleep(10)  # Wait for the next page to load
         except Exception as e:
-            print(f"Next button is disabled or not found. Error: {e}. Exiting the loop.")
+            log.info("Next button is disabled or not found (%s); exiting the loop", e)
             break  # Exit the loop if no next button is found
 
 except Exception as e:
-    print("An error occurred:", e)
+    log.exception("An error occurred: %s", e)
 
 finally:
     # Close the browser
     driver.quit()
+    log.info("New domains: %d. Removed since the last run: %s", tracker.added, tracker.removed())
@@ -0,0 +1,48 @@
+# gunicorn -c gunicorn.conf.py wsgi:application
+import glob
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}")
+# Workers share one Moz rate limit (see MOZ_LIMITER_DB) but coalesce and cache separately. The app
+# mostly waits on I/O, so a few threaded workers are enough; each one also gets its share of
+# DB_MAX_CONNECTIONS, which api.py reads the same GUNICORN_WORKERS default for
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+# Threaded workers: requests mostly wait on Moz, the database or Google Sheets
+worker_class = 'gthread'
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+# Background jobs run inside the workers, so they are not recycled after N requests
+max_requests = 0
+accesslog = os.getenv("GUNICORN_ACCESS_LOG", "-")
+errorlog = '-'
+
+
+def on_starting(server):
+    # Once, in the master before any worker starts. Workers write their metric totals to
+    # METRICS_DIR so /metrics can add them up; totals of the last server run are cleared.
+    metrics_dir = os.getenv("METRICS_DIR") or tempfile.mkdtemp(prefix='domain-metrics-')
+    os.environ["METRICS_DIR"] = metrics_dir
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in glob.glob(os.path.join(metrics_dir, '*.json')):
+        os.remove(path)
+
+    # Jobs left running by the last shutdown go back to the queue. The app is not imported here.
+    from jobs import JobQueue
+
+    requeued = JobQueue(os.getenv("JOB_DB_PATH", "jobs.db"), workers=1).requeue_interrupted()
+    if requeued:
+        server.log.info("Requeued %d interrupted jobs", requeued)
+
+
+def post_worker_init(worker):
+    # Every worker offers to run the queued jobs; JobQueue.claim hands each one to a single worker
+    import api
+
+    api.job_queue.run_queued()
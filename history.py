@@ -0,0 +1,197 @@
+import datetime
+import time
+
+from sqlalchemy import Column, Float, Index, Integer, SmallInteger, String, Table, func, select
+
+import telemetry
+from scoring import METRICS
+from storage import BulkWriter
+
+# Metrics whose threshold crossings are recorded as alerts
+ALERT_METRICS = ('domain_authority', 'spam_score')
+
+HISTORY_SNAPSHOTS = telemetry.counter('history_snapshots_total', 'Domain metric snapshots stored')
+HISTORY_ALERTS = telemetry.counter('history_alerts_total', 'Threshold crossings recorded', ['metric', 'direction'])
+
+
+def domain_history_table(metadata):
+    # One row per root domain per change, keyed (root_domain, ts) so a domain's history is one
+    # contiguous index range; the ts index serves date-range scans across all domains
+    return Table(
+        'domain_history', metadata,
+        Column('root_domain', String(255), primary_key=True),
+        Column('ts', Integer, primary_key=True, autoincrement=False),  # Unix time Moz was queried
+        Column('domain_authority', SmallInteger, nullable=True),
+        Column('page_authority', SmallInteger, nullable=True),
+        Column('spam_score', SmallInteger, nullable=True),
+        Column('link_propensity', Float, nullable=True),
+        Column('external_pages_to_page', Integer, nullable=True),
+        Index('ix_domain_history_ts', 'ts'),
+    )
+
+
+def domain_alerts_table(metadata):
+    # A domain_authority or spam_score that moved across a configured threshold between two snapshots
+    return Table(
+        'domain_alerts', metadata,
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('root_domain', String(255), nullable=False),
+        Column('ts', Integer, nullable=False),
+        Column('metric', String(32), nullable=False),
+        Column('threshold', Integer, nullable=False),
+        Column('direction', String(4), nullable=False),  # 'up' or 'down'
+        Column('previous', Integer, nullable=True),
+        Column('current', Integer, nullable=True),
+        Index('ix_domain_alerts_ts', 'ts'),
+        Index('ix_domain_alerts_root_domain_ts', 'root_domain', 'ts'),
+    )
+
+
+def parse_thresholds(value):
+    # "20,30,40" -> [20, 30, 40]
+    return sorted({int(item) for item in (value or '').split(',') if item.strip()})
+
+
+def parse_timestamp(value, name):
+    # Unix seconds or an ISO 8601 date/time (UTC unless it carries an offset)
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be Unix seconds or an ISO 8601 date")
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return int(parsed.timestamp())
+
+
+def same(before, after):
+    # Floats are compared rounded, as MySQL FLOAT columns do not return exactly what was written
+    if isinstance(before, float) and isinstance(after, float):
+        return round(before, 4) == round(after, 4)
+    return before == after
+
+
+def crossings(root_domain, ts, previous, current, thresholds):
+    # Alerts for every threshold the metrics moved across; a value reaching the threshold counts as crossing it
+    alerts = []
+    for metric in ALERT_METRICS:
+        before, after = previous.get(metric), current.get(metric)
+        if before is None or after is None:
+            continue
+        for threshold in thresholds.get(metric, ()):
+            if before < threshold <= after:
+                direction = 'up'
+            elif after < threshold <= before:
+                direction = 'down'
+            else:
+                continue
+            alerts.append({"root_domain": root_domain, "ts": ts, "metric": metric, "threshold": threshold,
+                           "direction": direction, "previous": before, "current": after})
+    return alerts
+
+
+def latest_snapshots(conn, table, root_domains):
+    # Newest stored snapshot of each root domain, one index range lookup per domain
+    newest = (select(table.c.root_domain, func.max(table.c.ts).label('ts'))
+              .where(table.c.root_domain.in_(root_domains))
+              .group_by(table.c.root_domain)
+              .subquery())
+    rows = conn.execute(
+        select(table).join(newest, (table.c.root_domain == newest.c.root_domain) & (table.c.ts == newest.c.ts))
+    ).mappings().all()
+    return {row['root_domain']: dict(row) for row in rows}
+
+
+def record_snapshots(engine, history_table, alerts_table, snapshots, thresholds):
+    # Store the snapshots whose metrics differ from the domain's latest one and record the
+    # threshold crossings between them. Unchanged values are not stored again: a domain's
+    # metrics at any time are those of its latest snapshot at or before that time.
+    stored = []
+    alerts = []
+    snapshots = list(snapshots)
+    for i in range(0, len(snapshots), 500):
+        chunk = snapshots[i:i + 500]
+        with engine.connect() as conn:
+            latest = latest_snapshots(conn, history_table, [snapshot['root_domain'] for snapshot in chunk])
+        for snapshot in chunk:
+            previous = latest.get(snapshot['root_domain'])
+            if previous is not None:
+                if previous['ts'] > snapshot['ts']:
+                    continue  # Older than what is stored already
+                if all(same(previous[name], snapshot.get(name)) for name in METRICS):
+                    continue
+                alerts.extend(crossings(snapshot['root_domain'], snapshot['ts'], previous, snapshot, thresholds))
+            stored.append(dict({name: snapshot.get(name) for name in METRICS},
+                               root_domain=snapshot['root_domain'], ts=snapshot['ts']))
+            latest[snapshot['root_domain']] = stored[-1]
+
+    if stored:
+        with BulkWriter(engine, history_table, ['root_domain', 'ts'], flush_rows=len(stored) + 1) as writer:
+            writer.extend(stored)
+        HISTORY_SNAPSHOTS.inc(len(stored))
+    if alerts:
+        with engine.begin() as conn:
+            conn.execute(alerts_table.insert(), alerts)
+        for alert in alerts:
+            HISTORY_ALERTS.inc(metric=alert['metric'], direction=alert['direction'])
+    return len(stored), len(alerts)
+
+
+def with_deltas(snapshots, baseline=None):
+    # Each snapshot with `delta`: the change of every metric since the snapshot before it
+    result = []
+    previous = baseline
+    for snapshot in snapshots:
+        delta = None
+        if previous is not None:
+            delta = {
+                name: None if snapshot[name] is None or previous[name] is None
+                else round(snapshot[name] - previous[name], 4)
+                for name in METRICS
+            }
+        result.append(dict(snapshot, delta=delta))
+        previous = snapshot
+    return result
+
+
+def domain_history(engine, table, root_domain, start=0, end=None, limit=500):
+    # Snapshots of one domain with start <= ts <= end, oldest first. The snapshot before
+    # `start` (if any) is the baseline for the first delta and the value in force at `start`.
+    end = end if end is not None else int(time.time())
+    columns = [table.c.ts] + [table.c[name] for name in METRICS]
+    with engine.connect() as conn:
+        rows = conn.execute(
+            select(*columns)
+            .where(table.c.root_domain == root_domain, table.c.ts >= start, table.c.ts <= end)
+            .order_by(table.c.ts)
+            .limit(limit)
+        ).mappings().all()
+        baseline = conn.execute(
+            select(*columns)
+            .where(table.c.root_domain == root_domain, table.c.ts < start)
+            .order_by(table.c.ts.desc())
+            .limit(1)
+        ).mappings().first()
+    baseline = dict(baseline) if baseline is not None else None
+    return {
+        "root_domain": root_domain,
+        "start": start,
+        "end": end,
+        "baseline": baseline,
+        "snapshots": with_deltas([dict(row) for row in rows], baseline),
+    }
+
+
+def recent_alerts(engine, table, since, metric=None, direction=None, limit=500):
+    # Threshold crossings recorded at or after `since`, newest first
+    stmt = select(table).where(table.c.ts >= since)
+    if metric:
+        stmt = stmt.where(table.c.metric == metric)
+    if direction:
+        stmt = stmt.where(table.c.direction == direction)
+    with engine.connect() as conn:
+        rows = conn.execute(stmt.order_by(table.c.ts.desc(), table.c.id.desc()).limit(limit)).mappings().all()
+    return [dict(row) for row in rows]
@@ -0,0 +1,146 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlparse
+from urllib.request import url2pathname
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from lxml import html as lxml_html
+except ImportError:  # lxml is optional, the stdlib parser is slower but works
+    lxml_html = None
+
+
+# Upper bound on listing pages followed in one scrape, whatever the Next links say
+MAX_PAGES = 1000
+
+
+def is_disabled(attrs):
+    return 'disabled' in (attrs.get('class') or '').split() or attrs.get('aria-disabled') == 'true'
+
+
+def next_link(href, disabled):
+    # A disabled Next link, or one pointing nowhere ("#"), means this is the last page
+    if disabled or not href or href.startswith('#'):
+        return None
+    return href
+
+
+class ListingParser(HTMLParser):
+    # Fallback parser collecting div[domainname] values and the Next link
+    def __init__(self):
+        super().__init__()
+        self.domains = []
+        self.next_href = None
+        self.item_disabled = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'div' and attrs.get('domainname'):
+            self.domains.append(attrs['domainname'])
+        elif tag == 'li':
+            self.item_disabled = is_disabled(attrs)
+        elif (tag == 'a' and 'page-link' in (attrs.get('class') or '').split()
+              and attrs.get('aria-label') == 'Next'):
+            self.next_href = next_link(attrs.get('href'), is_disabled(attrs) or self.item_disabled)
+
+    def handle_endtag(self, tag):
+        if tag == 'li':
+            self.item_disabled = False
+
+
+def parse_listing(text):
+    # Return (domains, next_href) for one auction listing page
+    if not text.strip():
+        return [], None
+    if lxml_html is not None:
+        tree = lxml_html.fromstring(text)
+        domains = tree.xpath('//div/@domainname')
+        next_href = None
+        links = tree.xpath("//a[contains(concat(' ', normalize-space(@class), ' '), ' page-link ') "
+                           "and @aria-label='Next']")
+        if links:
+            link = links[0]
+            parent = link.getparent()
+            disabled = is_disabled(link.attrib) or (parent is not None and parent.tag == 'li'
+                                                    and is_disabled(parent.attrib))
+            next_href = next_link(link.get('href'), disabled)
+        return [str(domain) for domain in domains if domain], next_href
+    parser = ListingParser()
+    parser.feed(text)
+    return parser.domains, parser.next_href
+
+
+class HttpListingScraper:
+    """Scrapes the auction listing HTML with plain HTTP requests instead of a browser."""
+
+    def __init__(self, timeout=15, workers=1, max_pages=MAX_PAGES):
+        self.timeout = timeout
+        self.workers = max(int(workers), 1)
+        self.max_pages = max_pages
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'User-Agent': 'Mozilla/5.0 (compatible; domain-authority-scraper)'})
+
+    def fetch(self, url):
+        parsed = urlparse(url)
+        if parsed.scheme == 'file':
+            # Local fixtures are read straight from disk
+            path = url2pathname(parsed.path)
+            if not os.path.exists(path):
+                return ''
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        response = self.session.get(url, timeout=self.timeout)
+        if response.status_code == 404:
+            return ''
+        response.raise_for_status()
+        return response.text
+
+    def scrape_by_links(self, on_page, url):
+        # Follow the Next link from page to page, stopping at a link back to a page already seen
+        page = 0
+        visited = set()
+        while url and url not in visited and page < self.max_pages:
+            visited.add(url)
+            domainnames, next_href = parse_listing(self.fetch(url))
+            if not domainnames:
+                break
+            page += 1
+            if on_page(page, domainnames) is False:
+                break
+            url = urljoin(url, next_href).split('#')[0] if next_href else None
+        return page
+
+    def fetch_page(self, page_url, page, per_page):
+        return parse_listing(self.fetch(page_url.format(page=page, per_page=per_page)))[0]
+
+    def scrape_by_url(self, on_page, page_url, per_page):
+        # Fetch pages by number on several threads, delivering them in page order
+        page = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            next_page = 1
+            pending = {}
+            while page < self.max_pages:
+                while len(pending) < self.workers:
+                    pending[next_page] = executor.submit(self.fetch_page, page_url, next_page, per_page)
+                    next_page += 1
+                domainnames = pending.pop(page + 1).result()
+                if not domainnames:
+                    break
+                page += 1
+                if on_page(page, domainnames) is False:
+                    break
+            for future in pending.values():
+                future.cancel()
+        return page
+
+    def scrape(self, on_page, url, page_url=None, per_page=100):
+        # Same contract as scraper.scrape: on_page(page_number, domains), returns the page count
+        if page_url:
+            return self.scrape_by_url(on_page, page_url, per_page)
+        return self.scrape_by_links(on_page, url)
@@ -0,0 +1,99 @@
+import time
+
+from sqlalchemy import Column, Integer, String, Table, UniqueConstraint, func, select
+
+# Sinks keep separate seen markers, so a domain written by one is still new to the others
+SHEET = 'sheet'
+DOMAIN_NAMES = 'domain_names'
+PIPELINE = 'pipeline'
+
+
+def seen_domains_table(metadata):
+    # Every domain each sink has seen, stamped with the start time of the runs that saw it
+    return Table(
+        'seen_domains', metadata,
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('sink', String(32), nullable=False, server_default=SHEET),
+        Column('domain', String(255), nullable=False),
+        Column('first_seen', Integer, nullable=False, index=True),
+        Column('last_seen', Integer, nullable=False, index=True),
+        UniqueConstraint('sink', 'domain', name='uq_seen_domains_sink_domain'),
+    )
+
+
+class DomainTracker:
+    """Tracks which scraped domains are new to one sink for one scrape run.
+
+    All domains seen during a run get `last_seen` set to the run's start time, so
+    the previous run is simply the sink's largest earlier `last_seen` value.
+    """
+
+    def __init__(self, engine, table, sink=SHEET):
+        self.engine = engine
+        self.table = table
+        self.sink = sink
+        with engine.connect() as conn:
+            self.previous_run = conn.execute(
+                select(func.max(table.c.last_seen)).where(table.c.sink == sink)
+            ).scalar()
+        # Keep run stamps strictly increasing even if two runs start within a second
+        self.run_started = max(int(time.time()), (self.previous_run or 0) + 1)
+        self.added = 0
+        self.seen = 0
+
+    def unseen(self, domains):
+        # The domains of a page this sink has never seen, in page order, without recording them
+        page = self.clean(domains)
+        if not page:
+            return []
+        with self.engine.connect() as conn:
+            known = self.known(conn, page)
+        self.seen += len(page)
+        return [domain for domain in page if domain not in known]
+
+    def mark(self, domains):
+        # Record domains as seen once the sink has safely stored them; returns how many were new
+        page = self.clean(domains)
+        new = []
+        for i in range(0, len(page), 500):
+            with self.engine.begin() as conn:
+                new.extend(self.record(conn, page[i:i + 500]))
+        self.added += len(new)
+        return len(new)
+
+    @staticmethod
+    def clean(domains):
+        return list(dict.fromkeys(domain.strip().lower() for domain in domains if domain and domain.strip()))
+
+    def known(self, conn, page):
+        table = self.table
+        return set(conn.execute(
+            select(table.c.domain).where(table.c.sink == self.sink, table.c.domain.in_(page))
+        ).scalars())
+
+    def record(self, conn, page):
+        # Stamp known domains with this run and insert the new ones; returns the new ones
+        table = self.table
+        known = self.known(conn, page)
+        if known:
+            conn.execute(table.update()
+                         .where(table.c.sink == self.sink, table.c.domain.in_(known))
+                         .values(last_seen=self.run_started))
+        new = [domain for domain in page if domain not in known]
+        if new:
+            conn.execute(table.insert(), [
+                {"sink": self.sink, "domain": domain, "first_seen": self.run_started,
+                 "last_seen": self.run_started}
+                for domain in new
+            ])
+        return new
+
+    def removed(self):
+        # Domains listed in the previous run that this run did not see; only valid after a full crawl
+        if self.previous_run is None:
+            return []
+        with self.engine.connect() as conn:
+            return list(conn.execute(
+                select(self.table.c.domain).where(self.table.c.sink == self.sink,
+                                                  self.table.c.last_seen == self.previous_run)
+            ).scalars())
@@ -0,0 +1,40 @@
+import csv
+
+
+def with_blanks_counted(values):
+    # Pass first-column values on as read, blanks included, so TargetFilter can count them as
+    # `empty`; blanks after the last value (trailing empty or formatted-only rows) are left out
+    blanks = []
+    for value in values:
+        if value is None or not str(value).strip():
+            blanks.append(value)
+            continue
+        yield from blanks
+        blanks = []
+        yield value
+
+
+def iter_csv_targets(path):
+    # Stream the first column of a CSV, skipping the header row
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        yield from with_blanks_counted(row[0] if row else '' for row in reader)
+
+
+def iter_xlsx_targets(path):
+    # Stream the first column of the active sheet in read-only mode, skipping the header row
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        yield from with_blanks_counted(value for (value,) in sheet.iter_rows(min_row=2, max_col=1, values_only=True))
+    finally:
+        workbook.close()
+
+
+def iter_targets(path):
+    if path.endswith('.xlsx'):
+        return iter_xlsx_targets(path)
+    return iter_csv_targets(path)
@@ -0,0 +1,366 @@
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+
+log = logging.getLogger(__name__)
+
+JOB_SECONDS = telemetry.histogram('job_seconds', 'Background job run time', ['kind', 'status'])
+
+# Job states stored in the queue database
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT,
+    processed INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status);
+CREATE TABLE IF NOT EXISTS job_results (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+);
+CREATE TABLE IF NOT EXISTS job_checkpoints (
+    job_id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upload_batches (
+    job_id TEXT NOT NULL,
+    batch_no INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    targets TEXT,
+    error TEXT,
+    retryable INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, batch_no)
+);
+CREATE INDEX IF NOT EXISTS ix_upload_batches_status ON upload_batches (job_id, status);
+CREATE TABLE IF NOT EXISTS job_traces (
+    job_id TEXT PRIMARY KEY,
+    trace TEXT NOT NULL
+);
+"""
+
+# Upload batch states; failed batches form the job's dead-letter queue
+BATCH_DONE = 'done'
+BATCH_FAILED = 'failed'
+
+
+
+class Job:
+    """Handle passed to job handlers for reporting progress and partial results."""
+
+    def __init__(self, queue, job_id):
+        self.queue = queue
+        self.id = job_id
+        self.next_seq = queue.count_results(job_id)
+
+    def progress(self, processed, total=None):
+        self.queue.update_progress(self.id, processed, total)
+
+    def update_result(self, result):
+        # Publish an interim result (e.g. live stats) while the job is still running
+        self.queue.set_result(self.id, result)
+
+    def add_results(self, rows):
+        rows = list(rows)
+        if rows:
+            self.queue.append_results(self.id, self.next_seq, rows)
+            self.next_seq += len(rows)
+
+    def checkpoint(self):
+        # State saved by the last save_checkpoint(), or None on a fresh run
+        state = self.queue.checkpoint(self.id)
+        if state is not None:
+            # Results written after the checkpoint belong to work that will be redone
+            self.queue.truncate_results(self.id, state['results'])
+            self.next_seq = state['results']
+        return state
+
+    def save_checkpoint(self, state, batches=()):
+        # Record finished/failed batches and the new checkpoint in one transaction
+        state = dict(state, results=self.next_seq)
+        self.queue.save_checkpoint(self.id, state, batches)
+        return state
+
+    def failed_batches(self, retryable_only=False):
+        return self.queue.failed_batches(self.id, retryable_only)
+
+
+class JobQueue:
+    def __init__(self, path, workers=2, trace=False):
+        self.path = path
+        self.trace = trace
+        self.handlers = {}
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+        telemetry.gauge('jobs', 'Jobs in the queue database by status', ['status'], callback=self.status_counts)
+
+    @contextmanager
+    def connect(self):
+        # A short-lived connection per call keeps this safe to use from any thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def register(self, kind, handler):
+        self.handlers[kind] = handler
+
+    def submit(self, kind, payload):
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job_id = uuid.uuid4().hex
+        with self.connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, kind, QUEUED, json.dumps(payload), time.time())
+            )
+        self.executor.submit(self.run, job_id)
+        return job_id
+
+    def resume(self, job_id):
+        # Re-queue a failed job; every dead-lettered batch gets another chance
+        with self.connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, finished_at = NULL WHERE id = ? AND status = ?',
+                (QUEUED, job_id, FAILED)
+            )
+            if cursor.rowcount == 0:
+                return False
+            conn.execute(
+                'UPDATE upload_batches SET retryable = 1 WHERE job_id = ? AND status = ?',
+                (job_id, BATCH_FAILED)
+            )
+        self.executor.submit(self.run, job_id)
+        return True
+
+    def resume_pending(self):
+        # Jobs left queued or running by a previous process are picked up again
+        self.requeue_interrupted()
+        return self.run_queued()
+
+    def requeue_interrupted(self):
+        # Only safe while no process is running jobs, e.g. once before the workers start
+        with self.connect() as conn:
+            return conn.execute('UPDATE jobs SET status = ? WHERE status = ?', (QUEUED, RUNNING)).rowcount
+
+    def run_queued(self):
+        # Several processes may call this; claim() lets only one of them run each job
+        with self.connect() as conn:
+            rows = conn.execute('SELECT id FROM jobs WHERE status = ? ORDER BY created_at', (QUEUED,)).fetchall()
+        for row in rows:
+            self.executor.submit(self.run, row['id'])
+        return len(rows)
+
+    def claim(self, job_id):
+        # Atomically move a queued job to running so only one worker executes it
+        with self.connect() as conn:
+            cursor = conn.execute(
+                'UPDATE jobs SET status = ?, started_at = ?, error = NULL WHERE id = ? AND status = ?',
+                (RUNNING, time.time(), job_id, QUEUED)
+            )
+            if cursor.rowcount == 0:
+                return None
+            return conn.execute('SELECT kind, payload FROM jobs WHERE id = ?', (job_id,)).fetchone()
+
+    def run(self, job_id):
+        row = self.claim(job_id)
+        if row is None:
+            return
+        handler = self.handlers.get(row['kind'])
+        started = time.perf_counter()
+        status = COMPLETED
+        with telemetry.trace(job_id) if self.trace else nullcontext() as job_trace:
+            log.info("Job %s (%s) started", job_id, row['kind'])
+            try:
+                if handler is None:
+                    raise ValueError(f"Unknown job kind: {row['kind']}")
+                result = handler(Job(self, job_id), json.loads(row['payload']))
+            except Exception as e:
+                status = FAILED
+                log.exception("Job %s (%s) failed", job_id, row['kind'])
+                # MozError and friends carry the upstream response body in `message`
+                message = getattr(e, 'message', None)
+                self.finish(job_id, FAILED, error=f"{e} - {message}" if message else str(e))
+            else:
+                self.finish(job_id, COMPLETED, result=result)
+            seconds = time.perf_counter() - started
+            JOB_SECONDS.observe(seconds, kind=row['kind'], status=status)
+            log.info("Job %s (%s) %s in %.2fs", job_id, row['kind'], status, seconds)
+            if job_trace is not None:
+                self.save_trace(job_id, job_trace.as_dict())
+
+    def finish(self, job_id, status, result=None, error=None):
+        # A failed job keeps the last interim result it published
+        with self.connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET status = ?, result = COALESCE(?, result), error = ?, finished_at = ? WHERE id = ?',
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+
+    def set_result(self, job_id, result):
+        with self.connect() as conn:
+            conn.execute('UPDATE jobs SET result = ? WHERE id = ?', (json.dumps(result), job_id))
+
+    def update_progress(self, job_id, processed, total=None):
+        with self.connect() as conn:
+            conn.execute(
+                'UPDATE jobs SET processed = ?, total = COALESCE(?, total) WHERE id = ?',
+                (processed, total, job_id)
+            )
+
+    def append_results(self, job_id, start_seq, rows):
+        with self.connect() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO job_results (job_id, seq, data) VALUES (?, ?, ?)',
+                [(job_id, start_seq + i, json.dumps(row)) for i, row in enumerate(rows)]
+            )
+
+    def count_results(self, job_id):
+        with self.connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM job_results WHERE job_id = ?', (job_id,)).fetchone()[0]
+
+    def results(self, job_id, offset=0, limit=1000):
+        with self.connect() as conn:
+            rows = conn.execute(
+                'SELECT data FROM job_results WHERE job_id = ? AND seq >= ? ORDER BY seq LIMIT ?',
+                (job_id, offset, limit)
+            ).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def save_trace(self, job_id, trace):
+        with self.connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO job_traces (job_id, trace) VALUES (?, ?)', (job_id, json.dumps(trace)))
+
+    def load_trace(self, job_id):
+        with self.connect() as conn:
+            row = conn.execute('SELECT trace FROM job_traces WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row['trace']) if row else None
+
+    def status_counts(self):
+        # Queue depth for the metrics endpoint
+        with self.connect() as conn:
+            rows = conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        counts = {(status,): 0 for status in (QUEUED, RUNNING, COMPLETED, FAILED)}
+        counts.update({(row[0],): row[1] for row in rows})
+        return counts
+
+    def truncate_results(self, job_id, seq):
+        with self.connect() as conn:
+            conn.execute('DELETE FROM job_results WHERE job_id = ? AND seq >= ?', (job_id, seq))
+
+    def checkpoint(self, job_id):
+        with self.connect() as conn:
+            row = conn.execute('SELECT state FROM job_checkpoints WHERE job_id = ?', (job_id,)).fetchone()
+        return json.loads(row['state']) if row else None
+
+    def save_checkpoint(self, job_id, state, batches=()):
+        # batches: dicts with batch_no, status, size and, for failed ones, targets/error/retryable
+        now = time.time()
+        with self.connect() as conn:
+            for batch in batches:
+                failed = batch['status'] == BATCH_FAILED
+                conn.execute(
+                    'INSERT INTO upload_batches (job_id, batch_no, status, size, targets, error, retryable, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (job_id, batch_no) DO UPDATE SET status = excluded.status, '
+                    'targets = excluded.targets, error = excluded.error, retryable = excluded.retryable, '
+                    'attempts = upload_batches.attempts + 1, updated_at = excluded.updated_at',
+                    (job_id, batch['batch_no'], batch['status'], batch['size'],
+                     json.dumps(batch['targets']) if failed else None,
+                     batch.get('error'), int(bool(batch.get('retryable'))), now)
+                )
+            conn.execute(
+                'INSERT OR REPLACE INTO job_checkpoints (job_id, state, updated_at) VALUES (?, ?, ?)',
+                (job_id, json.dumps(state), now)
+            )
+
+    def failed_batches(self, job_id, retryable_only=False):
+        sql = 'SELECT batch_no, size, targets, error, retryable, attempts FROM upload_batches WHERE job_id = ? AND status = ?'
+        if retryable_only:
+            sql += ' AND retryable = 1'
+        with self.connect() as conn:
+            rows = conn.execute(sql + ' ORDER BY batch_no', (job_id, BATCH_FAILED)).fetchall()
+        return [dict(row, targets=json.loads(row['targets'])) for row in rows]
+
+    def batch_summary(self, job_id):
+        with self.connect() as conn:
+            counts = dict(conn.execute(
+                'SELECT status, COUNT(*) FROM upload_batches WHERE job_id = ? GROUP BY status', (job_id,)
+            ).fetchall())
+            errors = conn.execute(
+                'SELECT batch_no, size, error, attempts FROM upload_batches WHERE job_id = ? AND status = ? '
+                'ORDER BY batch_no LIMIT 100', (job_id, BATCH_FAILED)
+            ).fetchall()
+        if not counts:
+            return None
+        return {
+            "done": counts.get(BATCH_DONE, 0),
+            "failed": counts.get(BATCH_FAILED, 0),
+            "failed_batches": [dict(row) for row in errors],
+        }
+
+    def iter_results(self, job_id, chunk_size=1000):
+        # All stored results in order, a chunk at a time
+        offset = 0
+        while True:
+            rows = self.results(job_id, offset, chunk_size)
+            if not rows:
+                return
+            yield rows
+            offset += len(rows)
+
+    def get(self, job_id, offset=0, limit=1000):
+        with self.connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        # Throughput is measured from the moment a worker picked the job up
+        end = row['finished_at'] or time.time()
+        elapsed = end - row['started_at'] if row['started_at'] else 0.0
+        results = self.results(job_id, offset, limit)
+        return {
+            "job_id": row['id'],
+            "kind": row['kind'],
+            "status": row['status'],
+            "processed": row['processed'],
+            "total": row['total'],
+            "elapsed_seconds": round(elapsed, 3),
+            "rows_per_sec": round(row['processed'] / elapsed, 2) if elapsed > 0 else 0.0,
+            "result": json.loads(row['result']) if row['result'] else None,
+            "error": row['error'],
+            "batches": self.batch_summary(job_id),
+            "trace": self.load_trace(job_id),
+            "results": results,
+            "results_offset": offset,
+            "next_offset": offset + len(results),
+        }
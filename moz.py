@@ -0,0 +1,314 @@
+import itertools
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import telemetry
+
+# Moz Links API v2 endpoint used for url metrics
+MOZ_URL_METRICS = 'https://lsapi.seomoz.com/v2/url_metrics'
+
+# The v2 url_metrics endpoint accepts at most 50 targets per request
+MAX_BATCH_SIZE = 50
+
+# Status codes worth retrying after a pause
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+MOZ_REQUESTS = telemetry.counter('moz_requests_total', 'Moz API requests by response status', ['status'])
+MOZ_REQUEST_SECONDS = telemetry.histogram('moz_request_seconds', 'Moz API request latency')
+MOZ_ROWS = telemetry.counter('moz_rows_total', 'Targets answered by Moz (quota used)')
+MOZ_RETRIES = telemetry.counter('moz_retries_total', 'Moz requests retried after a 429, 5xx or connection error')
+MOZ_LIMITER_WAIT_SECONDS = telemetry.histogram('moz_limiter_wait_seconds', 'Time spent waiting for the Moz rate limiter')
+
+
+class MozError(Exception):
+    def __init__(self, status_code, message):
+        super().__init__(f"Failed to fetch data. Status code: {status_code}")
+        self.status_code = status_code
+        self.message = message
+
+    @property
+    def transient(self):
+        # Connection errors, quota and server errors may succeed later; 4xx will not
+        return self.status_code is None or self.status_code in RETRYABLE_STATUS
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every worker talking to Moz."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)  # tokens added per second
+        self.capacity = max(float(capacity), 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.priority_waiting = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1, priority=False):
+        # Priority callers (interactive lookups) get the next token before anyone else waiting
+        if priority:
+            with self.lock:
+                self.priority_waiting += 1
+        try:
+            while True:
+                with self.lock:
+                    now = time.monotonic()
+                    if now < self.blocked_until:
+                        delay = self.blocked_until - now
+                    else:
+                        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                        self.updated = now
+                        if self.tokens >= tokens and (priority or not self.priority_waiting):
+                            self.tokens -= tokens
+                            return
+                        delay = max((tokens - self.tokens) / self.rate, 0.01)
+                time.sleep(delay)
+        finally:
+            if priority:
+                with self.lock:
+                    self.priority_waiting -= 1
+
+    def pause(self, seconds):
+        # Block every caller (not only the one that got the 429) and drop saved-up burst
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated = self.blocked_until
+
+
+class SharedTokenBucket(TokenBucket):
+    """Token bucket kept in a SQLite file, shared by every process on the host.
+
+    Each gunicorn worker has its own MozClient; with this limiter they all draw
+    from one Moz rate instead of each getting the full rate.
+    """
+
+    # A waiting priority caller holds back bulk callers in every process for this long, renewed on every poll
+    PRIORITY_HOLD = 1.0
+
+    def __init__(self, path, rate, capacity=1, name='moz'):
+        super().__init__(rate, capacity)
+        self.path = path
+        self.name = name
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS rate_limits (name TEXT PRIMARY KEY, tokens REAL NOT NULL, '
+                             'updated REAL NOT NULL, blocked_until REAL NOT NULL DEFAULT 0, '
+                             'priority_until REAL NOT NULL DEFAULT 0)')
+                conn.execute('INSERT OR IGNORE INTO rate_limits (name, tokens, updated) VALUES (?, ?, ?)',
+                             (name, self.capacity, time.time()))
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so read-modify-write is atomic across processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def acquire(self, tokens=1, priority=False):
+        while True:
+            with self.transaction() as conn:
+                current, updated, blocked_until, priority_until = conn.execute(
+                    'SELECT tokens, updated, blocked_until, priority_until FROM rate_limits WHERE name = ?',
+                    (self.name,)
+                ).fetchone()
+                now = time.time()
+                if priority:
+                    priority_until = now + self.PRIORITY_HOLD
+                if now < blocked_until:
+                    delay = blocked_until - now
+                elif not priority and now < priority_until:
+                    delay = 0.05
+                else:
+                    current = min(self.capacity, current + max(now - updated, 0.0) * self.rate)
+                    updated = now
+                    if current >= tokens:
+                        current -= tokens
+                        delay = None
+                        if priority:
+                            priority_until = 0.0  # Got its token: lift the hold on bulk callers
+                    else:
+                        delay = (tokens - current) / self.rate
+                conn.execute('UPDATE rate_limits SET tokens = ?, updated = ?, priority_until = ? WHERE name = ?',
+                             (current, updated, priority_until, self.name))
+            if delay is None:
+                return
+            time.sleep(min(delay, self.PRIORITY_HOLD / 2) if priority else delay)
+
+    def pause(self, seconds):
+        with self.transaction() as conn:
+            # Block every caller in every process and drop saved-up burst
+            blocked_until = conn.execute('SELECT blocked_until FROM rate_limits WHERE name = ?',
+                                         (self.name,)).fetchone()[0]
+            blocked_until = max(blocked_until, time.time() + seconds)
+            conn.execute('UPDATE rate_limits SET blocked_until = ?, tokens = 0, updated = ? WHERE name = ?',
+                         (blocked_until, blocked_until, self.name))
+
+
+class BatchStats:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.rows = 0
+        self.batches = 0
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def record(self, rows):
+        with self.lock:
+            self.rows += rows
+            self.batches += 1
+
+    def restore(self, saved):
+        # Carry on from counters saved with as_dict(), e.g. in a job checkpoint
+        with self.lock:
+            self.rows += saved.get('rows', 0)
+            self.batches += saved.get('batches', 0)
+            self.retries += saved.get('retries', 0)
+            self.started -= saved.get('elapsed_seconds', 0)
+
+    def record_retry(self, count=1):
+        with self.lock:
+            self.retries += count
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_sec(self):
+        elapsed = self.elapsed
+        return self.rows / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "rows": self.rows,
+            "batches": self.batches,
+            "retries": self.retries,
+            "elapsed_seconds": round(self.elapsed, 3),
+            "rows_per_sec": round(self.rows_per_sec, 2),
+        }
+
+
+def iter_batches(targets, size):
+    # Group any iterable (list or generator) into lists of at most `size` targets
+    iterator = iter(targets)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def retry_after_seconds(response, default):
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return default
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        return default
+
+
+class MozClient:
+    def __init__(self, api_key, url=MOZ_URL_METRICS, batch_size=MAX_BATCH_SIZE, concurrency=4,
+                 rate=0.1, burst=1, max_retries=5, backoff=2.0, timeout=30, limiter=None):
+        self.url = url
+        self.batch_size = min(int(batch_size), MAX_BATCH_SIZE)
+        self.concurrency = max(int(concurrency), 1)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # Pass a SharedTokenBucket when several processes talk to Moz with one quota
+        self.limiter = limiter if limiter is not None else TokenBucket(rate, burst)
+
+        # One keep-alive session whose pool is large enough for every worker
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            'x-moz-token': f'{api_key}',
+            'Content-Type': 'application/json'
+        })
+
+    def fetch(self, targets, stats=None, priority=False):
+        # Send one batch, waiting on the shared limiter and backing off on 429/5xx
+        attempt = 0
+        while True:
+            with MOZ_LIMITER_WAIT_SECONDS.time():
+                self.limiter.acquire(priority=priority)
+            started = time.perf_counter()
+            try:
+                response = self.session.post(self.url, json={"targets": targets}, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                MOZ_REQUESTS.inc(status='error')
+                if attempt >= self.max_retries:
+                    raise MozError(None, str(e))
+                delay = self.backoff * (2 ** attempt)
+            else:
+                MOZ_REQUEST_SECONDS.observe(time.perf_counter() - started)
+                MOZ_REQUESTS.inc(status=response.status_code)
+                if response.status_code == 200:
+                    MOZ_ROWS.inc(len(targets))
+                    return response.json()
+                if response.status_code not in RETRYABLE_STATUS or attempt >= self.max_retries:
+                    raise MozError(response.status_code, response.text)
+                delay = retry_after_seconds(response, self.backoff * (2 ** attempt))
+            attempt += 1
+            MOZ_RETRIES.inc()
+            if stats is not None:
+                stats.record_retry()
+            self.limiter.pause(delay)
+
+    def fetch_batches(self, targets, stats=None, on_error=None):
+        # Yield (batch, api_response) pairs as batches complete. Only a bounded number
+        # of batches is in flight at a time so `targets` may be a lazy generator.
+        # With `on_error`, a batch that still fails after its retries is handed to
+        # on_error(batch, error) and the remaining batches carry on.
+        stats = stats if stats is not None else BatchStats()
+        batches = iter_batches(targets, self.batch_size)
+        max_in_flight = self.concurrency * 2
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            pending = {}
+            try:
+                for batch in itertools.chain(batches, [None]):
+                    if batch is not None:
+                        future = executor.submit(self.fetch, batch, stats)
+                        pending[future] = batch
+                        if len(pending) < max_in_flight:
+                            continue
+                    while pending and (batch is None or len(pending) >= max_in_flight):
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            batch_done = pending.pop(future)
+                            try:
+                                api_response = future.result()
+                            except MozError as e:
+                                if on_error is None:
+                                    raise
+                                on_error(batch_done, e)
+                                continue
+                            stats.record(len(batch_done))
+                            yield batch_done, api_response
+            finally:
+                # Stop queued work if the caller bails out early or a batch failed
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,168 @@
+"""Target normalization, validation and dedupe, done before any Moz or database work.
+
+Uploaded sheets and scraped lists hold the same domain in several forms
+(`Example.com`, `http://example.com/`, `www.example.com`) as well as blanks,
+NaN cells and junk. `TargetFilter.filter` reduces a block of raw values to
+canonical, unique targets and counts why everything else was dropped.
+"""
+import functools
+import hashlib
+import math
+
+import telemetry
+
+# Drop reasons reported back to callers
+EMPTY = 'empty'
+INVALID = 'invalid'
+DUPLICATE = 'duplicate'
+
+# Spreadsheet and DataFrame placeholders for a missing value
+BLANKS = ('', 'nan', 'none', 'null', 'n/a', '-')
+
+# A DNS name with at least two labels and an alphabetic (or punycode) top-level label
+DOMAIN_RE = (r'(?=.{1,253}$)(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+'
+             r'(?:[a-z]{2,63}|xn--[a-z0-9-]{1,59})')
+
+# Scheme, user info and www. before the host; port, path, query and fragment after it
+HOST_RE = r'^(?:[a-z][a-z0-9+.-]*://)?(?:[^@/?#\\]*@)?(?:www\.)?([^@/?#\\:]*)(?::\d*)?(?:[/?#\\].*)?$'
+
+TARGETS_DROPPED = telemetry.counter('targets_dropped_total', 'Targets dropped before any Moz or database work',
+                                    ['reason'])
+
+
+def normalize_target(target):
+    # Cache key for a Moz target: no scheme, lower case, no www. and no trailing slash
+    key = str(target).strip().lower()
+    for scheme in ('https://', 'http://'):
+        if key.startswith(scheme):
+            key = key[len(scheme):]
+            break
+    if key.startswith('www.'):
+        key = key[4:]
+    return key.rstrip('/')
+
+
+def to_ascii(host):
+    # Internationalized names go to Moz and the database in their punycode form
+    import idna
+
+    try:
+        return idna.encode(host, uts46=True).decode('ascii')
+    except idna.IDNAError:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def root_extractor():
+    # Registrable domain from the public suffix list bundled with tldextract (no network
+    # fetch). Private suffixes count too, so a.github.io and b.github.io stay apart.
+    import tldextract
+
+    extract = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None, include_psl_private_domains=True)
+
+    def root(host):
+        parts = extract(host)
+        return f"{parts.domain}.{parts.suffix}" if parts.domain and parts.suffix else None
+    return root
+
+
+def canonicalize(values, root_domains=True):
+    # Canonical host (or registrable domain) for every value, in order: returns (keys, reasons)
+    # where a dropped value has key None and reason EMPTY or INVALID. Column-wise with pandas,
+    # and IDNA and suffix lookups run once per distinct host.
+    import pandas as pd
+
+    series = pd.Series(list(values), dtype=object)
+    missing = series.isna()
+    text = series.where(missing, series.astype(str)).str.strip().str.lower()
+    empty = missing | text.isin(BLANKS)
+
+    host = text.where(~empty, '').str.replace(HOST_RE, r'\1', regex=True).str.rstrip('.')
+
+    unicode_names = ~empty & ~host.str.isascii()
+    if unicode_names.any():
+        distinct = host[unicode_names].unique()
+        host[unicode_names] = host[unicode_names].map(dict(zip(distinct, map(to_ascii, distinct))))
+    valid = ~empty & host.notna() & host.str.fullmatch(DOMAIN_RE).fillna(False).astype(bool)
+
+    keys = host.where(valid)
+    if root_domains and valid.any():
+        root = root_extractor()
+        distinct = keys[valid].unique()
+        keys[valid] = keys[valid].map(dict(zip(distinct, map(root, distinct))))
+        valid &= keys.notna()
+
+    reasons = [EMPTY if blank else None if ok else INVALID for blank, ok in zip(empty.tolist(), valid.tolist())]
+    return [key if ok else None for key, ok in zip(keys.tolist(), valid.tolist())], reasons
+
+
+class BloomFilter:
+    """Fixed-size set membership with a bounded false-positive rate and no false negatives."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        # Double hashing: k bit positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+def target_index(bloom_capacity=0):
+    # Exact set by default; a Bloom filter keeps memory flat for very large uploads, at the
+    # cost of occasionally dropping a new target as a duplicate
+    return BloomFilter(bloom_capacity) if bloom_capacity else set()
+
+
+class TargetFilter:
+    """Canonicalizes blocks of raw targets and drops blanks, invalid names and repeats.
+
+    `index` holds every target already let through, so repeats are dropped across
+    blocks (for a whole upload or pipeline run), not only within one block.
+    """
+
+    def __init__(self, root_domains=True, index=None):
+        self.root_domains = root_domains
+        self.index = index if index is not None else set()
+        self.dropped = {}
+
+    def resolve(self, values, count=True):
+        # Returns (canonical key per value in order, None where dropped; keys never seen
+        # before, in first-seen order). Repeats keep their key so every value can be answered.
+        keys, reasons = canonicalize(values, self.root_domains)
+        new = []
+        dropped = {}
+        for key, reason in zip(keys, reasons):
+            if key is not None and key in self.index:
+                reason = DUPLICATE
+            if reason is not None:
+                dropped[reason] = dropped.get(reason, 0) + 1
+                continue
+            self.index.add(key)
+            new.append(key)
+        if count:
+            for reason, amount in dropped.items():
+                self.drop(reason, amount)
+        return keys, new
+
+    def filter(self, values):
+        # Canonical targets never seen before, in first-seen order
+        return self.resolve(values)[1]
+
+    def prime(self, values):
+        # Mark targets as seen without counting drops, e.g. the part of an upload before its checkpoint
+        self.resolve(values, count=False)
+
+    def drop(self, reason, amount=1):
+        self.dropped[reason] = self.dropped.get(reason, 0) + amount
+        TARGETS_DROPPED.inc(amount, reason=reason)
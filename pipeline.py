@@ -0,0 +1,206 @@
+"""Streaming scrape -> dedupe -> Moz metrics -> persist pipeline.
+
+Each stage runs on its own thread and hands items to the next one through a
+bounded queue, so Moz lookups for page 1 run while page 2 is still loading.
+
+    python pipeline.py [--backend http|selenium] [--mode incremental|full]
+"""
+import argparse
+import contextvars
+import json
+import queue
+import threading
+import time
+
+_END = object()
+
+
+class PipelineAborted(Exception):
+    pass
+
+
+class Channel:
+    # Bounded queue between two stages; put/get give up once the pipeline is aborted
+    def __init__(self, name, maxsize, abort):
+        self.name = name
+        self.queue = queue.Queue(maxsize)
+        self.abort = abort
+        self.peak = 0
+
+    def put(self, item):
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted()
+            try:
+                self.queue.put(item, timeout=0.1)
+                self.peak = max(self.peak, self.queue.qsize())
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        try:
+            self.put(_END)
+        except PipelineAborted:
+            pass
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self.abort.is_set():
+                    raise PipelineAborted()
+                continue
+            if item is _END:
+                return
+            yield item
+
+    def depth(self):
+        return self.queue.qsize()
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items_in = 0
+        self.items_out = 0
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    def as_dict(self):
+        end = self.finished or time.monotonic()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "elapsed_seconds": round(elapsed, 3),
+            "items_per_sec": round(self.items_out / elapsed, 2) if elapsed > 0 else 0.0,
+            "running": self.started is not None and self.finished is None,
+            "error": self.error,
+        }
+
+
+class LatencyStats:
+    # End-to-end latency samples (seconds), kept to a bounded window
+    def __init__(self, window=10000):
+        self.samples = []
+        self.window = window
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.samples.append(seconds)
+            if len(self.samples) > self.window:
+                del self.samples[:len(self.samples) - self.window]
+
+    def as_dict(self):
+        with self.lock:
+            samples = sorted(self.samples)
+        if not samples:
+            return {"count": 0}
+
+        def pct(p):
+            return round(samples[min(int(p * len(samples)), len(samples) - 1)], 3)
+
+        return {"count": self.count, "p50": pct(0.5), "p95": pct(0.95), "max": round(samples[-1], 3)}
+
+
+class Pipeline:
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.stages = []
+        self.stats = {}
+        self.channels = []
+        self.latency = LatencyStats()
+        self.abort = threading.Event()
+
+    def stage(self, name, func):
+        # func(inbox, emit): inbox iterates the previous stage's items (None for the first stage)
+        self.stages.append((name, func))
+        self.stats[name] = StageStats(name)
+        return self
+
+    def report(self):
+        return {
+            "stages": {name: stats.as_dict() for name, stats in self.stats.items()},
+            "queues": {channel.name: {"depth": channel.depth(), "peak": channel.peak} for channel in self.channels},
+            "latency": self.latency.as_dict(),
+        }
+
+    def run_stage(self, name, func, inbox, outbox):
+        stats = self.stats[name]
+        stats.started = time.monotonic()
+
+        def counted(items):
+            for item in items:
+                stats.items_in += 1
+                yield item
+
+        def emit(item):
+            stats.items_out += 1
+            if outbox is not None:
+                outbox.put(item)
+
+        try:
+            func(counted(inbox) if inbox is not None else None, emit)
+        except PipelineAborted:
+            pass
+        except Exception as e:
+            stats.error = str(e)
+            self.abort.set()
+        finally:
+            stats.finished = time.monotonic()
+            if outbox is not None:
+                outbox.close()
+
+    def run(self, on_progress=None, interval=2.0):
+        self.channels = [
+            Channel(f"{self.stages[i][0]}->{self.stages[i + 1][0]}", self.maxsize, self.abort)
+            for i in range(len(self.stages) - 1)
+        ]
+        threads = []
+        for i, (name, func) in enumerate(self.stages):
+            inbox = self.channels[i - 1] if i > 0 else None
+            outbox = self.channels[i] if i < len(self.channels) else None
+            # Each stage runs in a copy of the caller's context, so its spans join the job's trace
+            context = contextvars.copy_context()
+            thread = threading.Thread(target=context.run, args=(self.run_stage, name, func, inbox, outbox),
+                                      name=f"pipeline-{name}")
+            thread.start()
+            threads.append(thread)
+
+        # Report progress while the stages run
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=interval / len(threads))
+            report = self.report()
+            if on_progress is not None:
+                on_progress(report)
+
+        report = self.report()
+        errors = [f"{name}: {stats.error}" for name, stats in self.stats.items() if stats.error]
+        if errors:
+            raise RuntimeError("Pipeline failed - " + "; ".join(errors))
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrape auction domains and fetch their Moz metrics in one streaming run")
+    parser.add_argument('--backend', choices=['selenium', 'http'])
+    parser.add_argument('--mode', choices=['incremental', 'full'])
+    args = parser.parse_args()
+
+    import api
+    with api.app.app_context():
+        api.db.create_all()
+        report = api.run_domain_pipeline(backend=args.backend, mode=args.mode,
+                                         on_progress=lambda r: print(json.dumps(r["queues"])))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
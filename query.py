@@ -0,0 +1,142 @@
+import base64
+import json
+
+from sqlalchemy import and_, or_, select
+
+# Query-string filter -> (column, operator)
+FILTERS = {
+    'min_da': ('domain_authority', '>='),
+    'max_da': ('domain_authority', '<='),
+    'min_pa': ('page_authority', '>='),
+    'max_pa': ('page_authority', '<='),
+    'min_spam': ('spam_score', '>='),
+    'max_spam': ('spam_score', '<='),
+    'root_domain': ('root_domain', '=='),
+}
+
+SORTABLE = ('domain_authority', 'page_authority', 'spam_score', 'root_domain', 'id')
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def encode_cursor(value, row_id):
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return value, int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def parse_params(args, columns):
+    # Validate list parameters (a request.args-like mapping) against the model's columns
+    spec = {"filters": [], "sort": args.get('sort', 'domain_authority'), "order": args.get('order', 'desc')}
+    for name, (column, op) in FILTERS.items():
+        if name in args:
+            value = args[name]
+            if column != 'root_domain':
+                try:
+                    value = int(value)
+                except ValueError:
+                    raise ValueError(f"'{name}' must be an integer")
+            spec["filters"].append((column, op, value))
+
+    if spec["sort"] not in SORTABLE:
+        raise ValueError(f"'sort' must be one of: {', '.join(SORTABLE)}")
+    if spec["order"] not in ('asc', 'desc'):
+        raise ValueError("'order' must be 'asc' or 'desc'")
+
+    try:
+        spec["limit"] = min(max(int(args.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        raise ValueError("'limit' must be an integer")
+
+    fields = args.get('fields')
+    if fields:
+        spec["fields"] = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in spec["fields"] if name not in columns]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        spec["fields"] = list(columns)
+
+    spec["cursor"] = decode_cursor(args['cursor']) if args.get('cursor') else None
+    return spec
+
+
+def apply_filters(stmt, table, filters):
+    for column, op, value in filters:
+        col = table.c[column]
+        stmt = stmt.where(col >= value if op == '>=' else col <= value if op == '<=' else col == value)
+    return stmt
+
+
+def build_query(model, spec):
+    # Keyset-paginated SELECT: ORDER BY <sort>, id with a (<sort>, id) cursor
+    table = model.__table__
+    sort_col = table.c[spec["sort"]]
+    id_col = table.c.id
+    descending = spec["order"] == 'desc'
+
+    # Always select the sort key and id so the next cursor can be built
+    names = list(dict.fromkeys(spec["fields"] + [spec["sort"], 'id']))
+    stmt = select(*[table.c[name] for name in names])
+
+    stmt = apply_filters(stmt, table, spec["filters"])
+
+    if spec["sort"] != 'id':
+        # Rows without a value for the sort column have no place in the ranking
+        stmt = stmt.where(sort_col.isnot(None))
+
+    if spec["cursor"] is not None:
+        value, row_id = spec["cursor"]
+        if spec["sort"] == 'id':
+            stmt = stmt.where(id_col < row_id if descending else id_col > row_id)
+        elif descending:
+            stmt = stmt.where(or_(sort_col < value, and_(sort_col == value, id_col < row_id)))
+        else:
+            stmt = stmt.where(or_(sort_col > value, and_(sort_col == value, id_col > row_id)))
+
+    if descending:
+        stmt = stmt.order_by(sort_col.desc(), id_col.desc())
+    else:
+        stmt = stmt.order_by(sort_col.asc(), id_col.asc())
+    # One extra row tells us whether another page exists
+    return stmt.limit(spec["limit"] + 1)
+
+
+def page_of(rows, spec):
+    # Shape result rows into {"items", "next_cursor"} honouring the field projection
+    has_more = len(rows) > spec["limit"]
+    rows = rows[:spec["limit"]]
+    items = [{name: row._mapping[name] for name in spec["fields"]} for row in rows]
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(last[spec["sort"]], last['id'])
+    return {"items": items, "count": len(items), "next_cursor": next_cursor}
+
+
+def iter_chunks(engine, model, spec, chunk_size=1000):
+    # Every matching row in id order, one keyset-paginated chunk (list of dicts) at a time.
+    # Each chunk is its own short query, so no cursor stays open while the client reads.
+    table = model.__table__
+    names = list(dict.fromkeys(spec["fields"] + ['id']))
+    last_id = None
+    while True:
+        stmt = apply_filters(select(*[table.c[name] for name in names]), table, spec["filters"])
+        if last_id is not None:
+            stmt = stmt.where(table.c.id > last_id)
+        with engine.connect() as conn:
+            rows = conn.execute(stmt.order_by(table.c.id).limit(chunk_size)).all()
+        if not rows:
+            return
+        last_id = rows[-1]._mapping['id']
+        yield [{name: row._mapping[name] for name in spec["fields"]} for row in rows]
+        if len(rows) < chunk_size:
+            return
@@ -1,13 +1,12 @@
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
-from flask import Flask, jsonify, request
-import time
-from flask_sqlalchemy import SQLAlchemy
-import requests
-import pandas as pd
+from flask import jsonify
 from dotenv import load_dotenv
+import logging
 import os
-from api import db,PageData
+from api import app, run_domain_pipeline
+
+log = logging.getLogger(__name__)
 
 # Path to your service account JSON key file
 SERVICE_ACCOUNT_FILE = 'cred.json'
@@ -35,81 +34,25 @@ def fetch_google_sheet_data():
     
     # Get the values
     values = result.get('values', [])
-    flattened_data = [item[0] for item in values]
-    print(flattened_data)
+    flattened_data = [item[0] for item in values if item]
 
     if not values:
-        print('No data found.')
+        log.warning("No data found in sheet %s", SPREADSHEET_ID)
     else:
-        for row in values:
-            print(row)
-            
+        log.info("Read %d domains from sheet %s", len(flattened_data), SPREADSHEET_ID)
+        log.debug("Sheet rows: %s", flattened_data)
+    return flattened_data
 
             
 def fetch_url_metrics_csv():
-    try:
-        fetch_google_sheet_data
-        flat_list = [item[0] for item in data_string]
-        all_responses = []
-        chunk_size = 10
-        chunks = [flat_list[i:i + chunk_size] for i in range(0, len(flat_list), chunk_size)]
-        
-        # Prepare the request payload in the required format
-        for chunk in chunks:
-            print(chunk)
-            request_data = {
-                "targets": chunk
-            }
-            # Set the URL for the Moz API
-            url = 'https://lsapi.seomoz.com/v2/url_metrics'
-
-            # Set headers
-            headers = {
-                'x-moz-token': f'{api_key}',
-                'Content-Type': 'application/json'  # Ensure the correct content type
-            }
-
-            # Send the POST request to the Moz API using the json parameter
-            response = requests.post(url, headers=headers, json=request_data)
-            
-            # Check if the request was successful
-            if response.status_code == 200:
-                api_response = response.json()
-                all_responses.append(response.json())  # Append the response to the list
-                # print(f"Response Content: {response.text}")
-                
-                for record in api_response['results']:
-                    page_data = PageData(
-                        page=record.get('page', ''),
-                        subdomain=record.get('subdomain', ''),
-                        root_domain=record.get('root_domain', ''),
-                        last_crawled=record.get('last_crawled', ''),
-                        http_code=record.get('http_code', None),
-                        pages_to_page=record.get('pages_to_page', None),
-                        nofollow_pages_to_page=record.get('nofollow_pages_to_page', None),
-                        redirect_pages_to_page=record.get('redirect_pages_to_page', None),
-                        external_pages_to_page=record.get('external_pages_to_page', None),
-                        spam_score=record.get('spam_score', None),
-                        page_authority=record.get('page_authority', None),
-                        domain_authority=record.get('domain_authority', None),
-                        link_propensity=record.get('link_propensity', None)
-                 
-                    )
-                    db.session.add(page_data)
-                
-                db.session.commit()
-                print(f"Response Content: {response.text}")
-                time.sleep(10)
-            else:
-                # If any chunk fails, return the error immediately
-                return jsonify({
-                    "error": f"Failed to fetch data. Status code: {response.status_code}",
-                    "message": response.text
-                }), 500
-
-    except Exception as e:
-        return jsonify({"error": "An error occurred", "message": str(e)}), 500
-    return jsonify(all_responses), 200
+    # Fetch Moz metrics for every domain in the sheet through the streaming pipeline
+    with app.app_context():
+        try:
+            data_string = fetch_google_sheet_data()
+            report = run_domain_pipeline(mode='full', domains=data_string)
+        except Exception as e:
+            return jsonify({"error": "An error occurred", "message": str(e)}), 500
+        return jsonify(report), 200
 
 if __name__ == '__main__':
     fetch_google_sheet_data()
\ No newline at end of file
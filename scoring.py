@@ -0,0 +1,121 @@
+import json
+import time
+
+from sqlalchemy import select
+
+from storage import BulkWriter
+
+METRICS = ('domain_authority', 'page_authority', 'spam_score', 'link_propensity', 'external_pages_to_page')
+
+# Spam score counts against a domain; everything else for it
+DEFAULT_WEIGHTS = {
+    'domain_authority': 0.45,
+    'page_authority': 0.2,
+    'spam_score': -0.25,
+    'link_propensity': 0.05,
+    'external_pages_to_page': 0.05,
+}
+
+
+def parse_weights(value):
+    # SCORE_WEIGHTS is either JSON or "domain_authority=0.5,spam_score=-0.3"; unset keys keep defaults
+    weights = dict(DEFAULT_WEIGHTS)
+    if not value:
+        return weights
+    value = value.strip()
+    if value.startswith('{'):
+        overrides = json.loads(value)
+    else:
+        overrides = dict(item.split('=', 1) for item in value.split(',') if item.strip())
+    for name, weight in overrides.items():
+        name = name.strip()
+        if name not in METRICS:
+            raise ValueError(f"Unknown score metric: {name}")
+        weights[name] = float(weight)
+    return weights
+
+
+# pandas and NumPy are imported inside the functions that use them, so importing this
+# module (e.g. for parse_weights at app start) stays cheap
+
+def aggregate_domains(frame):
+    # One row per root domain from PageData rows (several pages can share a root domain)
+    frame = frame[frame['root_domain'].fillna('') != '']
+    return frame.groupby('root_domain', sort=False).agg(
+        domain_authority=('domain_authority', 'max'),
+        page_authority=('page_authority', 'max'),
+        spam_score=('spam_score', 'max'),
+        link_propensity=('link_propensity', 'mean'),
+        external_pages_to_page=('external_pages_to_page', 'max'),
+    ).reset_index()
+
+
+def score_frame(frame, weights):
+    # Vectorized 0-100 score: every metric is scaled to 0..1 and combined with the weights
+    import numpy as np
+    import pandas as pd
+
+    metrics = frame[list(METRICS)].astype('float64')
+    scaled = pd.DataFrame({
+        'domain_authority': metrics['domain_authority'] / 100.0,
+        'page_authority': metrics['page_authority'] / 100.0,
+        # Moz reports -1 when it has no spam score; treat that as unknown (0)
+        'spam_score': metrics['spam_score'].where(metrics['spam_score'] >= 0) / 100.0,
+        'link_propensity': metrics['link_propensity'],
+        # Linking pages span several orders of magnitude, so score them on a log scale
+        'external_pages_to_page': np.log1p(metrics['external_pages_to_page'].clip(lower=0)) / np.log1p(1e6),
+    }).fillna(0.0).clip(0.0, 1.0)
+    vector = np.array([weights.get(name, 0.0) for name in METRICS])
+    return (scaled[list(METRICS)].to_numpy() @ vector) * 100.0
+
+
+def score_rows(frame, weights, updated_at=None):
+    domains = aggregate_domains(frame)
+    if domains.empty:
+        return []
+    domains['score'] = score_frame(domains, weights).round(4)
+    domains['updated_at'] = updated_at or int(time.time())
+    # NaN -> None so the database gets NULLs
+    domains = domains.astype(object).where(domains.notna(), None)
+    return domains.to_dict('records')
+
+
+def refresh_scores(engine, page_table, score_table, root_domains, weights):
+    # Re-score only the given root domains and upsert them into the ranking table
+    import pandas as pd
+
+    root_domains = [domain for domain in set(root_domains) if domain]
+    if not root_domains:
+        return 0
+    columns = [page_table.c.root_domain] + [page_table.c[name] for name in METRICS]
+    written = 0
+    for i in range(0, len(root_domains), 500):
+        chunk = root_domains[i:i + 500]
+        with engine.connect() as conn:
+            frame = pd.DataFrame(
+                conn.execute(select(*columns).where(page_table.c.root_domain.in_(chunk))).all(),
+                columns=['root_domain'] + list(METRICS)
+            )
+        rows = score_rows(frame, weights)
+        with BulkWriter(engine, score_table, ['root_domain'], flush_rows=len(rows) + 1) as writer:
+            writer.extend(rows)
+        written += len(rows)
+    return written
+
+
+def rebuild_scores(engine, page_table, score_table, weights, chunk_size=5000):
+    # Full recompute (e.g. after changing weights), walking root domains in chunks
+    written = 0
+    last = ''
+    while True:
+        with engine.connect() as conn:
+            chunk = list(conn.execute(
+                select(page_table.c.root_domain).distinct()
+                .where(page_table.c.root_domain > last)
+                .order_by(page_table.c.root_domain)
+                .limit(chunk_size)
+            ).scalars())
+        if not chunk:
+            return written
+        written += refresh_scores(engine, page_table, score_table, chunk, weights)
+        last = chunk[-1]
@@ -0,0 +1,238 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+from selenium import webdriver
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import Select, WebDriverWait
+
+DOMAIN_SELECTOR = 'div[domainname]'
+COOKIE_BUTTON_SELECTOR = 'button[data-cky-tag="accept-button"]'
+NEXT_BUTTON_XPATH = "//a[@class='page-link' and @aria-label='Next']"
+
+log = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=1)
+def chromedriver_path():
+    # Resolved once per process; CHROMEDRIVER_PATH skips webdriver_manager (and its network lookup)
+    path = os.getenv("CHROMEDRIVER_PATH")
+    if path:
+        return path
+    from webdriver_manager.chrome import ChromeDriverManager
+    return ChromeDriverManager().install()
+
+
+def chrome_options():
+    options = Options()
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--disable-direct-composition")
+    options.add_argument("--ignore-certificate-errors")
+    options.add_argument("--headless")  # Run headless for server environment
+    return options
+
+
+class DriverPool:
+    """A small pool of warm headless Chrome drivers reused across scrapes."""
+
+    def __init__(self, size=2):
+        self.size = max(int(size), 1)
+        self.idle = []  # most recently used last, so warm drivers are reused first
+        self.created = 0
+        self.fresh = set()  # ids of drivers that have not dealt with the cookie banner yet
+        self.lock = threading.Lock()
+        # Signalled whenever a driver is returned or a slot frees up because one was discarded
+        self.available = threading.Condition(self.lock)
+
+    def create(self):
+        driver = webdriver.Chrome(service=Service(chromedriver_path()), options=chrome_options())
+        self.fresh.add(id(driver))
+        return driver
+
+    def checkout(self):
+        # An idle driver, or a new one while the pool is below `size`; otherwise wait for either
+        with self.available:
+            while not self.idle and self.created >= self.size:
+                self.available.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.created += 1
+        try:
+            return self.create()
+        except Exception:
+            self.release_slot()
+            raise
+
+    def checkin(self, driver):
+        with self.available:
+            self.idle.append(driver)
+            self.available.notify()
+
+    def release_slot(self):
+        # A waiter may now create a replacement driver
+        with self.available:
+            self.created -= 1
+            self.available.notify()
+
+    @contextmanager
+    def driver(self):
+        driver = self.checkout()
+        try:
+            yield driver
+        except WebDriverException:
+            # A crashed or wedged browser is thrown away rather than handed out again
+            self.discard(driver)
+            raise
+        except BaseException:
+            self.checkin(driver)
+            raise
+        else:
+            self.checkin(driver)
+
+    def is_fresh(self, driver):
+        return id(driver) in self.fresh
+
+    def mark_prepared(self, driver):
+        self.fresh.discard(id(driver))
+
+    def discard(self, driver):
+        self.fresh.discard(id(driver))
+        self.release_slot()
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            drivers, self.idle = self.idle, []
+        for driver in drivers:
+            self.discard(driver)
+
+
+def read_domains(driver):
+    return [element.get_attribute('domainname') for element in driver.find_elements(By.CSS_SELECTOR, DOMAIN_SELECTOR)]
+
+
+def wait_for_domains(driver, timeout):
+    # Wait until at least one domain is rendered; an empty page simply times out
+    try:
+        WebDriverWait(driver, timeout).until(EC.presence_of_element_located((By.CSS_SELECTOR, DOMAIN_SELECTOR)))
+    except TimeoutException:
+        return []
+    return read_domains(driver)
+
+
+def wait_for_new_domains(driver, previous, timeout):
+    # Wait until the domain elements from the previous page are replaced by new ones
+    old_first = previous[0] if previous else None
+
+    def page_changed(d):
+        try:
+            if old_first is not None:
+                old_first.get_attribute('domainname')
+                return False
+        except StaleElementReferenceException:
+            pass
+        return d.find_elements(By.CSS_SELECTOR, DOMAIN_SELECTOR) or False
+
+    try:
+        WebDriverWait(driver, timeout).until(page_changed)
+    except TimeoutException:
+        return []
+    return read_domains(driver)
+
+
+def accept_cookies(pool, driver, timeout):
+    # Only a driver's first visit shows the cookie banner
+    if not pool.is_fresh(driver):
+        return
+    try:
+        button = WebDriverWait(driver, timeout).until(EC.element_to_be_clickable((By.CSS_SELECTOR, COOKIE_BUTTON_SELECTOR)))
+        button.click()
+    except Exception as e:
+        log.info("Cookie accept button not found or not clickable: %s", e)
+    pool.mark_prepared(driver)
+
+
+def set_per_page(driver, per_page, timeout):
+    dropdowns = driver.find_elements(By.ID, "per-page")
+    if not dropdowns:
+        return read_domains(driver)
+    dropdown = Select(dropdowns[0])
+    if dropdown.first_selected_option.get_attribute('value') == str(per_page):
+        return read_domains(driver)
+    previous = driver.find_elements(By.CSS_SELECTOR, DOMAIN_SELECTOR)
+    dropdown.select_by_value(str(per_page))
+    return wait_for_new_domains(driver, previous, timeout) or read_domains(driver)
+
+
+def scrape_by_clicking(pool, on_page, url, per_page=100, timeout=15):
+    # Walk the listing with the Next button, waiting on the domain elements instead of sleeping
+    with pool.driver() as driver:
+        driver.get(url)
+        wait_for_domains(driver, timeout)
+        accept_cookies(pool, driver, min(timeout, 5))
+        domainnames = set_per_page(driver, per_page, timeout)
+
+        page = 0
+        while domainnames:
+            page += 1
+            if on_page(page, domainnames) is False:
+                log.info("Stopping early at the caller's request.")
+                break
+
+            next_buttons = driver.find_elements(By.XPATH, NEXT_BUTTON_XPATH)
+            if not next_buttons or "disabled" in (next_buttons[0].get_attribute("class") or ""):
+                log.info("Next button is disabled. Scraping completed.")
+                break
+            previous = driver.find_elements(By.CSS_SELECTOR, DOMAIN_SELECTOR)
+            next_buttons[0].click()
+            domainnames = wait_for_new_domains(driver, previous, timeout)
+        return page
+
+
+def fetch_page(pool, page_url, page, per_page, timeout):
+    with pool.driver() as driver:
+        driver.get(page_url.format(page=page, per_page=per_page))
+        domainnames = wait_for_domains(driver, timeout)
+        if pool.is_fresh(driver):
+            accept_cookies(pool, driver, 1)
+        return domainnames
+
+
+def scrape_by_url(pool, on_page, page_url, per_page=100, workers=2, timeout=15):
+    # Load pages directly by URL on several drivers at once, delivering them in page order
+    page = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        next_page = 1
+        pending = {}
+        while True:
+            while len(pending) < workers:
+                pending[next_page] = executor.submit(fetch_page, pool, page_url, next_page, per_page, timeout)
+                next_page += 1
+            domainnames = pending.pop(page + 1).result()
+            if not domainnames:
+                break
+            page += 1
+            if on_page(page, domainnames) is False:
+                break
+        for future in pending.values():
+            future.cancel()
+    return page
+
+
+def scrape(pool, on_page, url, page_url=None, per_page=100, workers=1, timeout=15):
+    # Calls on_page(page_number, domains) for every listing page until it returns False;
+    # returns the number of pages
+    if page_url and workers > 1:
+        return scrape_by_url(pool, on_page, page_url, per_page, workers, timeout)
+    return scrape_by_clicking(pool, on_page, url, per_page, timeout)
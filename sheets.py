@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+from functools import lru_cache
+
+import telemetry
+
+log = logging.getLogger(__name__)
+
+SCOPES = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+
+# Sheets API responses worth retrying (quota exceeded and transient server errors)
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+SHEETS_ROWS = telemetry.counter('sheets_rows_written_total', 'Rows appended to Google Sheets')
+SHEETS_ERRORS = telemetry.counter('sheets_write_errors_total', 'Google Sheets appends that failed', ['retried'])
+SHEETS_WRITE_SECONDS = telemetry.histogram('sheets_write_seconds', 'Latency of Google Sheets appends')
+
+
+@lru_cache(maxsize=8)
+def get_worksheet(spreadsheet_url, credentials_file):
+    # Authorize once per process and keep the worksheet handle
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    creds = Credentials.from_service_account_file(credentials_file, scopes=SCOPES)
+    client = gspread.authorize(creds)
+    return client.open_by_url(spreadsheet_url).sheet1
+
+
+class FakeSheet:
+    """In-memory stand-in for a gspread worksheet, for local runs and tests."""
+
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def append_rows(self, rows):
+        with self.lock:
+            self.calls += 1
+            self.rows.extend(rows)
+
+
+def is_retryable(error):
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status in RETRYABLE_STATUS
+
+
+class SheetSink:
+    """Buffers rows for a worksheet and appends them in large batches.
+
+    mode is "off" (rows are dropped), "sync" (flushes run in the caller's thread)
+    or "async" (a background thread flushes, so add() never waits on Sheets).
+    The worksheet is only opened on the first flush. on_written(rows), if given,
+    is called with each batch once it is appended (or dropped, in "off" mode);
+    batches that fail for good are never passed to it.
+    """
+
+    def __init__(self, sheet_factory, mode='async', flush_rows=1000, flush_seconds=10.0,
+                 max_retries=5, backoff=2.0, on_written=None):
+        self.sheet_factory = sheet_factory
+        self.on_written = on_written
+        self.mode = mode
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.buffer = []
+        self.written = 0
+        self.errors = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.closed = False
+        self.thread = None
+        if mode == 'async':
+            self.thread = threading.Thread(target=self.run, name='sheet-sink', daemon=True)
+            self.thread.start()
+
+    def add(self, rows):
+        if not rows:
+            return
+        if self.mode == 'off':
+            self.written_callback(rows)
+            return
+        with self.lock:
+            self.buffer.extend(rows)
+            due = self.due()
+            if due and self.mode == 'async':
+                self.wakeup.notify()
+        if due and self.mode == 'sync':
+            self.flush()
+
+    def due(self):
+        return len(self.buffer) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_seconds
+
+    def take(self):
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+            self.last_flush = time.monotonic()
+        return rows
+
+    def flush(self):
+        rows = self.take()
+        if rows:
+            self.write(rows)
+
+    def write(self, rows):
+        attempt = 0
+        while True:
+            try:
+                with telemetry.span('sheets_write'), SHEETS_WRITE_SECONDS.time():
+                    self.sheet_factory().append_rows(rows)
+                self.written += len(rows)
+                SHEETS_ROWS.inc(len(rows))
+                break
+            except Exception as e:
+                if not is_retryable(e) or attempt >= self.max_retries:
+                    # Losing a batch must not stop the scrape; the error is reported at close()
+                    SHEETS_ERRORS.inc(retried='no')
+                    log.error("Failed to write %d rows to Google Sheets: %s", len(rows), e)
+                    self.errors.append(str(e))
+                    return
+                SHEETS_ERRORS.inc(retried='yes')
+                time.sleep(self.backoff * (2 ** attempt))
+                attempt += 1
+        self.written_callback(rows)
+
+    def written_callback(self, rows):
+        if self.on_written is None:
+            return
+        try:
+            self.on_written(rows)
+        except Exception:
+            # The rows are in the sheet; a failing callback must not stop later writes
+            log.exception("on_written failed for %d rows", len(rows))
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.closed and not (self.buffer and self.due()):
+                    self.wakeup.wait(timeout=self.flush_seconds)
+                if self.closed and not self.buffer:
+                    return
+            self.flush()
+
+    def close(self):
+        # Flush what is left and, in async mode, wait for the writer thread to finish
+        if self.thread is not None:
+            with self.lock:
+                self.closed = True
+                self.wakeup.notify()
+            self.thread.join()
+        elif self.mode == 'sync':
+            self.flush()
+        return {"rows_written": self.written, "errors": self.errors}
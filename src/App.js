@@ -32,6 +32,31 @@ function App() {
     updateFileName(file);
   };
 
+  // Poll a background job until it finishes, collecting its results page by page
+  const waitForJob = async (jobId, onProgress) => {
+    let results = [];
+    for (;;) {
+      const response = await fetch(`${backendUrl}/jobs/${jobId}?offset=${results.length}`);
+      const job = await response.json();
+      if (!response.ok) {
+        throw new Error(job.error);
+      }
+      results = results.concat(job.results);
+      if (onProgress) {
+        onProgress(results);
+      }
+      if (job.status === 'failed') {
+        throw new Error(job.error);
+      }
+      if (job.status === 'completed' && job.results.length === 0) {
+        return results;
+      }
+      if (job.results.length === 0) {
+        await new Promise((resolve) => setTimeout(resolve, 2000));
+      }
+    }
+  };
+
   const handleScrapeData = async () => {
     if (!selectedFile) {
       alert('Please select a file first.');
@@ -50,9 +75,8 @@ function App() {
       });
 
       if (response.ok) {
-        const data = await response.json();
-        const flattenedData = data.flatMap((item) => item.results);
-        setResponseData(flattenedData);
+        const { job_id: jobId } = await response.json();
+        await waitForJob(jobId, setResponseData);
         alert('Data scraped successfully!');
       } else {
         const errorData = await response.json();
@@ -74,9 +98,8 @@ function App() {
       });
 
       if (response.ok) {
-        const data = await response.json();
-        const transformedData = data.domains.map((domain) => ({ domain }));
-        setScrapeData(transformedData);
+        const { job_id: jobId } = await response.json();
+        await waitForJob(jobId, setScrapeData);
         alert('Google Sheet data scraped successfully!');
       } else {
         const errorData = await response.json();
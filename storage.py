@@ -0,0 +1,116 @@
+import time
+
+from sqlalchemy import BigInteger, Column, String, Table, select
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+import telemetry
+
+DB_WRITE_SECONDS = telemetry.histogram('db_write_seconds', 'Latency of bulk upsert statements', ['table'])
+DB_ROWS_WRITTEN = telemetry.counter('db_rows_written_total', 'Rows upserted by bulk writers', ['table'])
+
+
+def upsert_statement(engine, table, rows, key_columns):
+    # One multi-row INSERT that updates existing rows on a unique key clash, per dialect
+    dialect = engine.dialect.name
+    update_columns = [name for name in rows[0] if name not in key_columns]
+    if dialect in ('mysql', 'mariadb'):
+        stmt = mysql.insert(table).values(rows)
+        return stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in update_columns})
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(table).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={name: stmt.excluded[name] for name in update_columns}
+        )
+    raise ValueError(f"Bulk upsert is not supported for the {dialect} dialect")
+
+
+def table_versions_table(metadata):
+    # A change counter per table, bumped in the same transaction as every bulk write to it
+    return Table(
+        'table_versions', metadata,
+        Column('name', String(64), primary_key=True),
+        Column('version', BigInteger, nullable=False),
+    )
+
+
+def bump_version(conn, versions, name):
+    # Increment (or start at 1) the counter; the row lock orders concurrent writers
+    dialect = conn.engine.dialect.name
+    if dialect in ('mysql', 'mariadb'):
+        stmt = mysql.insert(versions).values(name=name, version=1)
+        stmt = stmt.on_duplicate_key_update(version=versions.c.version + 1)
+    elif dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite if dialect == 'sqlite' else postgresql).insert(versions).values(name=name, version=1)
+        stmt = stmt.on_conflict_do_update(index_elements=['name'], set_={'version': versions.c.version + 1})
+    else:
+        raise ValueError(f"Bulk upsert is not supported for the {dialect} dialect")
+    conn.execute(stmt)
+
+
+def table_version(conn, versions, name):
+    # Current change counter of a table, 0 if it was never written through a versioned BulkWriter
+    return conn.execute(select(versions.c.version).where(versions.c.name == name)).scalar() or 0
+
+
+class BulkWriter:
+    """Buffers row dicts and upserts them in one statement per flush.
+
+    A flush happens once `flush_rows` rows are buffered or `flush_seconds` have
+    passed since the previous one, and always when the writer is closed. With
+    `versions` (a table_versions table) every flush also bumps the table's change
+    counter, committed together with the rows.
+    """
+
+    def __init__(self, engine, table, key_columns, flush_rows=500, flush_seconds=5.0, on_flush=None,
+                 versions=None):
+        self.engine = engine
+        self.table = table
+        self.key_columns = list(key_columns)
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.on_flush = on_flush
+        self.versions = versions
+        self.rows = []
+        self.last_flush = time.monotonic()
+        self.written = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        self.maybe_flush()
+
+    def extend(self, rows):
+        self.rows.extend(rows)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if len(self.rows) >= self.flush_rows or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.rows:
+            return 0
+        rows, self.rows = self.rows, []
+
+        with telemetry.span('db_write'), DB_WRITE_SECONDS.time(table=self.table.name):
+            with self.engine.begin() as conn:
+                conn.execute(upsert_statement(self.engine, self.table, rows, self.key_columns))
+                if self.versions is not None:
+                    bump_version(conn, self.versions, self.table.name)
+        DB_ROWS_WRITTEN.inc(len(rows), table=self.table.name)
+        self.written += len(rows)
+        if self.on_flush is not None:
+            with telemetry.span('db_on_flush'):
+                self.on_flush(rows)
+        return len(rows)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Keep whatever was fetched even if the caller failed part way through
+        self.flush()
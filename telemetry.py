@@ -0,0 +1,358 @@
+"""Metrics, job tracing and logging setup.
+
+Metrics are kept in-process and rendered in the Prometheus text format by
+GET /metrics. With a shared directory (see share()), every process also writes
+its counter and histogram totals there and render() adds up all of them, so
+the numbers do not depend on which gunicorn worker answered. Spans time named steps; inside a traced job they are also
+summed per job, so GET /jobs/<job_id> shows where the job spent its time.
+"""
+import atexit
+import bisect
+import contextvars
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; covers everything from a cache lookup to a slow Moz batch
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=()):
+    pairs = [f'{name}="{escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+    # Values written to the shared directory and added up across processes
+    shared = True
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def snapshot(self):
+        # JSON-friendly [label values, value] pairs
+        with self.lock:
+            return [[list(key), value] for key, value in self.values.items()]
+
+    def merge(self, values, items):
+        # Add the pairs of one process's snapshot into `values`
+        for key, value in items:
+            key = tuple(key)
+            values[key] = self.add(values.get(key), value)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+    @staticmethod
+    def add(total, value):
+        return value if total is None else total + value
+
+    def samples(self, values=None):
+        if values is None:
+            with self.lock:
+                values = dict(self.values)
+        items = sorted(values.items())
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    """A value that goes up and down; `callback` (returning {label tuple: value}) is read at render time.
+
+    Gauges are not added up across processes; each render reports the serving process's value.
+    """
+    kind = 'gauge'
+    shared = False
+
+    def __init__(self, name, help, labelnames=(), callback=None):
+        super().__init__(name, help, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def samples(self, values=None):
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception:
+                logging.getLogger(__name__).exception("Gauge %s callback failed", self.name)
+                values = {}
+            with self.lock:
+                self.values = {tuple(str(v) for v in key): value for key, value in values.items()}
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self.values.items()]
+
+    @staticmethod
+    def add(total, value):
+        counts, seconds = value
+        if total is None:
+            return list(counts), seconds
+        return [a + b for a, b in zip(total[0], counts)], total[1] + seconds
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self, values=None):
+        if values is None:
+            with self.lock:
+                values = {key: (list(counts), total) for key, (counts, total) in self.values.items()}
+        items = sorted(values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, [('le', format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.directory = None
+
+    def register(self, cls, name, *args, **kwargs):
+        # Get-or-create, so modules can declare their metrics at import time
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=(), callback=None):
+        gauge = self.register(Gauge, name, help, labelnames)
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram, name, help, labelnames, buckets)
+
+    def share(self, directory, interval=5.0):
+        # Write this process's totals to `directory` every `interval` seconds (and at exit), and
+        # render the totals of every process that wrote there. Files of exited processes are kept,
+        # so counters never go backwards when a worker is replaced.
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.write_snapshot()
+
+        def start():
+            threading.Thread(target=run, name='metrics-snapshot', daemon=True).start()
+
+        start()
+        # A forked child has its own pid (and file) and needs its own writer thread
+        os.register_at_fork(after_in_child=start)
+        atexit.register(self.write_snapshot)
+
+    def write_snapshot(self):
+        if self.directory is None:
+            return
+        with self.lock:
+            metrics = [metric for metric in self.metrics.values() if metric.shared]
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump({metric.name: metric.snapshot() for metric in metrics}, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logging.getLogger(__name__).warning("Could not write metrics snapshot %s: %s", path, e)
+
+    def collect(self):
+        # Totals of every process in the shared directory, by metric name
+        self.write_snapshot()
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, items in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is not None and metric.shared:
+                    metric.merge(totals.setdefault(name, {}), items)
+        return totals
+
+    def render(self):
+        with self.lock:
+            metrics = sorted(self.metrics.values(), key=lambda metric: metric.name)
+        totals = self.collect() if self.directory is not None else None
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            if totals is not None and metric.shared:
+                lines.extend(metric.samples(totals.get(metric.name, {})))
+            else:
+                lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+share = REGISTRY.share
+
+SPAN_SECONDS = histogram('span_seconds', 'Time spent in named steps', ['span'])
+
+
+class Trace:
+    """Per-job span totals: how often each step ran and how long it took in total."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.started = time.monotonic()
+        self.spans = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self.lock:
+            span = self.spans.setdefault(name, {"count": 0, "seconds": 0.0, "max": 0.0})
+            span["count"] += 1
+            span["seconds"] += seconds
+            span["max"] = max(span["max"], seconds)
+
+    def as_dict(self):
+        with self.lock:
+            spans = {
+                name: {"count": span["count"], "seconds": round(span["seconds"], 4), "max": round(span["max"], 4)}
+                for name, span in sorted(self.spans.items(), key=lambda item: -item[1]["seconds"])
+            }
+        return {"elapsed_seconds": round(time.monotonic() - self.started, 4), "spans": spans}
+
+
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+@contextmanager
+def trace(job_id):
+    # Collect the spans of everything run in this context (and contexts copied from it)
+    job_trace = Trace(job_id)
+    token = current_trace.set(job_trace)
+    try:
+        yield job_trace
+    finally:
+        current_trace.reset(token)
+
+
+@contextmanager
+def span(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        SPAN_SECONDS.observe(seconds, span=name)
+        job_trace = current_trace.get()
+        if job_trace is not None:
+            job_trace.add(name, seconds)
+
+
+# Attributes every LogRecord has; anything else was passed with `extra=`
+RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line, with any `extra=` fields and the current job id
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        job_trace = current_trace.get()
+        if job_trace is not None:
+            entry["job_id"] = job_trace.job_id
+        entry.update({key: value for key, value in vars(record).items() if key not in RESERVED})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level='INFO', fmt='text'):
+    # LOG_FORMAT=json for log shippers, plain text otherwise
+    handler = logging.StreamHandler()
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s [%(threadName)s] %(name)s: %(message)s'))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
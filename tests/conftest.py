@@ -0,0 +1,19 @@
+def pytest_addoption(parser):
+    parser.addoption('--request-id', action='append', default=[],
+                     help="only run tests tagged with this backlog request id (repeatable)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'request_id(id): the backlog request a test covers')
+
+
+def pytest_collection_modifyitems(config, items):
+    wanted = set(config.getoption('--request-id'))
+    if not wanted:
+        return
+    selected, deselected = [], []
+    for item in items:
+        marker = item.get_closest_marker('request_id')
+        (selected if marker is not None and marker.args[0] in wanted else deselected).append(item)
+    config.hook.pytest_deselected(items=deselected)
+    items[:] = selected
@@ -0,0 +1,155 @@
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from coalesce import Coalescer
+from moz import BatchStats, MozError
+
+
+class FakeClient:
+    """Stands in for MozClient: records every batch and answers {"target": ...} per target."""
+
+    def __init__(self, batch_size=3, concurrency=2, retries=0, error=None):
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.retries = retries
+        self.error = error
+        self.calls = []
+        self.lock = threading.Lock()
+        # Closed gates hold bulk (or priority) sends until the test opens them
+        self.bulk_gate = threading.Event()
+        self.bulk_gate.set()
+        self.priority_gate = threading.Event()
+        self.priority_gate.set()
+
+    def fetch(self, targets, stats=None, priority=False):
+        with self.lock:
+            self.calls.append((list(targets), priority))
+        (self.priority_gate if priority else self.bulk_gate).wait(5)
+        for _ in range(self.retries):
+            stats.record_retry()
+        if self.error is not None:
+            raise self.error
+        return {"results": [{"target": target} for target in targets]}
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+@pytest.mark.request_id("user-015")
+def test_results_come_back_in_request_order():
+    coalescer = Coalescer(FakeClient(), window=0.001)
+    targets = [f"site{i}.com" for i in range(7)]
+    response = coalescer.fetch(targets)
+    assert [record["target"] for record in response["results"]] == targets
+
+
+@pytest.mark.request_id("user-015")
+def test_identical_targets_in_flight_are_fetched_once():
+    client = FakeClient(batch_size=50)
+    client.priority_gate.clear()
+    coalescer = Coalescer(client, window=0.001)
+    first = coalescer.submit(["a.com", "b.com"], priority=True)
+    second = coalescer.submit(["b.com", "c.com"], priority=True)
+    client.priority_gate.set()
+
+    assert [future.result(5)["target"] for future in first + second] == ["a.com", "b.com", "b.com", "c.com"]
+    sent = [target for batch, _ in client.calls for target in batch]
+    assert sorted(sent) == ["a.com", "b.com", "c.com"]
+    assert coalescer.coalesced == 1
+
+
+@pytest.mark.request_id("user-015")
+def test_targets_of_concurrent_callers_share_batches():
+    client = FakeClient(batch_size=4)
+    coalescer = Coalescer(client, window=0.05)
+    first = coalescer.submit(["a.com", "b.com"])
+    second = coalescer.submit(["c.com", "d.com"])
+    for future in first + second:
+        future.result(5)
+    assert client.calls == [(["a.com", "b.com", "c.com", "d.com"], False)]
+
+
+@pytest.mark.request_id("user-015")
+def test_a_failed_batch_fails_every_waiting_caller():
+    coalescer = Coalescer(FakeClient(error=MozError(500, "down")), window=0.001)
+    with pytest.raises(MozError):
+        coalescer.fetch(["a.com"])
+
+    failed = []
+    batches = list(coalescer.fetch_batches(["b.com", "c.com"], on_error=lambda batch, error: failed.append(batch)))
+    assert batches == []
+    assert failed == [["b.com", "c.com"]]
+
+
+@pytest.mark.request_id("user-015")
+def test_retries_are_reported_to_the_callers():
+    coalescer = Coalescer(FakeClient(batch_size=2, retries=1), window=0.001)
+    stats = BatchStats()
+    batches = list(coalescer.fetch_batches([f"site{i}.com" for i in range(6)], stats))
+    assert len(batches) == 3
+    assert (stats.rows, stats.batches, stats.retries) == (6, 3, 3)
+
+    stats = BatchStats()
+    coalescer.fetch(["x.com", "y.com", "z.com"], stats)
+    assert stats.retries == 2
+    assert coalescer.stats.retries == 5
+
+
+@pytest.mark.request_id("user-016")
+def test_lookups_go_ahead_of_queued_bulk_batches():
+    # concurrency 2: bulk batches may use one send slot, the other is kept for lookups
+    client = FakeClient(batch_size=2, concurrency=2)
+    client.bulk_gate.clear()
+    coalescer = Coalescer(client, window=0.001)
+    bulk = coalescer.submit([f"bulk{i}.com" for i in range(6)])
+    wait_for(lambda: client.calls)
+
+    response = coalescer.fetch(["lookup.com"], timeout=5)
+    assert response["results"] == [{"target": "lookup.com"}]
+    assert client.calls == [(["bulk0.com", "bulk1.com"], False), (["lookup.com"], True)]
+
+    client.bulk_gate.set()
+    for future in bulk:
+        future.result(5)
+    assert [priority for _, priority in client.calls] == [False, True, False, False]
+
+
+@pytest.mark.request_id("user-016")
+def test_a_lookup_of_a_queued_bulk_target_moves_it_to_the_front():
+    client = FakeClient(batch_size=2, concurrency=2)
+    client.bulk_gate.clear()
+    coalescer = Coalescer(client, window=0.001)
+    bulk = coalescer.submit(["bulk0.com", "bulk1.com", "bulk2.com", "bulk3.com"])
+
+    response = coalescer.fetch(["bulk3.com"], timeout=5)
+    assert response["results"] == [{"target": "bulk3.com"}]
+    assert (["bulk3.com"], True) in client.calls
+
+    client.bulk_gate.set()
+    assert bulk[3].result(5) == {"target": "bulk3.com"}
+
+
+@pytest.mark.request_id("user-016")
+def test_late_results_are_handed_to_on_late():
+    client = FakeClient()
+    client.priority_gate.clear()
+    coalescer = Coalescer(client, window=0.001)
+    late = []
+    arrived = threading.Event()
+
+    def on_late(results):
+        late.extend(results)
+        arrived.set()
+
+    with pytest.raises(TimeoutError):
+        coalescer.fetch(["slow.com"], timeout=0.05, on_late=on_late)
+    client.priority_gate.set()
+    assert arrived.wait(5)
+    assert late == [("slow.com", {"target": "slow.com"})]
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table
+
+import export
+
+pytestmark = pytest.mark.request_id("user-013")
+
+COLUMNS = ['target', 'domain_authority', 'link_propensity', 'fetched_at']
+
+PAGES = Table(
+    'pages', MetaData(),
+    Column('id', Integer, primary_key=True),
+    Column('target', String(255)),
+    Column('domain_authority', Integer),
+    Column('link_propensity', Float),
+    Column('fetched_at', Integer),
+)
+
+
+def body(fmt, chunks, columns=COLUMNS, table=None):
+    stream, _, _ = export.export_stream(fmt, iter(chunks), columns, table)
+    return b''.join(stream)
+
+
+def read_parquet(data):
+    pq = pytest.importorskip('pyarrow.parquet')
+    return pq.read_table(io.BytesIO(data))
+
+
+def test_csv_and_ndjson_keep_column_order_and_json_encode_nested_values():
+    chunks = [[{"target": "a.com", "domain_authority": 10, "extra": 1}],
+              [{"target": "b.com", "link_propensity": [1, 2]}]]
+    rows = list(csv.DictReader(io.StringIO(body('csv', chunks).decode())))
+    assert [list(row) for row in rows] == [COLUMNS, COLUMNS]
+    assert rows[1]['link_propensity'] == '[1, 2]'
+
+    lines = [json.loads(line) for line in body('ndjson', chunks).decode().splitlines()]
+    assert lines[0] == {"target": "a.com", "domain_authority": 10, "link_propensity": None, "fetched_at": None}
+
+
+def test_empty_csv_export_still_has_a_header():
+    assert body('csv', []).decode().strip() == ','.join(COLUMNS)
+
+
+def test_xlsx_export_holds_every_row():
+    from openpyxl import load_workbook
+
+    chunks = [[{"target": f"site{i}.com", "domain_authority": i}] for i in range(3)]
+    sheet = load_workbook(io.BytesIO(body('xlsx', chunks))).active
+    assert [row[0] for row in sheet.iter_rows(values_only=True)] == ['target', 'site0.com', 'site1.com', 'site2.com']
+
+
+def test_parquet_types_come_from_the_table_even_when_the_first_chunk_is_null():
+    # Rows stored before the upgrade have no target or fetched_at; later ones do
+    chunks = [
+        [{"target": None, "domain_authority": 10, "link_propensity": None, "fetched_at": None}],
+        [{"target": "b.com", "domain_authority": 20, "link_propensity": 0.5, "fetched_at": 1700000000}],
+    ]
+    result = read_parquet(body('parquet', chunks, table=PAGES))
+    assert [str(field.type) for field in result.schema] == ['string', 'int64', 'double', 'int64']
+    assert result.column('fetched_at').to_pylist() == [None, 1700000000]
+    assert result.column('target').to_pylist() == [None, 'b.com']
+
+
+def test_parquet_job_results_merge_types_across_chunks():
+    columns = ['page', 'score', 'note']
+    chunks = [
+        [{"page": "a.com", "score": None, "note": 1}],
+        [{"page": "b.com", "score": 3, "note": "text"}],
+        [{"page": "c.com", "score": 4.5, "note": {"nested": True}}],
+    ]
+    result = read_parquet(body('parquet', chunks, columns))
+    assert [str(field.type) for field in result.schema] == ['string', 'double', 'string']
+    assert result.column('score').to_pylist() == [None, 3.0, 4.5]
+    assert result.column('note').to_pylist() == ['1', 'text', '{"nested": true}']
+
+
+def test_empty_parquet_export_is_a_valid_file():
+    result = read_parquet(body('parquet', [], columns=['page']))
+    assert result.num_rows == 0
+    assert result.column_names == ['page']
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        export.export_stream('pdf', iter([]), COLUMNS)
+
+
+def test_peek_columns_takes_the_keys_of_the_first_chunk():
+    columns, chunks = export.peek_columns(iter([[{"a": 1, "b": 2}, {"c": 3}], [{"d": 4}]]))
+    assert columns == ['a', 'b', 'c']
+    assert list(chunks) == [[{"a": 1, "b": 2}, {"c": 3}], [{"d": 4}]]
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import MetaData, create_engine, func, select
+
+import history
+
+pytestmark = pytest.mark.request_id("user-021")
+
+THRESHOLDS = {"domain_authority": [20, 30], "spam_score": [10]}
+
+
+def snapshot(ts, da, spam=1, root_domain='a.com'):
+    return {"root_domain": root_domain, "ts": ts, "domain_authority": da, "page_authority": 5, "spam_score": spam,
+            "link_propensity": 0.25, "external_pages_to_page": 100}
+
+
+@pytest.fixture
+def tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'history.db'}")
+    metadata = MetaData()
+    history_table = history.domain_history_table(metadata)
+    alerts_table = history.domain_alerts_table(metadata)
+    metadata.create_all(engine)
+    return engine, history_table, alerts_table
+
+
+def record(tables, *snapshots):
+    return history.record_snapshots(*tables, list(snapshots), THRESHOLDS)
+
+
+def test_only_changed_snapshots_are_stored(tables):
+    engine, history_table, _ = tables
+    assert record(tables, snapshot(100, 15)) == (1, 0)
+    # Same metrics again, then an older snapshot arriving late: neither is stored
+    assert record(tables, snapshot(200, 15), snapshot(50, 40)) == (0, 0)
+    assert record(tables, snapshot(300, 16), snapshot(400, 16)) == (1, 0)
+    with engine.connect() as conn:
+        assert conn.execute(select(func.count()).select_from(history_table)).scalar() == 2
+
+
+def test_threshold_crossings_become_alerts(tables):
+    engine, _, alerts_table = tables
+    record(tables, snapshot(100, 15, spam=12), snapshot(100, 50, root_domain='b.com'))
+    # a.com: DA 15 -> 30 crosses 20 and reaches 30; spam 12 -> 9 falls below 10. b.com: DA 50 -> 25 crosses 30
+    assert record(tables, snapshot(200, 30, spam=9), snapshot(200, 25, root_domain='b.com')) == (2, 4)
+
+    alerts = history.recent_alerts(engine, alerts_table, since=0)
+    assert sorted((a['root_domain'], a['metric'], a['threshold'], a['direction']) for a in alerts) == [
+        ('a.com', 'domain_authority', 20, 'up'),
+        ('a.com', 'domain_authority', 30, 'up'),
+        ('a.com', 'spam_score', 10, 'down'),
+        ('b.com', 'domain_authority', 30, 'down'),
+    ]
+    down = history.recent_alerts(engine, alerts_table, since=0, metric='domain_authority', direction='down')
+    assert [(a['previous'], a['current']) for a in down] == [(50, 25)]
+    assert history.recent_alerts(engine, alerts_table, since=201) == []
+
+
+def test_history_deltas_start_from_the_snapshot_before_the_range(tables):
+    engine, history_table, _ = tables
+    record(tables, snapshot(100, 10), snapshot(200, 14), snapshot(300, 11, spam=3))
+
+    result = history.domain_history(engine, history_table, 'a.com', start=150, end=300)
+    assert result["baseline"]["domain_authority"] == 10
+    deltas = [(s["ts"], s["delta"]["domain_authority"], s["delta"]["spam_score"]) for s in result["snapshots"]]
+    assert deltas == [(200, 4, 0), (300, -3, 2)]
+
+    first = history.domain_history(engine, history_table, 'a.com', start=0, end=150)
+    assert first["baseline"] is None
+    assert [s["delta"] for s in first["snapshots"]] == [None]
+
+
+def test_timestamps_and_thresholds_are_parsed():
+    assert history.parse_thresholds("40, 20,,30,20") == [20, 30, 40]
+    assert history.parse_timestamp("1700000000", "since") == 1700000000
+    assert history.parse_timestamp("2024-01-01", "since") == 1704067200
+    assert history.parse_timestamp("2024-01-01T02:00:00+02:00", "since") == 1704067200
+    with pytest.raises(ValueError):
+        history.parse_timestamp("last week", "since")
@@ -0,0 +1,79 @@
+import pytest
+
+import http_scraper
+from http_scraper import HttpListingScraper, parse_listing
+
+pytestmark = pytest.mark.request_id("user-007")
+
+
+def listing(domains, next_link=''):
+    items = ''.join(f'<div domainname="{domain}">{domain}</div>' for domain in domains)
+    return f'<html><body>{items}<ul class="pagination">{next_link}</ul></body></html>'
+
+
+def next_item(href, li_class='page-item', a_extra=''):
+    return f'<li class="{li_class}"><a class="page-link" aria-label="Next" href="{href}"{a_extra}>Next</a></li>'
+
+
+@pytest.fixture(params=['lxml', 'stdlib'])
+def parser(request, monkeypatch):
+    # Every case runs through both the lxml parser and the stdlib fallback
+    if request.param == 'stdlib':
+        monkeypatch.setattr(http_scraper, 'lxml_html', None)
+    elif http_scraper.lxml_html is None:
+        pytest.skip("lxml is not installed")
+    return request.param
+
+
+def crawl(tmp_path, pages, max_pages=http_scraper.MAX_PAGES):
+    for name, html in pages.items():
+        (tmp_path / name).write_text(html)
+    seen = []
+    count = HttpListingScraper(max_pages=max_pages).scrape(
+        lambda page, domains: seen.append((page, domains)), (tmp_path / 'page-1.html').as_uri())
+    return count, seen
+
+
+@pytest.mark.parametrize('last_link', [
+    next_item('page-3.html', li_class='page-item disabled'),
+    next_item('page-3.html', a_extra=' aria-disabled="true"'),
+    next_item('#'),
+    '',
+])
+def test_last_page_has_no_next_link(parser, last_link):
+    assert parse_listing(listing(['b.com'], last_link)) == (['b.com'], None)
+
+
+def test_next_links_are_followed_to_the_last_page(tmp_path, parser):
+    count, seen = crawl(tmp_path, {
+        'page-1.html': listing(['a.com'], next_item('page-2.html')),
+        'page-2.html': listing(['b.com', 'c.com'], next_item('#')),
+    })
+    assert count == 2
+    assert seen == [(1, ['a.com']), (2, ['b.com', 'c.com'])]
+
+
+def test_links_back_to_a_visited_page_stop_the_crawl(tmp_path, parser):
+    # Page 2 links back to page 1 (and page 1 to itself with a fragment), which used to loop forever
+    count, seen = crawl(tmp_path, {
+        'page-1.html': listing(['a.com'], next_item('page-2.html')),
+        'page-2.html': listing(['b.com'], next_item('page-1.html#top')),
+    })
+    assert count == 2
+    assert [page for page, _ in seen] == [1, 2]
+
+    count, _ = crawl(tmp_path, {'page-1.html': listing(['a.com'], next_item('page-1.html'))})
+    assert count == 1
+
+
+def test_max_pages_caps_a_crawl_that_never_repeats(tmp_path, parser):
+    pages = {f'page-{i}.html': listing([f'site{i}.com'], next_item(f'page-{i + 1}.html')) for i in range(1, 10)}
+    count, _ = crawl(tmp_path, pages, max_pages=3)
+    assert count == 3
+
+
+def test_on_page_returning_false_stops_early(tmp_path):
+    (tmp_path / 'page-1.html').write_text(listing(['a.com'], next_item('page-2.html')))
+    (tmp_path / 'page-2.html').write_text(listing(['b.com']))
+    scraper = HttpListingScraper()
+    assert scraper.scrape(lambda page, domains: False, (tmp_path / 'page-1.html').as_uri()) == 1
@@ -0,0 +1,24 @@
+import pytest
+from sqlalchemy import MetaData, create_engine
+
+from incremental import SHEET, DomainTracker, seen_domains_table
+
+pytestmark = pytest.mark.request_id("user-008")
+
+
+def test_unseen_domains_stay_new_until_marked(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'seen.db'}")
+    metadata = MetaData()
+    table = seen_domains_table(metadata)
+    metadata.create_all(engine)
+
+    tracker = DomainTracker(engine, table, SHEET)
+    assert tracker.unseen(["A.com", "b.com", "a.com"]) == ["a.com", "b.com"]
+    # Nothing is recorded until the sink stored the domains, so a failed write is retried next run
+    assert DomainTracker(engine, table, SHEET).unseen(["a.com"]) == ["a.com"]
+    assert tracker.mark(["a.com"]) == 1
+
+    tracker = DomainTracker(engine, table, SHEET)
+    assert tracker.unseen(["a.com", "b.com"]) == ["b.com"]
+    tracker.mark(["b.com"])
+    assert tracker.removed() == ["a.com"]
@@ -0,0 +1,30 @@
+import pytest
+from openpyxl import Workbook
+
+from ingest import iter_targets
+from normalize import EMPTY, TargetFilter
+
+pytestmark = pytest.mark.request_id("user-020")
+
+
+def test_csv_blank_cells_reach_the_filter_as_empty(tmp_path):
+    path = tmp_path / 'targets.csv'
+    path.write_text("url\na.com\n\n  \nb.com,extra\n\n\n")
+    values = list(iter_targets(str(path)))
+    # Trailing blank rows are not part of the upload
+    assert values == ['a.com', '', '  ', 'b.com']
+
+    normalizer = TargetFilter()
+    assert normalizer.filter(values) == ['a.com', 'b.com']
+    assert normalizer.dropped == {EMPTY: 2}
+
+
+def test_xlsx_empty_cells_are_passed_on(tmp_path):
+    workbook = Workbook()
+    sheet = workbook.active
+    for value in ['url', 'a.com', None, 'b.com', None]:
+        sheet.append([value])
+    path = str(tmp_path / 'targets.xlsx')
+    workbook.save(path)
+
+    assert list(iter_targets(path)) == ['a.com', None, 'b.com']
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from jobs import BATCH_DONE, BATCH_FAILED, COMPLETED, FAILED, JobQueue
+from moz import BatchStats
+
+
+def wait_for_job(queue, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = queue.get(job_id)
+        if job['status'] in (COMPLETED, FAILED):
+            return job
+        assert time.monotonic() < deadline, f"job still {job['status']}"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'), workers=1)
+
+
+@pytest.mark.request_id("user-014")
+def test_resume_continues_from_the_last_checkpoint(queue):
+    runs = []
+
+    def count_to_four(job, payload):
+        state = job.checkpoint() or {"position": 0}
+        runs.append(state['position'])
+        while state['position'] < 4:
+            job.add_results([{"n": state['position']}])
+            state['position'] += 1
+            if state['position'] == 3 and len(runs) == 1:
+                raise RuntimeError("interrupted")  # The result for n=2 is not covered by a checkpoint
+            state = job.save_checkpoint(state)
+        return {"position": state['position']}
+
+    queue.register('count', count_to_four)
+    job_id = queue.submit('count', {})
+    job = wait_for_job(queue, job_id)
+    assert job['status'] == FAILED
+    assert job['error'] == "interrupted"
+
+    assert queue.resume(job_id)
+    job = wait_for_job(queue, job_id)
+    assert job['status'] == COMPLETED
+    assert runs == [0, 2]
+    assert job['result'] == {"position": 4}
+    # Results written after the checkpoint were dropped and redone, not duplicated
+    assert job['results'] == [{"n": 0}, {"n": 1}, {"n": 2}, {"n": 3}]
+
+
+@pytest.mark.request_id("user-014")
+def test_resume_re_enables_dead_lettered_batches(queue):
+    def upload(job, payload):
+        if job.checkpoint() is None:
+            job.save_checkpoint({}, [
+                {"batch_no": 0, "status": BATCH_DONE, "size": 2},
+                {"batch_no": 1, "status": BATCH_FAILED, "size": 2, "targets": ["a.com", "b.com"],
+                 "error": "400 - bad request", "retryable": False},
+            ])
+            raise RuntimeError("1 Moz batch failed")
+        return {"retryable": job.failed_batches(retryable_only=True)}
+
+    queue.register('upload', upload)
+    job_id = queue.submit('upload', {})
+    job = wait_for_job(queue, job_id)
+    assert job['batches']['done'] == 1
+    assert job['batches']['failed'] == 1
+    assert queue.failed_batches(job_id, retryable_only=True) == []
+
+    queue.resume(job_id)
+    job = wait_for_job(queue, job_id)
+    retryable = job['result']['retryable']
+    assert [batch['targets'] for batch in retryable] == [["a.com", "b.com"]]
+
+
+@pytest.mark.request_id("user-014")
+def test_only_failed_jobs_can_be_resumed(queue):
+    queue.register('noop', lambda job, payload: {})
+    job_id = queue.submit('noop', {})
+    assert wait_for_job(queue, job_id)['status'] == COMPLETED
+    assert not queue.resume(job_id)
+
+
+@pytest.mark.request_id("user-002")
+def test_interrupted_jobs_are_requeued_and_run(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    first = JobQueue(path, workers=1)
+    first.register('noop', lambda job, payload: {"ok": True})
+    with first.connect() as conn:
+        conn.execute("INSERT INTO jobs (id, kind, status, payload, created_at) VALUES "
+                     "('left-running', 'noop', 'running', '{}', 0)")
+
+    restarted = JobQueue(path, workers=1)
+    restarted.register('noop', lambda job, payload: {"ok": True})
+    assert restarted.resume_pending() == 1
+    assert wait_for_job(restarted, 'left-running')['result'] == {"ok": True}
+
+
+@pytest.mark.request_id("user-014")
+def test_batch_stats_continue_from_a_checkpoint():
+    saved = BatchStats()
+    saved.record(50)
+    saved.record(50)
+    saved.record_retry(3)
+
+    stats = BatchStats()
+    stats.restore(saved.as_dict())
+    stats.record(50)
+    assert (stats.rows, stats.batches, stats.retries) == (150, 3, 3)
+    assert stats.elapsed >= saved.as_dict()['elapsed_seconds']
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from bench.servers import serve_mock_moz
+from moz import BatchStats, MozClient, MozError, SharedTokenBucket, TokenBucket, retry_after_seconds
+
+pytestmark = pytest.mark.request_id("user-001")
+
+
+class RecordingLimiter(TokenBucket):
+    """Never waits; remembers the pauses the client asked for."""
+
+    def __init__(self):
+        super().__init__(rate=1000, capacity=1000)
+        self.pauses = []
+
+    def acquire(self, tokens=1, priority=False):
+        pass
+
+    def pause(self, seconds):
+        self.pauses.append(seconds)
+
+
+@pytest.fixture
+def mock_moz():
+    servers = []
+
+    def start(**options):
+        server, url = serve_mock_moz(**options)
+        servers.append(server)
+        return server.RequestHandlerClass, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def test_a_429_pauses_for_retry_after_and_is_retried(mock_moz):
+    handler, url = mock_moz(throttle_every=2, retry_after=0.25)
+    limiter = RecordingLimiter()
+    client = MozClient('key', url=url, limiter=limiter, backoff=5)
+    stats = BatchStats()
+
+    assert len(client.fetch(['a.com'], stats)['results']) == 1
+    # The second request is throttled; the client waits what Retry-After says, not its own backoff
+    assert client.fetch(['b.com', 'c.com'], stats)['results'][1]['root_domain'] == 'c.com'
+    assert limiter.pauses == [0.25]
+    assert stats.retries == 1
+    assert (handler.requests, handler.throttled) == (3, 1)
+
+
+def test_server_errors_back_off_exponentially_then_fail(mock_moz):
+    handler, url = mock_moz(error_rate=1.0)
+    limiter = RecordingLimiter()
+    client = MozClient('key', url=url, limiter=limiter, max_retries=2, backoff=0.5)
+
+    with pytest.raises(MozError) as error:
+        client.fetch(['a.com'])
+    assert error.value.status_code == 500
+    assert error.value.transient
+    assert limiter.pauses == [0.5, 1.0]
+    assert handler.requests == 3
+
+
+def test_failed_batches_go_to_on_error_and_the_rest_carry_on(mock_moz):
+    handler, url = mock_moz(error_rate=0.5, seed=0)
+    client = MozClient('key', url=url, batch_size=2, concurrency=2, limiter=RecordingLimiter(), max_retries=0)
+    stats = BatchStats()
+    failed = []
+    targets = [f"site{i}.com" for i in range(20)]
+
+    done = list(client.fetch_batches(iter(targets), stats, on_error=lambda batch, error: failed.append(batch)))
+    assert failed and done
+    # Every target ends up in exactly one of the two
+    assert sorted([t for batch, _ in done for t in batch] + [t for batch in failed for t in batch]) == sorted(targets)
+    assert (stats.rows, stats.batches) == (2 * len(done), len(done))
+    assert handler.errors == len(failed)
+
+
+def test_retry_after_header_parsing():
+    response = type('Response', (), {})()
+    response.headers = {'Retry-After': '3'}
+    assert retry_after_seconds(response, 9) == 3.0
+    response.headers = {'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+    assert retry_after_seconds(response, 9) == 9
+    response.headers = {}
+    assert retry_after_seconds(response, 9) == 9
+
+
+def test_a_pause_holds_back_every_caller():
+    bucket = TokenBucket(rate=1000, capacity=5)
+    bucket.pause(0.2)
+    started = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - started >= 0.15
+
+
+def test_shared_bucket_is_one_budget_for_every_instance(tmp_path):
+    path = str(tmp_path / 'limiter.db')
+    first = SharedTokenBucket(path, rate=5, capacity=2)
+    second = SharedTokenBucket(path, rate=5, capacity=2)
+    started = time.monotonic()
+    first.acquire()
+    second.acquire()
+    # The burst of two is used up by both instances together, so the third waits for a refill
+    first.acquire()
+    assert time.monotonic() - started >= 0.15
+
+    second.pause(0.2)
+    started = time.monotonic()
+    first.acquire()
+    assert time.monotonic() - started >= 0.15
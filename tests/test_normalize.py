@@ -0,0 +1,69 @@
+import math
+
+import pytest
+
+from normalize import DUPLICATE, EMPTY, INVALID, BloomFilter, TargetFilter, normalize_target, target_index
+
+pytestmark = pytest.mark.request_id("user-020")
+
+
+def test_forms_of_one_domain_collapse_to_its_registrable_domain():
+    normalizer = TargetFilter()
+    values = ["Example.com", "http://example.com/", "https://www.example.com:443/path?q=1#top", "blog.example.com"]
+    keys, new = normalizer.resolve(values)
+    assert keys == ["example.com"] * 4
+    assert new == ["example.com"]
+    assert normalizer.dropped == {DUPLICATE: 3}
+
+
+def test_public_suffixes_keep_separate_domains_apart():
+    normalizer = TargetFilter()
+    values = ["a.github.io", "b.github.io", "x.qc.ca", "y.on.ca", "shop.example.co.uk"]
+    assert normalizer.filter(values) == ["a.github.io", "b.github.io", "x.qc.ca", "y.on.ca", "example.co.uk"]
+
+
+def test_blanks_and_junk_are_dropped_with_a_reason():
+    normalizer = TargetFilter()
+    values = ["", "  ", None, math.nan, "N/A", "not a domain", "bad..name", "nosuffix", "good.com"]
+    keys, new = normalizer.resolve(values)
+    assert new == ["good.com"]
+    assert keys[:-1] == [None] * 8
+    assert normalizer.dropped == {EMPTY: 5, INVALID: 3}
+
+
+def test_internationalized_names_become_punycode():
+    assert TargetFilter().filter(["Bücher.de"]) == ["xn--bcher-kva.de"]
+
+
+def test_host_granularity_is_kept_without_root_reduction():
+    normalizer = TargetFilter(root_domains=False)
+    keys, new = normalizer.resolve(["https://www.Blog.Example.com/x", "blog.example.com", "example.com"])
+    assert keys == ["blog.example.com", "blog.example.com", "example.com"]
+    assert new == ["blog.example.com", "example.com"]
+
+
+def test_repeats_are_dropped_across_blocks():
+    normalizer = TargetFilter()
+    assert normalizer.filter(["a.com", "b.com"]) == ["a.com", "b.com"]
+    assert normalizer.filter(["b.com", "c.com"]) == ["c.com"]
+    assert normalizer.dropped == {DUPLICATE: 1}
+
+
+def test_prime_marks_targets_seen_without_counting_drops():
+    normalizer = TargetFilter()
+    normalizer.prime(["a.com", "a.com", ""])
+    assert normalizer.dropped == {}
+    assert normalizer.filter(["a.com", "b.com"]) == ["b.com"]
+
+
+def test_bloom_filter_index_dedupes_like_a_set():
+    normalizer = TargetFilter(index=target_index(bloom_capacity=1000))
+    assert isinstance(normalizer.index, BloomFilter)
+    targets = [f"site{i}.com" for i in range(500)]
+    assert normalizer.filter(targets + targets[:100]) == targets
+    assert normalizer.dropped == {DUPLICATE: 100}
+
+
+def test_normalize_target_cache_key():
+    assert normalize_target(" HTTPS://www.Example.com/ ") == "example.com"
+    assert normalize_target("http://blog.example.com/page/") == "blog.example.com/page"
@@ -0,0 +1,83 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine
+
+import query
+
+pytestmark = pytest.mark.request_id("user-011")
+
+
+class Pages:
+    __table__ = Table(
+        'pages', MetaData(),
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('root_domain', String(255)),
+        Column('domain_authority', Integer),
+        Column('page_authority', Integer),
+        Column('spam_score', Integer),
+    )
+
+
+COLUMNS = [column.name for column in Pages.__table__.columns]
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'query.db'}")
+    Pages.__table__.metadata.create_all(engine)
+    # Many ties on domain_authority, so pages have to break them on id; every 7th row has no DA
+    rows = [{"root_domain": f"site{i}.com", "domain_authority": None if i % 7 == 6 else i % 5,
+             "page_authority": i % 3, "spam_score": i % 4} for i in range(40)]
+    with engine.begin() as conn:
+        conn.execute(Pages.__table__.insert(), rows)
+    return engine
+
+
+def walk(engine, **args):
+    # Follow next_cursor to the end, returning every item in order
+    items = []
+    while True:
+        spec = query.parse_params(args, COLUMNS)
+        with engine.connect() as conn:
+            page = query.page_of(conn.execute(query.build_query(Pages, spec)).all(), spec)
+        items.extend(page["items"])
+        if page["next_cursor"] is None:
+            return items
+        args = dict(args, cursor=page["next_cursor"])
+
+
+def test_cursors_walk_every_row_once_in_sort_order(engine):
+    items = walk(engine, limit='6')
+    expected = sorted(((i % 5, i) for i in range(40) if i % 7 != 6), reverse=True)
+    assert [(item["domain_authority"], item["id"] - 1) for item in items] == expected
+
+
+def test_ascending_walk_with_filters_and_fields(engine):
+    items = walk(engine, sort='page_authority', order='asc', min_spam='2', fields='root_domain', limit='4')
+    assert all(set(item) == {'root_domain'} for item in items)
+    expected = [f"site{i}.com" for _, i in sorted((i % 3, i) for i in range(40) if i % 4 >= 2)]
+    assert [item["root_domain"] for item in items] == expected
+
+
+def test_id_sort_pages_by_id_alone(engine):
+    assert [item["id"] for item in walk(engine, sort='id', order='asc', limit='15')] == list(range(1, 41))
+
+
+def test_bad_parameters_are_rejected():
+    for args in ({"sort": "page"}, {"order": "up"}, {"min_da": "high"}, {"fields": "id,secret"},
+                 {"cursor": "not-a-cursor"}):
+        with pytest.raises(ValueError):
+            query.parse_params(args, COLUMNS)
+    assert query.parse_params({"limit": "-5"}, COLUMNS)["limit"] == 1
+    assert query.parse_params({"limit": "50000"}, COLUMNS)["limit"] == query.MAX_LIMIT
+
+
+def test_cursor_round_trip():
+    assert query.decode_cursor(query.encode_cursor("example.com", 42)) == ("example.com", 42)
+
+
+def test_export_chunks_cover_every_match_in_id_order(engine):
+    spec = query.parse_params({"max_da": "1", "fields": "root_domain"}, COLUMNS)
+    chunks = list(query.iter_chunks(engine, Pages, spec, chunk_size=4))
+    assert all(len(chunk) <= 4 for chunk in chunks)
+    assert [row["root_domain"] for chunk in chunks for row in chunk] == [
+        f"site{i}.com" for i in range(40) if i % 7 != 6 and i % 5 <= 1]
@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine, select
+
+import scoring
+
+pytestmark = pytest.mark.request_id("user-012")
+
+metadata = MetaData()
+PAGES = Table(
+    'pages', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('root_domain', String(255)),
+    Column('domain_authority', Integer),
+    Column('page_authority', Integer),
+    Column('spam_score', Integer),
+    Column('link_propensity', Float),
+    Column('external_pages_to_page', Integer),
+)
+SCORES = Table(
+    'scores', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    Column('root_domain', String(255), nullable=False, unique=True),
+    Column('score', Float, nullable=False),
+    Column('domain_authority', Integer),
+    Column('page_authority', Integer),
+    Column('spam_score', Integer),
+    Column('link_propensity', Float),
+    Column('external_pages_to_page', Integer),
+    Column('updated_at', Integer, nullable=False),
+)
+
+
+def page(root_domain, da=0, pa=0, spam=0, propensity=0.0, external=0):
+    return {"root_domain": root_domain, "domain_authority": da, "page_authority": pa, "spam_score": spam,
+            "link_propensity": propensity, "external_pages_to_page": external}
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'scores.db'}")
+    metadata.create_all(engine)
+    return engine
+
+
+def add_pages(engine, rows):
+    with engine.begin() as conn:
+        conn.execute(PAGES.insert(), rows)
+
+
+def stored_scores(engine):
+    with engine.connect() as conn:
+        return dict(conn.execute(select(SCORES.c.root_domain, SCORES.c.score)).all())
+
+
+def test_weights_accept_json_or_pairs_and_keep_defaults():
+    weights = scoring.parse_weights("domain_authority=0.5, spam_score=-0.3")
+    assert weights == dict(scoring.DEFAULT_WEIGHTS, domain_authority=0.5, spam_score=-0.3)
+    assert scoring.parse_weights('{"page_authority": 1}')['page_authority'] == 1.0
+    assert scoring.parse_weights('') == scoring.DEFAULT_WEIGHTS
+    with pytest.raises(ValueError):
+        scoring.parse_weights("backlinks=1")
+
+
+def test_pages_of_a_root_domain_are_scored_together():
+    frame = pd.DataFrame([page('a.com', da=40, pa=10, spam=5), page('a.com', da=60, pa=30, spam=1),
+                          page('', da=99)])
+    [row] = scoring.score_rows(frame, {'domain_authority': 1.0, 'page_authority': 1.0, 'spam_score': -1.0},
+                               updated_at=1)
+    # Highest DA, PA and spam score of the domain's pages; rows without a root domain are left out
+    assert (row['root_domain'], row['domain_authority'], row['page_authority'], row['spam_score']) == ('a.com', 60, 30, 5)
+    assert row['score'] == pytest.approx(60 + 30 - 5)
+    assert row['updated_at'] == 1
+
+
+def test_unknown_spam_score_does_not_count_against_a_domain():
+    frame = pd.DataFrame([page('known.com', da=50, spam=10), page('unknown.com', da=50, spam=-1)])
+    scores = {row['root_domain']: row['score'] for row in scoring.score_rows(frame, scoring.DEFAULT_WEIGHTS)}
+    assert scores['unknown.com'] > scores['known.com']
+    assert scores['unknown.com'] == pytest.approx(50 * scoring.DEFAULT_WEIGHTS['domain_authority'])
+
+
+def test_refresh_rescores_only_the_given_domains(engine):
+    weights = {'domain_authority': 1.0}
+    add_pages(engine, [page('a.com', da=10), page('b.com', da=20)])
+    assert scoring.refresh_scores(engine, PAGES, SCORES, ['a.com', 'b.com', None], weights) == 2
+    assert stored_scores(engine) == {'a.com': 10.0, 'b.com': 20.0}
+
+    add_pages(engine, [page('a.com', da=30), page('b.com', da=40)])
+    scoring.refresh_scores(engine, PAGES, SCORES, ['a.com'], weights)
+    assert stored_scores(engine) == {'a.com': 30.0, 'b.com': 20.0}
+
+
+def test_rebuild_walks_every_root_domain_in_chunks(engine):
+    add_pages(engine, [page(f'site{i}.com', da=i) for i in range(25)])
+    assert scoring.rebuild_scores(engine, PAGES, SCORES, {'domain_authority': 1.0}, chunk_size=10) == 25
+    assert stored_scores(engine) == {f'site{i}.com': float(i) for i in range(25)}
@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+pytest.importorskip('selenium')
+
+from selenium.common.exceptions import WebDriverException  # noqa: E402
+
+from scraper import DriverPool  # noqa: E402
+
+pytestmark = pytest.mark.request_id("user-006")
+
+
+class FakeDriver:
+    def __init__(self, number):
+        self.number = number
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+
+class FakePool(DriverPool):
+    def create(self):
+        driver = FakeDriver(self.created)
+        self.fresh.add(id(driver))
+        return driver
+
+
+def test_warm_drivers_are_reused():
+    pool = FakePool(size=2)
+    with pool.driver() as first:
+        pass
+    with pool.driver() as again:
+        assert again is first
+    assert pool.created == 1
+
+
+def test_a_waiter_gets_a_replacement_when_a_driver_is_discarded():
+    pool = FakePool(size=1)
+    got = []
+    waiting = threading.Thread(target=lambda: got.append(pool.checkout()), daemon=True)
+
+    with pytest.raises(WebDriverException):
+        with pool.driver() as broken:
+            waiting.start()
+            waiting.join(0.05)  # Let the second caller block on the full pool
+            raise WebDriverException("browser crashed")
+
+    waiting.join(5)
+    assert not waiting.is_alive(), "waiter was never woken"
+    assert broken.quit_called
+    assert got and got[0] is not broken
+    assert pool.created == 1
+
+
+def test_a_returned_driver_wakes_a_waiter():
+    pool = FakePool(size=1)
+    got = []
+    with pool.driver() as driver:
+        waiting = threading.Thread(target=lambda: got.append(pool.checkout()), daemon=True)
+        waiting.start()
+        waiting.join(0.05)
+        assert not got
+    waiting.join(5)
+    assert got == [driver]
+
+
+def test_close_quits_idle_drivers():
+    pool = FakePool(size=2)
+    with pool.driver() as first, pool.driver() as second:
+        pass
+    pool.close()
+    assert first.quit_called and second.quit_called
+    assert pool.created == 0
@@ -0,0 +1,88 @@
+import pytest
+
+from sheets import FakeSheet, SheetSink
+
+
+class FlakySheet(FakeSheet):
+    # Fails the first `failures` appends with the given HTTP status
+    def __init__(self, failures, status):
+        super().__init__()
+        self.failures = failures
+        self.status = status
+
+    def append_rows(self, rows):
+        if self.failures:
+            self.failures -= 1
+            error = Exception(f"HTTP {self.status}")
+            error.response = type('Response', (), {"status_code": self.status})()
+            raise error
+        super().append_rows(rows)
+
+
+@pytest.mark.request_id("user-009")
+def test_sync_sink_flushes_in_batches_of_flush_rows():
+    sheet = FakeSheet()
+    sink = SheetSink(lambda: sheet, mode='sync', flush_rows=3, flush_seconds=60)
+    for i in range(7):
+        sink.add([[f"site{i}.com"]])
+    assert sheet.calls == 2
+    assert len(sheet.rows) == 6
+
+    assert sink.close() == {"rows_written": 7, "errors": []}
+    assert sheet.calls == 3
+    assert sheet.rows == [[f"site{i}.com"] for i in range(7)]
+
+
+@pytest.mark.request_id("user-009")
+def test_async_sink_writes_everything_by_close():
+    sheet = FakeSheet()
+    sink = SheetSink(lambda: sheet, mode='async', flush_rows=100, flush_seconds=60)
+    sink.add([[f"site{i}.com"] for i in range(250)])
+    sink.add([["last.com"]])
+
+    assert sink.close() == {"rows_written": 251, "errors": []}
+    assert sheet.rows[-1] == ["last.com"]
+    assert not sink.thread.is_alive()
+
+
+@pytest.mark.request_id("user-009")
+def test_off_sink_never_opens_the_sheet():
+    def factory():
+        raise AssertionError("sheet opened")
+
+    sink = SheetSink(factory, mode='off', flush_rows=1)
+    sink.add([["example.com"]])
+    assert sink.close() == {"rows_written": 0, "errors": []}
+
+
+@pytest.mark.request_id("user-009")
+def test_sink_retries_quota_errors():
+    sheet = FlakySheet(failures=2, status=429)
+    sink = SheetSink(lambda: sheet, mode='sync', flush_rows=1, backoff=0)
+    sink.add([["example.com"]])
+    assert sheet.rows == [["example.com"]]
+    assert sink.close() == {"rows_written": 1, "errors": []}
+
+
+@pytest.mark.request_id("user-009")
+def test_sink_reports_permanent_errors_and_keeps_going():
+    sheet = FlakySheet(failures=1, status=403)
+    sink = SheetSink(lambda: sheet, mode='sync', flush_rows=1, backoff=0)
+    sink.add([["lost.com"]])
+    sink.add([["kept.com"]])
+
+    result = sink.close()
+    assert sheet.rows == [["kept.com"]]
+    assert result["rows_written"] == 1
+    assert result["errors"] == ["HTTP 403"]
+
+
+@pytest.mark.request_id("user-008")
+def test_only_rows_that_reached_the_sheet_are_reported_written():
+    sheet = FlakySheet(failures=1, status=403)
+    written = []
+    sink = SheetSink(lambda: sheet, mode='sync', flush_rows=1, backoff=0, on_written=written.extend)
+    sink.add([["lost.com"]])
+    sink.add([["kept.com"]])
+    sink.close()
+    assert written == [["kept.com"]]
@@ -0,0 +1,80 @@
+import pytest
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, select
+
+from storage import BulkWriter, table_version, table_versions_table
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    metadata = MetaData()
+    table = Table(
+        'pages', metadata,
+        Column('id', Integer, primary_key=True, autoincrement=True),
+        Column('target', String(255), nullable=False, unique=True),
+        Column('domain_authority', Integer, nullable=True),
+    )
+    versions = table_versions_table(metadata)
+    metadata.create_all(engine)
+    return engine, table, versions
+
+
+def stored(engine, table):
+    with engine.connect() as conn:
+        return dict(conn.execute(select(table.c.target, table.c.domain_authority).order_by(table.c.id)).all())
+
+
+@pytest.mark.request_id("user-004")
+def test_upsert_updates_existing_rows_in_place(db):
+    engine, table, _ = db
+    with BulkWriter(engine, table, ['target']) as writer:
+        writer.extend([{"target": "a.com", "domain_authority": 10}, {"target": "b.com", "domain_authority": 20}])
+    with BulkWriter(engine, table, ['target']) as writer:
+        writer.extend([{"target": "a.com", "domain_authority": 55}, {"target": "c.com", "domain_authority": 30}])
+
+    assert stored(engine, table) == {"a.com": 55, "b.com": 20, "c.com": 30}
+    with engine.connect() as conn:
+        ids = conn.execute(select(table.c.id).order_by(table.c.id)).scalars().all()
+    assert ids == [1, 2, 3]
+
+
+@pytest.mark.request_id("user-004")
+def test_flushes_by_row_count_and_on_close(db):
+    engine, table, _ = db
+    flushed = []
+    writer = BulkWriter(engine, table, ['target'], flush_rows=2, flush_seconds=60,
+                        on_flush=lambda rows: flushed.append(len(rows)))
+    for i in range(5):
+        writer.add({"target": f"site{i}.com", "domain_authority": i})
+    assert flushed == [2, 2]
+    assert len(stored(engine, table)) == 4
+
+    writer.close()
+    assert flushed == [2, 2, 1]
+    assert writer.written == 5
+    assert len(stored(engine, table)) == 5
+
+
+@pytest.mark.request_id("user-004")
+def test_rows_are_kept_when_the_caller_fails(db):
+    engine, table, _ = db
+    with pytest.raises(RuntimeError):
+        with BulkWriter(engine, table, ['target'], flush_rows=100) as writer:
+            writer.add({"target": "a.com", "domain_authority": 1})
+            raise RuntimeError("boom")
+    assert stored(engine, table) == {"a.com": 1}
+
+
+@pytest.mark.request_id("user-011")
+def test_every_flush_bumps_the_table_version(db):
+    engine, table, versions = db
+    with engine.connect() as conn:
+        assert table_version(conn, versions, 'pages') == 0
+
+    for domain_authority in (10, 55):
+        # Same key and same second: only the version tells the two writes apart
+        with BulkWriter(engine, table, ['target'], versions=versions) as writer:
+            writer.add({"target": "a.com", "domain_authority": domain_authority})
+
+    with engine.connect() as conn:
+        assert table_version(conn, versions, 'pages') == 2
@@ -0,0 +1,50 @@
+import multiprocessing
+
+import pytest
+
+from telemetry import Registry
+
+pytestmark = pytest.mark.request_id("user-018")
+
+
+def registry_with_metrics(directory):
+    registry = Registry()
+    registry.directory = str(directory)
+    requests = registry.counter('requests_total', 'Requests', ['status'])
+    latency = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    registry.gauge('queued', 'Queued jobs', callback=lambda: {(): 3})
+    return registry, requests, latency
+
+
+def worker(directory):
+    registry, requests, latency = registry_with_metrics(directory)
+    requests.inc(5, status='200')
+    latency.observe(0.5)
+    registry.write_snapshot()
+
+
+def test_render_adds_up_the_totals_of_every_process(tmp_path):
+    process = multiprocessing.get_context('fork').Process(target=worker, args=(tmp_path,))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+
+    registry, requests, latency = registry_with_metrics(tmp_path)
+    requests.inc(2, status='200')
+    requests.inc(status='500')
+    latency.observe(0.05)
+    text = registry.render()
+    # The other process has exited; its totals still count
+    assert 'requests_total{status="200"} 7' in text
+    assert 'requests_total{status="500"} 1' in text
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_count 2' in text
+    # Gauges are the serving process's own value, not a sum
+    assert 'queued 3' in text
+
+
+def test_render_without_a_directory_reports_this_process():
+    registry = Registry()
+    registry.counter('requests_total', 'Requests').inc(4)
+    assert 'requests_total 4' in registry.render()
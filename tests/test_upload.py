@@ -0,0 +1,74 @@
+import io
+import time
+
+import pytest
+
+from bench.harness import configure_app
+from bench.servers import serve_mock_moz
+
+
+@pytest.fixture(scope='module')
+def app_env():
+    # One Moz request at a time, so the seeded mock fails the same batches on every run
+    server, url = serve_mock_moz(error_rate=0.5, seed=0)
+    configure_app(MOZ_API_URL=url, MOZ_CONCURRENCY=1, MOZ_RATE_LIMIT=1000, MOZ_BURST=100, MOZ_MAX_RETRIES=0,
+                  MOZ_DLQ_RETRIES=0, UPLOAD_CHECKPOINT_TARGETS=100)
+    import api
+    import wsgi  # noqa: F401 - creates the tables
+
+    yield api, server
+    server.shutdown()
+
+
+def wait_for_job(client, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f'/jobs/{job_id}').get_json()
+        if job['status'] in ('completed', 'failed'):
+            return job
+        assert time.monotonic() < deadline, f"job still {job['status']}"
+        time.sleep(0.05)
+
+
+@pytest.mark.request_id("user-014")
+def test_resumed_upload_reports_the_whole_upload(app_env):
+    api, server = app_env
+    client = api.app.test_client()
+    upload = "url\n" + "\n".join(f"site{i}.com" for i in range(500))
+    response = client.post('/fetch_url_metrics_csv',
+                           data={"file": (io.BytesIO(upload.encode()), 'targets.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 202
+    job_id = response.get_json()['job_id']
+
+    job = wait_for_job(client, job_id)
+    assert job['status'] == 'failed'
+    first = job['result']
+    assert 0 < first['rows'] < 500
+    assert first['rows'] + sum(batch['size'] for batch in job['batches']['failed_batches']) == 500
+
+    server.RequestHandlerClass.error_rate = 0.0
+    assert client.post(f'/jobs/{job_id}/resume').status_code == 202
+    job = wait_for_job(client, job_id)
+    assert job['status'] == 'completed'
+    result = job['result']
+    # Counters cover both runs, not only the resume
+    assert (result['targets'], result['rows'], result['batches']) == (500, 500, 10)
+    assert result['elapsed_seconds'] >= first['elapsed_seconds']
+
+    with api.app.app_context():
+        assert api.PageData.query.count() == 500
+
+
+@pytest.mark.request_id("user-002")
+def test_job_results_page_size_is_clamped(app_env):
+    api, _ = app_env
+    api.job_queue.register('three_rows', lambda job, payload: job.add_results(
+        [{"domain": f"site{i}.com"} for i in range(3)]) or {})
+    client = api.app.test_client()
+    job_id = api.job_queue.submit('three_rows', {})
+    wait_for_job(client, job_id)
+
+    assert client.get(f'/jobs/{job_id}?limit=-1').get_json()['results'] == []
+    page = client.get(f'/jobs/{job_id}?limit=2&offset=-5').get_json()
+    assert [row['domain'] for row in page['results']] == ['site0.com', 'site1.com']
@@ -0,0 +1,13 @@
+# Production entry point: gunicorn -c gunicorn.conf.py wsgi:application
+import fcntl
+
+from api import app, db
+
+# Every gunicorn worker imports this at the same time; the lock lets one create the
+# tables while the others wait, instead of all racing on a fresh database
+with open(f"{app.config['JOB_DB_PATH']}.lock", 'w') as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    with app.app_context():
+        db.create_all()  # Create the database tables
+
+application = app